@@ -1,8 +1,31 @@
 import streamlit as st
+import hashlib
 import os
-from openai import OpenAI
-import pandas as pd
 from datetime import datetime
+from cassettes import CassetteClient
+from documents import DOCUMENT_KINDS, DocumentIndex, guess_kind
+from engine import (
+    COMBINE_FINANCIALS,
+    DEFAULT_MAX_WORKERS,
+    PEER_SECTIONS,
+    SECTIONS,
+    generate_full_report,
+    inflight_queries,
+    init_perplexity_client,
+    is_failure,
+    is_pending,
+    peer_comparison_table,
+    refresh_section,
+    run_peer_comparison,
+    section_diff,
+)
+from jobs import ACTIVE_STATUSES, JobManager
+from metrics import metrics, start_metrics_server
+from prewarm import AccessLog, PrewarmScheduler
+from ratio_store import RatioStore
+from response_cache import ResponseCache
+from result_store import ResultStore
+from symbols import load_symbol_master, resolve_ticker
 
 # Page configuration
 st.set_page_config(
@@ -36,318 +59,224 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# FIXED: Initialize Perplexity client for Render.com
-def init_perplexity_client():
-    """Initialize Perplexity client - Render.com compatible"""
-    # Get API key from environment variable (Render.com method)
-    api_key = os.getenv("PPLX_API_KEY")
-    
-    if api_key:
-        return OpenAI(api_key=api_key, base_url="https://api.perplexity.ai")
-    else:
-        return None
+@st.cache_resource
+def get_perplexity_client():
+    """Create the Perplexity client and its connection pool once per process"""
+    return init_perplexity_client()
 
 # Initialize client
-client = init_perplexity_client()
+client = get_perplexity_client()
 
-def query_perplexity(prompt, model="sonar-pro"):
-    """Query Perplexity API with error handling"""
-    if not client:
-        st.error("❌ Perplexity API key not found. Please check your environment variable PPLX_API_KEY on Render.com")
-        return "⚠️ API key not configured"
-    
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a professional equity research analyst. Provide detailed, fact-based analysis with specific data points, sources, and clear reasoning. Always include current dates and verify information accuracy."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=4000
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error querying Perplexity: {str(e)}"
+@st.cache_resource
+def get_response_cache():
+    """Open the on-disk response cache once per process"""
+    return ResponseCache()
+
+response_cache = get_response_cache()
+
+@st.cache_resource
+def get_metrics_server(port):
+    """Start the Prometheus /metrics endpoint once per process"""
+    return start_metrics_server(port)
+
+if os.getenv("PPLX_METRICS_PORT"):
+    get_metrics_server(int(os.getenv("PPLX_METRICS_PORT")))
+
+@st.cache_resource
+def get_ratio_store():
+    """Open the Parquet store of extracted ratios once per process"""
+    return RatioStore()
+
+ratio_store = get_ratio_store()
+
+@st.cache_resource
+def get_document_index():
+    """Open the index of uploaded filings once per process"""
+    return DocumentIndex()
+
+document_index = get_document_index()
+
+@st.cache_resource
+def get_result_store():
+    """Create the process-wide compressed result store once, shared by every session"""
+    return ResultStore()
+
+result_store = get_result_store()
+
+@st.cache_resource
+def get_job_manager():
+    """Start the background job runner once per process, resuming interrupted jobs"""
+    return JobManager(client, cache=response_cache, ratio_store=ratio_store, documents=document_index,
+                      result_store=result_store)
+
+job_manager = get_job_manager()
+
+@st.cache_resource
+def get_access_log():
+    """Open the log of requested tickers and sections once per process"""
+    return AccessLog()
+
+access_log = get_access_log()
+
+@st.cache_resource
+def get_prewarm_scheduler():
+    """Start the off-hours cache pre-warmer once per process (idle unless PPLX_PREWARM_BUDGET is set)"""
+    return PrewarmScheduler(client, response_cache, access_log, documents=document_index).start()
+
+prewarm_scheduler = get_prewarm_scheduler()
+
+# Seconds between progress polls while a background job is running
+JOB_POLL_SECONDS = 1.0
 
-def generate_section_prompt(section_key, ticker, date):
-    """Generate specific prompts for each analysis section"""
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_progress(job_id):
+    """Poll a running job and show finished, streaming and pending sections"""
+    job = job_manager.get(job_id)
+    if job["status"] not in ACTIVE_STATUSES:
+        st.rerun()
     
-    base_context = f"Analyze {ticker} stock as of {date}. Provide current, factual data with sources."
+    st.progress(job["sections_done"] / job["sections_total"])
+    st.text(f"Analyzing {job['ticker']}: {job['status']} ({job['sections_done']}/{job['sections_total']} sections)")
     
-    prompts = {
-        "sectoral_analysis": f"""
-        {base_context}
-        
-        Provide a comprehensive sectoral analysis covering:
-        1. Current sector trends and growth drivers
-        2. Industry structure and competitive dynamics
-        3. Recent regulatory changes and policy impacts
-        4. Technological disruptions affecting the sector
-        5. Upcoming government actions or regulatory changes
-        6. Macroeconomic factors influencing the industry
-        
-        Focus on both positive and negative triggers with specific examples and timeframes.
-        """,
-        
-        "news_competition": f"""
-        {base_context}
-        
-        Analyze recent news and competitive landscape:
-        1. Key news from the past 30 days affecting {ticker}
-        2. Major competitor developments and announcements
-        3. Market share changes and competitive positioning
-        4. Industry-wide developments impacting all players
-        5. Regulatory news affecting the company/sector
-        
-        Categorize news as positive, negative, or neutral with reasoning.
-        """,
-        
-        "financial_pl": f"""
-        {base_context}
-        
-        Conduct deep P&L analysis for the last 5 years:
-        1. Revenue trends, growth rates, and seasonality
-        2. Gross margin evolution and cost structure changes
-        3. Operating leverage and efficiency metrics
-        4. One-time items and extraordinary expenses
-        5. Earnings quality and sustainability assessment
-        6. Forward-looking revenue and margin implications
-        
-        Provide specific numbers, percentages, and year-over-year comparisons.
-        """,
-        
-        "financial_bs": f"""
-        {base_context}
-        
-        Analyze balance sheet strength over 5 years:
-        1. Asset quality and composition changes
-        2. Debt levels, leverage ratios, and debt maturity profile
-        3. Working capital trends and efficiency
-        4. Capital allocation patterns
-        5. Return on assets and equity trends
-        6. Balance sheet risks and strengths vs sector norms
-        
-        Include specific financial ratios and benchmark comparisons.
-        """,
-        
-        "financial_cf": f"""
-        {base_context}
-        
-        Examine cash flow patterns for 5 years:
-        1. Operating cash flow trends and quality
-        2. Free cash flow generation and consistency
-        3. Capital expenditure patterns and efficiency
-        4. Financing activities and dividend policy
-        5. Cash conversion cycle analysis
-        6. Any unusual cash flow patterns or anomalies
-        
-        Focus on cash flow sustainability and capital allocation effectiveness.
-        """,
-        
-        "ratio_analysis": f"""
-        {base_context}
-        
-        Provide comprehensive ratio analysis in tabular format:
-        Create a table with columns: Ratio | Current | 5-Year Trend | Industry Average | Analysis
-        
-        Cover these key ratios:
-        - Profitability ratios (ROE, ROA, ROCE, Gross/Operating/Net margins)
-        - Liquidity ratios (Current, Quick, Cash ratios)
-        - Leverage ratios (Debt-to-equity, Interest coverage, Debt service)
-        - Efficiency ratios (Asset turnover, Inventory turnover, Receivables turnover)
-        - Valuation ratios (P/E, P/B, EV/EBITDA, Price-to-Sales)
-        
-        Explain trends, drivers, and management influence for each.
-        """,
-        
-        "management_eval": f"""
-        {base_context}
-        
-        Evaluate management quality and track record:
-        1. CEO and key executives' background and tenure
-        2. Strategic execution capability and past performance
-        3. Crisis management and adaptability
-        4. Capital allocation decisions and effectiveness
-        5. Board composition and independence
-        6. Management compensation alignment with performance
-        7. Transparency in communications and reporting
-        8. Any governance concerns or red flags
-        
-        Provide specific examples and track record evidence.
-        """,
-        
-        "management_guidance": f"""
-        {base_context}
-        
-        Analyze management guidance history and credibility:
-        1. Historical guidance vs actual performance over past 3 years
-        2. Quality and specificity of current forward guidance
-        3. Management's conservatism vs aggressiveness in projections
-        4. Sector comparison of guidance accuracy
-        5. Recent changes in guidance and explanations provided
-        6. Credibility assessment based on delivery track record
-        
-        Include specific guidance figures and actual outcomes.
-        """,
-        
-        "investor_presentations": f"""
-        {base_context}
-        
-        Review investor presentations from the last 12 quarters:
-        1. Key strategic initiatives and business updates
-        2. Product launches and market expansion plans
-        3. Segmental performance and revenue mix evolution
-        4. EBITDA trends and margin guidance
-        5. Capital expenditure plans and utilization
-        6. Management's strategic pivots and rationale
-        7. Performance against previously stated targets
-        
-        Extract key themes and assess execution against promises.
-        """,
-        
-        "conference_calls": f"""
-        {base_context}
-        
-        Summarize recent conference calls (last 12 quarters):
-        1. Management tone and confidence levels
-        2. Growth outlook and new product pipeline
-        3. Margin trends and cost management initiatives
-        4. Capacity utilization and expansion plans
-        5. M&A commentary and corporate actions
-        6. Competitive positioning and market share discussions
-        7. Guidance changes and reasoning
-        
-        Compare statements with actual delivery and flag inconsistencies.
-        """,
-        
-        "community_analysis": f"""
-        {base_context}
-        
-        Analyze investor community discussions (last 90 days):
-        1. ValuePickr forum discussions and key insights
-        2. Reddit and other investment community sentiment
-        3. Common concerns and bullish/bearish arguments
-        4. Unique insights not found in mainstream analysis
-        5. Consensus opinion and contrarian viewpoints
-        6. Risk factors highlighted by retail investors
-        
-        Summarize key themes and assess credibility of community insights.
-        """,
-        
-        "annual_report": f"""
-        {base_context}
-        
-        Conduct forensic analysis of the latest annual report:
-        1. Accounting policy changes and their impact
-        2. Related party transactions and potential conflicts
-        3. Contingent liabilities and off-balance-sheet items
-        4. Audit qualifications or concerns raised
-        5. Management discussion and forward-looking statements
-        6. Hidden gems or strategic insights in disclosures
-        7. Any red flags or unusual accounting treatments
-        
-        Focus on items that might not be evident in standard financial analysis.
-        """,
-        
-        "integrity_matrix": f"""
-        {base_context}
-        
-        Create Management Integrity Matrix with scores (1-10) and evidence:
-        
-        1. Guidance Accuracy (Score/10): Historical accuracy of forecasts
-        2. Delivery vs Promise (Score/10): Execution of stated plans
-        3. Transparency & Disclosure (Score/10): Quality of communication
-        4. Governance Flags (Score/10): Any red flags or concerns
-        5. Overall Integrity (Score/10): Combined assessment
-        
-        For each KPI, provide:
-        - Specific score out of 10
-        - 2-3 concrete examples as evidence
-        - Reasoning for the score assigned
-        - Recent developments affecting the score
-        """,
-        
-        "growth_triggers": f"""
-        {base_context}
-        
-        Identify key growth catalysts and triggers:
-        1. Operating leverage potential and scalability
-        2. Capacity utilization trends and expansion benefits
-        3. Recent acquisitions and their revenue contribution
-        4. New product launches and market penetration
-        5. Market expansion opportunities (geographic/segment)
-        6. Technology upgrades and digital transformation impact
-        7. Regulatory changes benefiting the company
-        
-        Quantify potential impact and provide realistic timelines.
-        """,
-        
-        "valuation_analysis": f"""
-        {base_context}
-        
-        Comprehensive valuation analysis:
-        1. Current valuation ratios: P/E, P/S, PEG, P/B, EV/EBITDA
-        2. Peer comparison with 3-4 closest competitors
-        3. Historical valuation trends (5-year range)
-        4. Sector average comparisons
-        5. DCF-based intrinsic value estimate
-        6. Sum-of-parts valuation if applicable
-        7. Assessment: Overvalued, fairly valued, or undervalued
-        
-        Provide specific numbers, peer names, and reasoning for valuation conclusion.
-        """,
-        
-        "scenario_analysis": f"""
-        {base_context}
-        
-        Create three detailed scenarios:
-        
-        BULL CASE:
-        - Key catalysts and positive triggers
-        - Revenue/margin upside potential
-        - Target price and timeline
-        - Probability assessment
-        - Investment strategy recommendations
-        
-        BASE CASE:
-        - Realistic growth assumptions
-        - Steady-state margins and returns
-        - Fair value estimate
-        - Most likely outcome
-        - Prudent positioning strategy
-        
-        BEAR CASE:
-        - Key risks and negative catalysts
-        - Downside scenarios and impact
-        - Worst-case target price
-        - Risk mitigation strategies
-        - Exit triggers
-        
-        Include specific price targets and probability weightings.
-        """,
-        
-        "final_recommendation": f"""
-        {base_context}
-        
-        Provide final investment recommendation:
-        1. Overall investment thesis (Buy/Hold/Sell)
-        2. Key supporting arguments (3-4 main points)
-        3. Target price and time horizon
-        4. Risk-reward assessment
-        5. Position sizing recommendations
-        6. Key monitoring triggers and metrics
-        7. Conditions that would change the recommendation
-        
-        Structure as executive summary suitable for investment committee presentation.
-        Ensure recommendation is clearly justified based on all previous analysis.
-        """
-    }
+    results = job_manager.results(job_id)
+    live_text = job_manager.live_text(job_id)
+    
+    st.markdown("### 📡 Live Analysis")
+    for title, key in SECTIONS:
+        if key in results:
+            icon = '⏳' if is_pending(results[key]) else '⚠️' if is_failure(results[key]) else '✅'
+            with st.expander(f"{icon} {title}"):
+                st.markdown(str(results[key]))
+        elif key in live_text:
+            with st.expander(f"✍️ {title}", expanded=True):
+                st.markdown(live_text[key] + " ▌")
+        else:
+            st.caption(f"⏳ {title}")
+
+@st.fragment(run_every=JOB_POLL_SECONDS * 5)
+def watch_pending_sections(job_id):
+    """After the deadline, keep checking for late sections and rerun once they have all landed"""
+    job = job_manager.get(job_id)
+    if not job["sections_pending"]:
+        st.rerun()
+    st.info(f"⏳ {job['sections_pending']} section(s) missed the analysis deadline and are still generating")
+
+def request_section_refresh(ticker, key):
+    """Button callback: queue one section to be regenerated on this rerun"""
+    st.session_state["section_refresh"] = (ticker, key)
+
+# Results layout: tab label -> rows -> columns -> (heading, section key)
+RESULT_TABS = {
+    "📈 Core Analysis": [
+        [
+            [("🌐 Sectoral Trends & Triggers", "sectoral_analysis"),
+             ("💰 Profit & Loss Analysis (5-Year)", "financial_pl"),
+             ("💸 Cash Flow Analysis (5-Year)", "financial_cf")],
+            [("📰 News & Competition", "news_competition"),
+             ("🏦 Balance Sheet Analysis (5-Year)", "financial_bs"),
+             ("📊 Comprehensive Ratio Analysis", "ratio_analysis")],
+        ],
+    ],
+    "💼 Management & Governance": [
+        [
+            [("👥 Management Evaluation", "management_eval"),
+             ("📋 Investor Presentations Analysis", "investor_presentations"),
+             ("💬 Community & Forum Analysis", "community_analysis")],
+            [("📈 Management Guidance & Delivery", "management_guidance"),
+             ("🎙️ Conference Calls Analysis", "conference_calls"),
+             ("📑 Annual Report Forensics", "annual_report")],
+        ],
+        [[("🎯 Management Integrity Matrix", "integrity_matrix")]],
+    ],
+    "📊 Valuation & Scenarios": [
+        [
+            [("🚀 Growth Triggers", "growth_triggers")],
+            [("💎 Valuation Analysis", "valuation_analysis")],
+        ],
+        [[("🎭 Scenario Analysis: Bull, Base & Bear Cases", "scenario_analysis")]],
+    ],
+    "🎯 Final Recommendation": [
+        [[("⭐ Final Investment Recommendation", "final_recommendation")]],
+    ],
+}
+
+def content_hash(content):
+    """Stable fingerprint of a section's text for render caches"""
+    return hashlib.sha1(str(content).encode("utf-8")).hexdigest()
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def render_section_html(ticker, section_key, digest, _content):
+    """Convert a section's markdown to HTML once per (ticker, section, content hash)"""
+    import markdown
+    return markdown.markdown(_content, extensions=["tables", "sane_lists"])
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_report(ticker, date, digest, _results):
+    """Build the markdown export once per result set"""
+    return generate_full_report(ticker, _results, date)
+
+def render_section_body(ticker, results, key, heading, css_class="analysis-section"):
+    """Render one section's content, or a warning if its query failed"""
+    content = results.get(key, 'Analysis not available')
+    if is_pending(content):
+        st.markdown(f"## {heading}")
+        st.info(str(content))
+    elif is_failure(content):
+        st.markdown(f"## {heading}")
+        st.warning(str(content))
+    else:
+        html = render_section_html(ticker, key, content_hash(content), content)
+        st.html(f'<div class="{css_class}"><h2>{heading}</h2>{html}</div>')
+    
+    st.button(
+        "🔄 Refresh this section",
+        key=f"refresh_{ticker}_{key}",
+        on_click=request_section_refresh,
+        args=(ticker, key)
+    )
+
+def recommendation_class(results):
+    """CSS class for the final recommendation: buy, hold or sell"""
+    recommendation_text = str(results.get('final_recommendation', 'Recommendation not available')).lower()
+    if "buy" in recommendation_text and "don't buy" not in recommendation_text:
+        return "recommendation-buy"
+    if "sell" in recommendation_text:
+        return "recommendation-sell"
+    return "recommendation-hold"
+
+CHANGES_TAB = "🔄 What Changed"
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_section_diff(previous_digest, current_digest, _previous, _current, previous_date, date):
+    """Line diff between two versions of a section, once per pair of contents"""
+    return section_diff(_previous, _current, previous_date, date)
+
+def display_changes(ticker, results, date, previous):
+    """Show a per-section diff against the previous completed run"""
+    previous_results, previous_date = previous
+    titles = {key: title for title, key in SECTIONS}
+    changed = []
+    for key, content in results.items():
+        if key not in previous_results or is_failure(content) or is_failure(previous_results[key]):
+            continue
+        if content_hash(content) != content_hash(previous_results[key]):
+            changed.append(key)
     
-    return prompts.get(section_key, f"{base_context}\n\nProvide detailed analysis for {section_key}")
+    st.markdown(f"**{len(changed)} of {len(results)} sections changed since {previous_date}**")
+    for key in changed:
+        diff = render_section_diff(
+            content_hash(previous_results[key]), content_hash(results[key]),
+            str(previous_results[key]), str(results[key]), previous_date, date
+        )
+        with st.expander(titles.get(key, key)):
+            st.code(diff, language="diff")
+
+def display_analysis_results(ticker, results, date, previous=None):
+    """Display comprehensive analysis results, rendering only the selected tab.
 
-def display_analysis_results(ticker, results, date):
-    """Display comprehensive analysis results"""
+    `previous` is an optional (results, date) pair from an earlier run,
+    which adds a tab diffing each section against it.
+    """
     
     st.markdown(f"""
     # 📊 Comprehensive Investment Analysis: {ticker}
@@ -356,153 +285,32 @@ def display_analysis_results(ticker, results, date):
     ---
     """)
     
-    tab1, tab2, tab3, tab4 = st.tabs(["📈 Core Analysis", "💼 Management & Governance", "📊 Valuation & Scenarios", "🎯 Final Recommendation"])
-    
-    with tab1:
-        col1, col2 = st.columns([1, 1])
-        
-        with col1:
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 🌐 Sectoral Trends & Triggers")
-            st.markdown(results.get('sectoral_analysis', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 💰 Profit & Loss Analysis (5-Year)")
-            st.markdown(results.get('financial_pl', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 💸 Cash Flow Analysis (5-Year)")
-            st.markdown(results.get('financial_cf', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 📰 News & Competition")
-            st.markdown(results.get('news_competition', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 🏦 Balance Sheet Analysis (5-Year)")
-            st.markdown(results.get('financial_bs', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 📊 Comprehensive Ratio Analysis")
-            st.markdown(results.get('ratio_analysis', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-    
-    with tab2:
-        col1, col2 = st.columns([1, 1])
-        
-        with col1:
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 👥 Management Evaluation")
-            st.markdown(results.get('management_eval', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 📋 Investor Presentations Analysis")
-            st.markdown(results.get('investor_presentations', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 💬 Community & Forum Analysis")
-            st.markdown(results.get('community_analysis', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 📈 Management Guidance & Delivery")
-            st.markdown(results.get('management_guidance', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 🎙️ Conference Calls Analysis")
-            st.markdown(results.get('conference_calls', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 📑 Annual Report Forensics")
-            st.markdown(results.get('annual_report', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
+    # st.tabs sends every tab's content on each rerun; a radio only builds the open one
+    tab_labels = list(RESULT_TABS) + ([CHANGES_TAB] if previous else [])
+    tab = st.radio("View", tab_labels, horizontal=True, key=f"results_tab_{ticker}", label_visibility="collapsed")
+    if tab == CHANGES_TAB:
+        display_changes(ticker, results, date, previous)
+        return
     
-        st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-        st.markdown("## 🎯 Management Integrity Matrix")
-        st.markdown(results.get('integrity_matrix', 'Analysis not available'))
-        st.markdown('</div>', unsafe_allow_html=True)
+    final_tab = tab == "🎯 Final Recommendation"
+    css_class = f"analysis-section {recommendation_class(results)}" if final_tab else "analysis-section"
     
-    with tab3:
-        col1, col2 = st.columns([1, 1])
-        
-        with col1:
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 🚀 Growth Triggers")
-            st.markdown(results.get('growth_triggers', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-            st.markdown("## 💎 Valuation Analysis")
-            st.markdown(results.get('valuation_analysis', 'Analysis not available'))
-            st.markdown('</div>', unsafe_allow_html=True)
-        
-        st.markdown('<div class="analysis-section">', unsafe_allow_html=True)
-        st.markdown("## 🎭 Scenario Analysis: Bull, Base & Bear Cases")
-        st.markdown(results.get('scenario_analysis', 'Analysis not available'))
-        st.markdown('</div>', unsafe_allow_html=True)
+    for row in RESULT_TABS[tab]:
+        columns = st.columns(len(row)) if len(row) > 1 else [st.container()]
+        for column, sections in zip(columns, row):
+            with column:
+                for heading, key in sections:
+                    render_section_body(ticker, results, key, heading, css_class)
     
-    with tab4:
-        recommendation_text = results.get('final_recommendation', 'Recommendation not available')
-        
-        rec_class = "recommendation-hold"
-        if "buy" in recommendation_text.lower() and "don't buy" not in recommendation_text.lower():
-            rec_class = "recommendation-buy"
-        elif "sell" in recommendation_text.lower():
-            rec_class = "recommendation-sell"
-        
-        st.markdown(f'<div class="analysis-section {rec_class}">', unsafe_allow_html=True)
-        st.markdown("## ⭐ Final Investment Recommendation")
-        st.markdown(recommendation_text)
-        st.markdown('</div>', unsafe_allow_html=True)
-        
-        full_report = generate_full_report(ticker, results, date)
+    if final_tab:
+        digest = content_hash("".join(content_hash(content) for content in results.values()))
         st.download_button(
             label="📄 Download Complete Analysis Report",
-            data=full_report,
+            data=build_report(ticker, date, digest, results),
             file_name=f"{ticker}_Investment_Analysis_{datetime.now().strftime('%Y%m%d')}.md",
             mime="text/markdown"
         )
 
-def generate_full_report(ticker, results, date):
-    """Generate downloadable markdown report"""
-    sections = [
-        ("Executive Summary", results.get('final_recommendation', 'Not available')),
-        ("Sectoral Trends & Triggers", results.get('sectoral_analysis', 'Not available')),
-        ("News & Competition Analysis", results.get('news_competition', 'Not available')),
-        ("P&L Analysis (5-Year)", results.get('financial_pl', 'Not available')),
-        ("Balance Sheet Analysis (5-Year)", results.get('financial_bs', 'Not available')),
-        ("Cash Flow Analysis (5-Year)", results.get('financial_cf', 'Not available')),
-        ("Ratio Analysis", results.get('ratio_analysis', 'Not available')),
-        ("Management Evaluation", results.get('management_eval', 'Not available')),
-        ("Management Guidance & Delivery", results.get('management_guidance', 'Not available')),
-        ("Investor Presentations", results.get('investor_presentations', 'Not available')),
-        ("Conference Calls Analysis", results.get('conference_calls', 'Not available')),
-        ("Community Analysis", results.get('community_analysis', 'Not available')),
-        ("Annual Report Forensics", results.get('annual_report', 'Not available')),
-        ("Management Integrity Matrix", results.get('integrity_matrix', 'Not available')),
-        ("Growth Triggers", results.get('growth_triggers', 'Not available')),
-        ("Valuation Analysis", results.get('valuation_analysis', 'Not available')),
-        ("Scenario Analysis", results.get('scenario_analysis', 'Not available')),
-    ]
-    
-    report = f"# Investment Analysis Report: {ticker}\nGenerated on: {date}\n\n"
-    for title, content in sections:
-        report += f"## {title}\n{content}\n\n---\n\n"
-    
-    return report
-
 # Header
 st.markdown("""
 <div class="main-header">
@@ -519,12 +327,88 @@ ticker_input = st.sidebar.text_input(
     help="Enter NSE/BSE ticker for Indian stocks or standard ticker for international stocks"
 )
 
+# Resolve names and exchange-suffixed tickers to one canonical symbol
+symbol_master = load_symbol_master()
+symbol_match = None
+if ticker_input.strip():
+    symbol_match = symbol_master.resolve(ticker_input)
+    if symbol_match:
+        sector_note = f" · {symbol_match.sector}" if symbol_match.sector else ""
+        st.sidebar.caption(f"✔️ {symbol_match.symbol} · {symbol_match.name} ({symbol_match.exchange}){sector_note}")
+    else:
+        suggestions = symbol_master.suggest(ticker_input, limit=5)
+        if suggestions:
+            st.sidebar.caption("Did you mean: " + ", ".join(f"{s.symbol} ({s.name})" for s in suggestions))
+
 analysis_date = datetime.now().strftime("%B %d, %Y")
 st.sidebar.info(f"Analysis Date: {analysis_date}")
 
+max_workers = st.sidebar.slider(
+    "Parallel requests:",
+    min_value=1,
+    max_value=len(SECTIONS),
+    value=min(DEFAULT_MAX_WORKERS, len(SECTIONS)),
+    help="Number of sections sent to Perplexity at the same time"
+)
+
+stream_output = st.sidebar.checkbox(
+    "Stream sections as they generate",
+    value=True,
+    help="Show each section's text live while Perplexity is still writing it"
+)
+
+fast_mode = st.sidebar.checkbox(
+    "⚡ Fast dossier",
+    value=False,
+    help="Send short, news-style sections to a lighter, faster model"
+)
+
+combine_financials = st.sidebar.checkbox(
+    "Combine financial statement sections",
+    value=COMBINE_FINANCIALS,
+    help="Fetch P&L, balance sheet, cash flow and ratios in one structured request"
+)
+
+delta_mode = st.sidebar.checkbox(
+    "🔄 Delta refresh",
+    value=False,
+    help="If this ticker was analysed before, only ask for material changes since that run and merge them in"
+)
+
+use_cache = st.sidebar.checkbox(
+    "Use cached results",
+    value=True,
+    help="Reuse recent responses for this ticker; each section has its own freshness window"
+)
+
+# Each session tracks its dossiers as ticker -> background job id
+session_jobs = st.session_state.setdefault("jobs", {})
+
+def open_job(ticker, job_id):
+    """Button callback: attach an existing job to this session and select it"""
+    session_jobs[ticker] = job_id
+    st.session_state["next_active_ticker"] = ticker
+
+# A newly generated analysis becomes the selection on the following rerun
+if "next_active_ticker" in st.session_state:
+    st.session_state["active_ticker"] = st.session_state.pop("next_active_ticker")
+
+if session_jobs:
+    st.sidebar.selectbox(
+        "Analyses:",
+        list(session_jobs),
+        key="active_ticker",
+        help="Switch between dossiers opened in this session"
+    )
+
 # Check API status
 if st.sidebar.button("🔧 Check API Status"):
-    if client:
+    if isinstance(client, CassetteClient):
+        cassette_stats = client.stats()
+        st.sidebar.info(f"📼 Cassette {cassette_stats['mode']} mode: {cassette_stats['cassettes']} cassettes, "
+                        f"{cassette_stats['recorded']} recorded, {cassette_stats['replayed']} replayed, "
+                        f"{cassette_stats['missed']} missed")
+    elif client:
         st.sidebar.success("✅ Perplexity API Connected")
     else:
         st.sidebar.error("❌ API Key Missing")
@@ -536,44 +420,277 @@ if st.sidebar.button("🚀 Generate Complete Analysis", type="primary"):
     elif not client:
         st.error("❌ Perplexity API key not configured. Please check your Render.com environment variables.")
     else:
-        ticker = ticker_input.upper().strip()
-        
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        sections = [
-            ("🌐 Sectoral Trends & Triggers", "sectoral_analysis"),
-            ("📰 News & Competition", "news_competition"),
-            ("💰 Financial Analysis - P&L", "financial_pl"),
-            ("🏦 Financial Analysis - Balance Sheet", "financial_bs"),
-            ("💸 Financial Analysis - Cash Flow", "financial_cf"),
-            ("📊 Ratio Analysis", "ratio_analysis"),
-            ("👥 Management Evaluation", "management_eval"),
-            ("📈 Management Guidance & Delivery", "management_guidance"),
-            ("📋 Investor Presentations Analysis", "investor_presentations"),
-            ("🎙️ Conference Calls Analysis", "conference_calls"),
-            ("💬 Community & Forum Analysis", "community_analysis"),
-            ("📑 Annual Report Forensics", "annual_report"),
-            ("🎯 Management Integrity Matrix", "integrity_matrix"),
-            ("🚀 Growth Triggers", "growth_triggers"),
-            ("💎 Valuation Analysis", "valuation_analysis"),
-            ("🎭 Scenario Analysis", "scenario_analysis"),
-            ("⭐ Final Recommendation", "final_recommendation")
-        ]
-        
-        results = {}
+        ticker = resolve_ticker(ticker_input, symbol_master)
+        access_log.record(ticker, [key for _, key in SECTIONS])
+        
+        job_id = job_manager.submit(ticker, analysis_date, {
+            "max_workers": max_workers,
+            "stream": stream_output,
+            "fast": fast_mode,
+            "combine_financials": combine_financials,
+            "use_cache": use_cache,
+            "delta": delta_mode,
+        })
+        session_jobs[ticker] = job_id
+        st.session_state["next_active_ticker"] = ticker
+
+# Regenerate a single section requested from the results view
+section_refresh = st.session_state.pop("section_refresh", None)
+if section_refresh and section_refresh[0] in session_jobs:
+    refresh_ticker, refresh_key = section_refresh
+    refresh_job = job_manager.get(session_jobs[refresh_ticker])
+    section_title = {key: title for title, key in SECTIONS}[refresh_key]
+    if not client:
+        st.error("❌ Perplexity API key not configured. Please check your Render.com environment variables.")
+    elif refresh_job and refresh_job["status"] not in ACTIVE_STATUSES:
+        access_log.record(refresh_ticker, [refresh_key])
+        with st.spinner(f"Refreshing {section_title}..."):
+            content = refresh_section(
+                client, refresh_key, refresh_ticker, refresh_job["date"],
+                job_manager.results(refresh_job["job_id"]),
+                fast=refresh_job["options"].get("fast", False),
+                cache=response_cache,
+                documents=document_index
+            )
+            job_manager.save_section(refresh_job["job_id"], refresh_key, content)
+
+# Uploaded filings ground the annual report, conference call and presentation sections
+with st.sidebar.expander("📎 Filings"):
+    if not ticker_input:
+        st.caption("Enter a ticker to upload its annual reports, transcripts or presentations.")
+    else:
+        filings_ticker = resolve_ticker(ticker_input, symbol_master)
+        uploads = st.file_uploader(
+            f"PDF or PPTX for {filings_ticker}:",
+            type=["pdf", "pptx"],
+            accept_multiple_files=True,
+            key=f"filings_{filings_ticker}"
+        )
+        kind_choice = st.selectbox(
+            "Document type:",
+            ["auto"] + list(DOCUMENT_KINDS),
+            format_func=lambda kind: "Detect from file name" if kind == "auto" else DOCUMENT_KINDS[kind]
+        )
+        if uploads and st.button("Index documents"):
+            for upload in uploads:
+                kind = guess_kind(upload.name) if kind_choice == "auto" else kind_choice
+                try:
+                    with st.spinner(f"Indexing {upload.name}..."):
+                        _, reused = document_index.add(filings_ticker, upload, upload.name, kind)
+                except Exception as e:
+                    st.error(f"❌ {upload.name}: {e}")
+                else:
+                    st.success(f"{'♻️ Reused index for' if reused else '✅ Indexed'} {upload.name}")
+        
+        for document in document_index.documents(filings_ticker):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.caption(f"{document['name']} · {DOCUMENT_KINDS.get(document['kind'], document['kind'])} · "
+                           f"{document['pages']} pages")
+            with col2:
+                if st.button("✖️", key=f"remove_document_{document['doc_hash']}", help="Remove from this ticker"):
+                    document_index.remove(filings_ticker, document["doc_hash"])
+                    st.rerun()
+
+# Peer comparison: the same sections for several tickers, side by side
+with st.sidebar.expander("👥 Peer Comparison"):
+    default_peers = ""
+    if symbol_match:
+        default_peers = ", ".join([symbol_match.symbol] + [p.symbol for p in symbol_master.peers(symbol_match.symbol)[:4]])
+    peer_input = st.text_input("Tickers (comma separated):", value=default_peers, key="peer_tickers")
+    section_titles = {key: title for title, key in SECTIONS}
+    peer_sections = st.multiselect(
+        "Sections:",
+        list(section_titles),
+        default=PEER_SECTIONS,
+        format_func=section_titles.get,
+        help="Sector-wide sections are generated once per sector and shared by its peers"
+    )
+    compare_peers = st.button("Compare peers")
+
+if compare_peers:
+    peer_tickers = list(dict.fromkeys(resolve_ticker(t, symbol_master) for t in peer_input.split(",") if t.strip()))
+    if not client:
+        st.error("❌ Perplexity API key not configured. Please check your Render.com environment variables.")
+    elif len(peer_tickers) < 2 or not peer_sections:
+        st.error("Enter at least two tickers and one section to compare.")
+    else:
+        for peer_ticker in peer_tickers:
+            access_log.record(peer_ticker, peer_sections)
+        with st.spinner(f"Comparing {', '.join(peer_tickers)}..."):
+            comparison = run_peer_comparison(
+                client, peer_tickers, analysis_date, peer_sections,
+                section_workers=max_workers,
+                cache=response_cache,
+                use_cache=use_cache,
+                fast=fast_mode
+            )
+        # Sessions keep references; identical comparisons share one stored copy
+        peer_run = "peer-" + content_hash(f"{analysis_date}|{peer_tickers}|{peer_sections}")[:12]
+        for peer_ticker, peer_results in comparison.items():
+            result_store.put(peer_ticker, peer_run, peer_results)
+        st.session_state["peer_comparison"] = {
+            "date": analysis_date,
+            "sections": peer_sections,
+            "tickers": peer_tickers,
+            "run_id": peer_run,
+        }
+
+peer_comparison = st.session_state.get("peer_comparison")
+peer_results = {}
+if peer_comparison:
+    peer_results = {peer_ticker: result_store.get(peer_ticker, peer_comparison["run_id"])
+                    for peer_ticker in peer_comparison["tickers"]}
+    if any(results is None for results in peer_results.values()):
+        st.warning("This peer comparison is no longer stored; run it again.")
+        del st.session_state["peer_comparison"]
+        peer_comparison = None
+if peer_comparison:
+    comparison_table = peer_comparison_table(peer_results, peer_comparison["sections"])
+    st.markdown(f"# 👥 Peer Comparison: {', '.join(peer_results)}")
+    st.caption(f"Analysis Date: {peer_comparison['date']}")
+    st.markdown(comparison_table, unsafe_allow_html=True)
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        st.download_button(
+            label="📄 Download Comparison",
+            data=comparison_table,
+            file_name=f"Peer_Comparison_{datetime.now().strftime('%Y%m%d')}.md",
+            mime="text/markdown"
+        )
+    with col2:
+        if st.button("✖️ Close comparison"):
+            del st.session_state["peer_comparison"]
+            st.rerun()
+
+# Render the selected analysis from the job store, without new API calls
+active_ticker = st.session_state.get("next_active_ticker", st.session_state.get("active_ticker"))
+active_job = job_manager.get(session_jobs[active_ticker]) if active_ticker in session_jobs else None
+if active_job:
+    if active_job["status"] in ACTIVE_STATUSES:
+        render_job_progress(active_job["job_id"])
+    else:
+        if active_job["status"] == "failed":
+            st.error(f"❌ Analysis failed: {active_job['error']}")
+        if active_job["sections_pending"]:
+            watch_pending_sections(active_job["job_id"])
+        base_job = job_manager.get(active_job["options"]["base_job_id"]) if active_job["options"].get("base_job_id") else None
+        previous = (job_manager.results(base_job["job_id"]), base_job["date"]) if base_job else None
+        display_analysis_results(active_ticker, job_manager.results(active_job["job_id"]), active_job["date"], previous)
+
+# Screen stored ratios and integrity scores across tickers and over time
+with st.expander("📐 Ratio Screener"):
+    if ratio_store.stats()["records"]:
+        available_metrics = list(ratio_store.metrics().index)
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            metric_choice = st.selectbox(
+                "Metric",
+                available_metrics,
+                format_func=lambda choice: f"{choice[0]} ({choice[1].replace('_', ' ')})"
+            )
+        with col2:
+            screen_op = st.selectbox("Condition", [">", ">=", "<", "<=", "="])
+        with col3:
+            screen_threshold = st.number_input("Value", value=0.0)
         
-        for i, (title, key) in enumerate(sections):
-            status_text.text(f"Analyzing: {title}")
-            progress_bar.progress((i + 1) / len(sections))
-            
-            prompt = generate_section_prompt(key, ticker, analysis_date)
-            results[key] = query_perplexity(prompt)
-            
-        status_text.text("Analysis Complete!")
-        progress_bar.progress(1.0)
+        matches = ratio_store.screen(metric_choice[0], screen_op, screen_threshold, field=metric_choice[1])
+        st.caption(f"{len(matches)} tickers match, using each ticker's latest run")
+        st.dataframe(matches[["ticker", "value", "unit", "run_date", "section"]], hide_index=True)
         
-        display_analysis_results(ticker, results, analysis_date)
+        metric_history = ratio_store.history(metric_choice[0], field=metric_choice[1])
+        if len(metric_history) > 1:
+            st.line_chart(metric_history)
+    else:
+        st.caption("No ratios stored yet. They are extracted from every completed dossier.")
+    
+    if st.button("Rebuild from saved runs", help="Re-extract ratios from every completed job in the job store"):
+        with st.spinner("Extracting ratios..."):
+            rebuilt = sum(job_manager.ingest_ratios(job["job_id"]) for job in job_manager.recent(1000)
+                          if job["status"] == "done")
+        st.success(f"Stored {rebuilt} records")
+
+# Jobs keep running without a browser attached; reopen them from here
+with st.sidebar.expander("🗂️ Recent Jobs"):
+    for job in job_manager.recent(10):
+        st.button(
+            f"{job['ticker']} · {job['status']} ({job['sections_done']}/{job['sections_total']})",
+            key=f"open_job_{job['job_id']}",
+            on_click=open_job,
+            args=(job["ticker"], job["job_id"]),
+            help=f"Started {datetime.fromtimestamp(job['created_at']).strftime('%d %b %H:%M')}"
+        )
+
+# Response cache statistics
+with st.sidebar.expander("🗄️ Response Cache"):
+    cache_stats = response_cache.stats()
+    flight_stats = inflight_queries.stats()
+    st.markdown(f"""
+    **Hits:** {cache_stats['hits']} | **Misses:** {cache_stats['misses']} ({cache_stats['hit_rate']:.0%} hit rate)  
+    **Entries:** {cache_stats['entries']} ({cache_stats['bytes'] / 1024:.0f} KB)  
+    **Expired:** {cache_stats['expired']} | **Evicted:** {cache_stats['evictions']}  
+    **Coalesced:** {flight_stats['coalesced']} shared of {flight_stats['leaders'] + flight_stats['coalesced']} upstream queries ({flight_stats['in_flight']} in flight)
+    """)
+    if st.button("🗑️ Clear Cache"):
+        response_cache.clear()
+        st.success("Cache cleared")
+
+# Memory held by the shared result store
+with st.sidebar.expander("🧠 Result Store"):
+    store_stats = result_store.stats()
+    st.markdown(f"""
+    **In memory:** {store_stats['entries']} runs, {store_stats['bytes'] / 1024:.0f} KB of {store_stats['max_bytes'] / 1024 / 1024:.0f} MB ({store_stats['compression_ratio']:.1f}x compressed)  
+    **Evicted to disk:** {store_stats['evictions']} ({store_stats['evicted_bytes'] / 1024:.0f} KB) | **On disk:** {store_stats['spilled_entries']} runs, {store_stats['spilled_bytes'] / 1024:.0f} KB of {store_stats['max_spill_bytes'] / 1024 / 1024:.0f} MB ({store_stats['spill_evictions']} deleted)  
+    **Hits:** {store_stats['hits']} | **Disk reads:** {store_stats['disk_reads']} | **Misses:** {store_stats['misses']}
+    """)
+
+# Off-hours cache warming for the most requested tickers
+with st.sidebar.expander("🌅 Pre-warming"):
+    prewarm_stats = prewarm_scheduler.stats()
+    if not prewarm_stats["budget"]:
+        st.caption("Off. Set PPLX_PREWARM_BUDGET to a daily API call budget to warm popular tickers overnight.")
+    else:
+        st.markdown(f"""
+        **Window:** {prewarm_stats['window']} | **Budget:** {prewarm_stats['spent_today']}/{prewarm_stats['budget']} calls used today
+        """)
+        for run in access_log.runs(5):
+            st.caption(f"{run['day']} · {run['ticker']} · {run['calls']} calls"
+                       + (f" · {run['failed']} failed" if run["failed"] else ""))
+    if st.button("Preview pre-warm plan"):
+        for entry in prewarm_scheduler.plan():
+            st.caption(f"{entry['ticker']} · {entry['calls']} calls · demand {entry['demand']}")
+
+# Per-call latency, token and cost metrics
+with st.sidebar.expander("📈 Call Metrics"):
+    section_metrics = metrics.summary_by_section()
+    if section_metrics:
+        import pandas as pd
+        
+        metrics_df = pd.DataFrame(section_metrics).set_index("section")
+        st.markdown(f"""
+        **Calls:** {int(metrics_df['calls'].sum())} | **Retries:** {int(metrics_df['retries'].sum())}  
+        **Tokens:** {int(metrics_df['prompt_tokens'].sum() + metrics_df['completion_tokens'].sum()):,} | **Est. cost:** ${metrics_df['cost_usd'].sum():.2f}
+        """)
+        st.dataframe(metrics_df.sort_values("avg_wall_time", ascending=False))
+        
+        tier_metrics = metrics.summary_by_tier()
+        if tier_metrics:
+            st.caption("Latency, cost and output signals by routing tier")
+            st.dataframe(pd.DataFrame(tier_metrics).set_index(["section", "tier"]))
+        st.download_button(
+            label="⬇️ Calls (JSON lines)",
+            data=metrics.export_jsonl(),
+            file_name=f"perplexity_calls_{datetime.now().strftime('%Y%m%d_%H%M')}.jsonl",
+            mime="application/x-ndjson"
+        )
+        st.download_button(
+            label="⬇️ Prometheus snapshot",
+            data=metrics.prometheus_text(),
+            file_name="perplexity_metrics.prom",
+            mime="text/plain"
+        )
+    else:
+        st.caption("No Perplexity calls recorded in this process yet.")
 
 # Sidebar information
 st.sidebar.markdown("---")
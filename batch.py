@@ -0,0 +1,158 @@
+"""Headless batch runner: generate dossiers for every ticker in a watchlist.
+
+Usage:
+    python batch.py watchlist.txt --out-dir reports --ticker-workers 4 --max-concurrent 12 --rpm 120 --tpm 400000
+
+The watchlist holds one ticker per line (commas also separate tickers);
+blank lines and text after `#` are ignored. One markdown report is written
+per ticker, plus `summary.json` describing the whole run.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from engine import (
+    COMBINE_FINANCIALS,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    SECTIONS,
+    configure_request_limits,
+    generate_full_report,
+    init_perplexity_client,
+    is_failure,
+    run_sections_concurrently,
+)
+from metrics import metrics
+from ratio_store import RatioStore
+from response_cache import ResponseCache
+from symbols import resolve_ticker
+
+def load_watchlist(path):
+    """Read tickers from a watchlist file, resolved to canonical symbols, dropping comments and duplicates"""
+    tickers = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for item in line.split("#", 1)[0].split(","):
+                ticker = resolve_ticker(item) if item.strip() else ""
+                if ticker and ticker not in tickers:
+                    tickers.append(ticker)
+    return tickers
+
+def analyze_ticker(client, ticker, date, out_dir, section_workers, cache, use_cache, combine_financials, fast,
+                   ratio_store=None, run_id=None):
+    """Run one dossier, write its report and return a summary record"""
+    started = time.monotonic()
+    results = run_sections_concurrently(
+        client, ticker, date, SECTIONS,
+        max_workers=section_workers,
+        cache=cache,
+        use_cache=use_cache,
+        combine_financials=combine_financials,
+        fast=fast
+    )
+
+    report_path = os.path.join(out_dir, f"{ticker}_Investment_Analysis_{datetime.now().strftime('%Y%m%d')}.md")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(generate_full_report(ticker, results, date))
+
+    failed = [key for key, content in results.items() if is_failure(content)]
+    ratios = ratio_store.ingest(ticker, date, results, run_id) if ratio_store and len(failed) < len(results) else 0
+    return {
+        "ticker": ticker,
+        "status": "failed" if len(failed) == len(results) else "partial" if failed else "ok",
+        "report": report_path,
+        "sections_ok": len(results) - len(failed),
+        "sections_failed": failed,
+        "ratio_records": ratios,
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+    }
+
+def run_batch(tickers, out_dir, ticker_workers=2, section_workers=DEFAULT_MAX_WORKERS,
+              max_concurrent=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+              tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, use_cache=True,
+              combine_financials=COMBINE_FINANCIALS, fast=False, store_ratios=True, log=print):
+    """Generate reports for all tickers and write summary.json; returns the summary"""
+    client = init_perplexity_client()
+    if not client:
+        raise RuntimeError("PPLX_API_KEY is not set")
+
+    os.makedirs(out_dir, exist_ok=True)
+    configure_request_limits(max_concurrent, requests_per_minute, tokens_per_minute)
+    cache = ResponseCache()
+    ratio_store = RatioStore() if store_ratios else None
+    run_id = f"batch{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    date = datetime.now().strftime("%B %d, %Y")
+    started = time.monotonic()
+    records = {}
+
+    with ThreadPoolExecutor(max_workers=ticker_workers) as executor:
+        futures = {
+            executor.submit(analyze_ticker, client, ticker, date, out_dir, section_workers, cache, use_cache,
+                            combine_financials, fast, ratio_store, run_id): ticker
+            for ticker in tickers
+        }
+        for completed, future in enumerate(as_completed(futures), start=1):
+            ticker = futures[future]
+            try:
+                records[ticker] = future.result()
+            except Exception as e:
+                records[ticker] = {"ticker": ticker, "status": "failed", "error": str(e)}
+            log(f"[{completed}/{len(tickers)}] {ticker}: {records[ticker]['status']}")
+
+    summary = {
+        "date": date,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+        "tickers": [records[ticker] for ticker in tickers],
+        "cache": cache.stats(),
+        "sections": metrics.summary_by_section(),
+        "tiers": metrics.summary_by_tier(),
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate investment dossiers for a watchlist of tickers.")
+    parser.add_argument("watchlist", help="file with one ticker per line")
+    parser.add_argument("--out-dir", default="reports", help="directory for reports and summary.json")
+    parser.add_argument("--ticker-workers", type=int, default=2, help="tickers analysed at the same time")
+    parser.add_argument("--section-workers", type=int, default=DEFAULT_MAX_WORKERS, help="parallel sections per ticker")
+    parser.add_argument("--max-concurrent", type=int, default=None, help="global cap on in-flight API requests")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_REQUESTS_PER_MINUTE, help="global cap on API requests per minute")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TOKENS_PER_MINUTE, help="global cap on API tokens per minute")
+    parser.add_argument("--no-cache", action="store_true", help="ignore cached responses (results are still cached)")
+    parser.add_argument("--separate-financials", action="store_true",
+                        help="query the four financial statement sections individually")
+    parser.add_argument("--fast", action="store_true", help="route eligible sections to the lighter model")
+    parser.add_argument("--no-ratio-store", action="store_true", help="do not extract ratios into the ratio store")
+    args = parser.parse_args(argv)
+
+    tickers = load_watchlist(args.watchlist)
+    if not tickers:
+        parser.error(f"no tickers found in {args.watchlist}")
+
+    summary = run_batch(
+        tickers, args.out_dir,
+        ticker_workers=args.ticker_workers,
+        section_workers=args.section_workers,
+        max_concurrent=args.max_concurrent,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        use_cache=not args.no_cache,
+        combine_financials=COMBINE_FINANCIALS and not args.separate_financials,
+        fast=args.fast,
+        store_ratios=not args.no_ratio_store
+    )
+    failed = [record["ticker"] for record in summary["tickers"] if record["status"] == "failed"]
+    print(f"Wrote {len(tickers) - len(failed)} reports to {args.out_dir} in {summary['elapsed_seconds']}s")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
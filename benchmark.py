@@ -0,0 +1,160 @@
+"""Benchmark the section pipeline against a local mock of the Perplexity API.
+
+Usage:
+    python benchmark.py --dossiers 5 --batch-tickers 10 --latency-median 2 --error-rate 0.02
+
+Runs full dossiers one after another (per-dossier wall time) and then a
+multi-ticker batch (throughput), all against mock_perplexity.py, and
+reports p50/p95 wall times. No network access or API credits are used.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import engine
+from engine import (
+    DEFAULT_MAX_WORKERS,
+    SECTIONS,
+    init_perplexity_client,
+    is_failure,
+    is_pending,
+    run_sections_concurrently,
+)
+from metrics import metrics
+from mock_perplexity import MockConfig, MockPerplexityServer
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values`"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+def run_dossier(client, ticker, args):
+    """Run one dossier and return (wall_seconds, failed_sections, pending_sections).
+
+    The wall time stops at the deadline, but pending sections are waited
+    for before returning, so they never outlive the mock server.
+    """
+    started = time.monotonic()
+    late_finished = threading.Event()
+    results = run_sections_concurrently(
+        client, ticker, "January 01, 2025", SECTIONS,
+        max_workers=args.workers,
+        combine_financials=not args.separate_financials,
+        fast=args.fast,
+        on_section_token=(lambda key, text: None) if args.stream else None,
+        deadline=args.deadline,
+        on_late_finished=late_finished.set
+    )
+    wall = time.monotonic() - started
+    pending = sum(is_pending(content) for content in results.values())
+    failed = sum(is_failure(content) for content in results.values()) - pending
+    if pending:
+        late_finished.wait()
+    return wall, failed, pending
+
+def bench_dossiers(client, args):
+    """Sequential full dossiers: latency of a single analysis"""
+    walls, failures, pending = [], 0, 0
+    for i in range(args.dossiers):
+        wall, failed, late = run_dossier(client, f"BENCH{i}", args)
+        walls.append(wall)
+        failures += failed
+        pending += late
+    return {
+        "dossiers": args.dossiers,
+        "p50_seconds": round(percentile(walls, 50), 3),
+        "p95_seconds": round(percentile(walls, 95), 3),
+        "max_seconds": round(max(walls), 3),
+        "failed_sections": failures,
+        "pending_sections": pending,
+    }
+
+def bench_batch(client, args):
+    """Many tickers at once: throughput under the global limiter"""
+    tickers = [f"BATCH{i}" for i in range(args.batch_tickers)]
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.ticker_workers) as executor:
+        outcomes = list(executor.map(lambda ticker: run_dossier(client, ticker, args), tickers))
+    elapsed = time.monotonic() - started
+    walls = [wall for wall, _, _ in outcomes]
+    return {
+        "tickers": len(tickers),
+        "elapsed_seconds": round(elapsed, 3),
+        "dossiers_per_minute": round(len(tickers) / elapsed * 60, 2),
+        "p50_seconds": round(percentile(walls, 50), 3),
+        "p95_seconds": round(percentile(walls, 95), 3),
+        "failed_sections": sum(failed for _, failed, _ in outcomes),
+        "pending_sections": sum(pending for _, _, pending in outcomes),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dossier pipeline against a local mock API.")
+    parser.add_argument("--dossiers", type=int, default=3, help="sequential single-ticker dossiers to time")
+    parser.add_argument("--batch-tickers", type=int, default=10, help="tickers in the batch scenario (0 to skip)")
+    parser.add_argument("--ticker-workers", type=int, default=4, help="tickers run at once in the batch scenario")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="parallel sections per dossier")
+    parser.add_argument("--max-concurrent", type=int, default=None, help="global cap on in-flight requests")
+    parser.add_argument("--rpm", type=int, default=None, help="global requests per minute")
+    parser.add_argument("--tpm", type=int, default=None, help="global tokens per minute")
+    parser.add_argument("--latency-median", type=float, default=2.0, help="median mock latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal sigma of mock latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock requests that fail (429/500)")
+    parser.add_argument("--response-chars", type=int, default=6000, help="size of each mock response")
+    parser.add_argument("--stream", action="store_true", help="use the streaming path")
+    parser.add_argument("--separate-financials", action="store_true", help="disable the combined financials call")
+    parser.add_argument("--fast", action="store_true", help="use fast dossier routing")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="analysis deadline in seconds; later sections count as pending")
+    parser.add_argument("--hedge", action="store_true", help="send hedged duplicates of slow requests")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the mock server")
+    parser.add_argument("--json-out", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        response_chars=args.response_chars,
+        retry_after=min(1.0, args.latency_median),
+        seed=args.seed
+    )
+
+    os.environ.setdefault("PPLX_API_KEY", "benchmark")
+    metrics.log_path = None
+    engine.configure_request_limits(args.max_concurrent, args.rpm, args.tpm)
+    engine.HEDGE_REQUESTS = args.hedge
+
+    with MockPerplexityServer(config) as server:
+        client = init_perplexity_client(base_url=server.base_url)
+        report = {"config": vars(args)}
+        if args.dossiers:
+            report["single_dossier"] = bench_dossiers(client, args)
+        if args.batch_tickers:
+            report["batch"] = bench_batch(client, args)
+        report["mock_requests"] = server.state.requests
+        report["mock_errors"] = server.state.errors
+        report["mock_cancelled"] = server.state.cancelled
+
+    for name in ("single_dossier", "batch"):
+        if name in report:
+            print(f"{name}: " + ", ".join(f"{key}={value}" for key, value in report[name].items()))
+    print(f"mock requests: {report['mock_requests']} ({report['mock_errors']} injected errors)")
+    if args.hedge:
+        hedges = sum(record.get("hedged", False) for record in metrics.snapshot())
+        print(f"calls that sent a hedged duplicate: {hedges}")
+        print(f"requests closed by the client before completing: {report['mock_cancelled']}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
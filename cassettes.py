@@ -0,0 +1,219 @@
+"""Record and replay Perplexity API calls as compressed cassette files"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+DEFAULT_CASSETTE_DIR = os.getenv("PPLX_CASSETTE_DIR", os.path.join(".cache", "cassettes"))
+# "record" saves every successful call, "replay" serves calls from cassettes only
+CASSETTE_MODE = os.getenv("PPLX_CASSETTE_MODE", "").strip().lower()
+# "zero" replays instantly, "original" reproduces the recorded timing
+REPLAY_LATENCY = os.getenv("PPLX_REPLAY_LATENCY", "zero").strip().lower()
+
+# Analysis dates are left out of cassette keys, so a recording replays on any day
+DATE = re.compile(
+    r"\b(?:January|February|March|April|May|June|July|August|September|October|November|December) \d{1,2}, \d{4}\b"
+)
+
+# Text size of each chunk when a non-streamed recording is replayed as a stream
+REPLAY_CHUNK_CHARS = 64
+
+class CassetteMiss(Exception):
+    """Raised in replay mode for a request that was never recorded"""
+
+def request_key(model, messages, temperature=None, max_tokens=None, response_format=None, **_):
+    """Cassette key of a request: its content without dates, timeouts or the stream flag"""
+    payload = json.dumps({
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "response_format": response_format,
+    }, sort_keys=True)
+    return hashlib.sha256(DATE.sub("<date>", payload).encode("utf-8")).hexdigest()
+
+def usage_dict(usage):
+    if usage is None:
+        return None
+    return {name: getattr(usage, name, None) for name in ("prompt_tokens", "completion_tokens", "total_tokens")}
+
+def build_completion(cassette):
+    """A ChatCompletion equivalent to a recorded response"""
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate({
+        "id": f"replay-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": cassette["model"],
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": cassette["content"]}}],
+        "usage": cassette["usage"],
+    })
+
+def build_chunk(model, content=None, usage=None):
+    """A ChatCompletionChunk carrying one text delta, or the closing usage"""
+    from openai.types.chat import ChatCompletionChunk
+
+    choices = [] if content is None else [{"index": 0, "delta": {"role": "assistant", "content": content}}]
+    return ChatCompletionChunk.model_validate({
+        "id": "replay",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": choices,
+        "usage": usage,
+    })
+
+class ReplayStream:
+    """Iterates a recorded stream as chunks; `close()` stops it like a real stream"""
+
+    def __init__(self, cassette, latency):
+        self.cassette = cassette
+        self.latency = latency
+        self.closed = False
+
+    def _deltas(self):
+        if self.cassette.get("deltas"):
+            return self.cassette["deltas"]
+        # Recorded without streaming: spread the text evenly over the recorded time
+        content = self.cassette["content"]
+        pieces = [content[i:i + REPLAY_CHUNK_CHARS] for i in range(0, len(content), REPLAY_CHUNK_CHARS)]
+        step = self.cassette["elapsed"] / max(len(pieces), 1)
+        return [[round((i + 1) * step, 3), piece] for i, piece in enumerate(pieces)]
+
+    def __iter__(self):
+        started = time.monotonic()
+        for offset, text in self._deltas():
+            if self.closed:
+                return
+            if self.latency == "original":
+                time.sleep(max(0.0, offset - (time.monotonic() - started)))
+            yield build_chunk(self.cassette["model"], text)
+        if not self.closed:
+            yield build_chunk(self.cassette["model"], usage=self.cassette["usage"])
+
+    def close(self):
+        self.closed = True
+
+class RecordingStream:
+    """Passes a live stream through, saving it as a cassette once it completes"""
+
+    def __init__(self, stream, save, model, started):
+        self.stream = stream
+        self.save = save
+        self.model = model
+        self.started = started
+
+    def __iter__(self):
+        deltas, usage = [], None
+        for chunk in self.stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                deltas.append([round(time.monotonic() - self.started, 3), chunk.choices[0].delta.content])
+            yield chunk
+        # Only streams read to the end are recorded; cut-off ones are incomplete
+        self.save({
+            "model": self.model,
+            "content": "".join(text for _, text in deltas),
+            "usage": usage_dict(usage),
+            "elapsed": round(time.monotonic() - self.started, 3),
+            "deltas": deltas,
+        })
+
+    def close(self):
+        self.stream.close()
+
+class CassetteClient:
+    """Stands in for the OpenAI client, recording or replaying chat completions.
+
+    Exposes `chat.completions.create()` only, which is all the engine uses.
+    Retries, rate limiting, hedging and caching run unchanged on top, so a
+    replayed dossier exercises the whole pipeline without the network.
+    Each request is one gzipped JSON file named by its request_key.
+    """
+
+    def __init__(self, client, mode, directory=DEFAULT_CASSETTE_DIR, latency=REPLAY_LATENCY):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode!r} (expected 'record' or 'replay')")
+        self.client = client
+        self.mode = mode
+        self.directory = directory
+        self.latency = latency
+        self.recorded = 0
+        self.replayed = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def _save(self, key, cassette):
+        cassette["recorded_at"] = time.time()
+        path = self._path(key)
+        partial = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(partial, "wt", encoding="utf-8") as f:
+            json.dump(cassette, f, separators=(",", ":"))
+        os.replace(partial, path)
+        with self._lock:
+            self.recorded += 1
+
+    def _load(self, key):
+        try:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def create(self, **kwargs):
+        """chat.completions.create(), served from or saved to a cassette"""
+        key = request_key(**kwargs)
+        if self.mode == "replay":
+            return self._replay(key, kwargs)
+
+        started = time.monotonic()
+        response = self.client.chat.completions.create(**kwargs)
+        save = lambda cassette: self._save(key, cassette)
+        if kwargs.get("stream"):
+            return RecordingStream(response, save, kwargs["model"], started)
+        save({
+            "model": kwargs["model"],
+            "content": response.choices[0].message.content,
+            "usage": usage_dict(getattr(response, "usage", None)),
+            "elapsed": round(time.monotonic() - started, 3),
+            "deltas": None,
+        })
+        return response
+
+    def _replay(self, key, kwargs):
+        cassette = self._load(key)
+        with self._lock:
+            if cassette is None:
+                self.missed += 1
+            else:
+                self.replayed += 1
+        if cassette is None:
+            raise CassetteMiss(f"No recorded response for this {kwargs.get('model')} request in {self.directory}")
+        if kwargs.get("stream"):
+            return ReplayStream(cassette, self.latency)
+        if self.latency == "original":
+            time.sleep(cassette["elapsed"])
+        return build_completion(cassette)
+
+    def stats(self):
+        """Mode and recorded/replayed/missed counts"""
+        with self._lock:
+            return {"mode": self.mode, "recorded": self.recorded, "replayed": self.replayed, "missed": self.missed,
+                    "cassettes": len([name for name in os.listdir(self.directory) if name.endswith(".json.gz")])}
+
+def cassette_client(client, mode=None):
+    """Wrap `client` for PPLX_CASSETTE_MODE, or return it unchanged when the mode is unset"""
+    mode = CASSETTE_MODE if mode is None else mode
+    return CassetteClient(client, mode) if mode else client
@@ -0,0 +1,355 @@
+"""Uploaded filings: streaming text extraction and a per-ticker BM25 index"""
+import hashlib
+import math
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_DOCUMENTS_PATH = os.getenv("PPLX_DOCUMENTS_PATH", os.path.join(".cache", "documents.sqlite3"))
+DEFAULT_EXTRACT_WORKERS = int(os.getenv("PPLX_EXTRACT_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+# Pages handed to an extraction worker at once; at most two batches per worker are in flight
+PAGE_BATCH = 8
+COPY_BLOCK_BYTES = 1024 * 1024
+
+# Chunks are windows of words within one page, so every excerpt has a page number
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 40
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Excerpt budget per section prompt
+EXCERPT_LIMIT = 6
+EXCERPT_CHARS = 6000
+
+DOCUMENT_KINDS = {
+    "annual_report": "Annual report",
+    "transcript": "Conference-call transcript",
+    "presentation": "Investor presentation",
+}
+
+# What each section looks for in the filings, and which kinds of filing it prefers
+SECTION_QUERIES = {
+    "annual_report": (
+        ["annual_report"],
+        "accounting policy change related party transactions contingent liabilities guarantees off balance sheet "
+        "auditor qualification emphasis of matter key audit matters provisions impairment write off pledge "
+        "management discussion analysis outlook risks remuneration subsidiaries"
+    ),
+    "conference_calls": (
+        ["transcript"],
+        "guidance outlook growth demand margin cost pricing capacity utilization expansion capex order book "
+        "pipeline launch acquisition market share competition headwinds tailwinds next quarter next year target"
+    ),
+    "investor_presentations": (
+        ["presentation"],
+        "strategy initiatives segment revenue mix ebitda margin guidance capex capacity utilization expansion "
+        "launches new markets targets performance highlights outlook"
+    ),
+}
+
+STOPWORDS = set("""
+a an and are as at be been by for from has have in into is it its of on or our that the their this to was were
+will with we which not also than these those such per
+""".split())
+TOKEN = re.compile(r"[a-z][a-z0-9&]+|\d+(?:\.\d+)?")
+
+def tokenize(text):
+    """Lower-cased index terms of `text`, without stopwords"""
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+def guess_kind(filename):
+    """Guess a document kind from its file name"""
+    name = filename.lower()
+    if name.endswith(".pptx") or "presentation" in name or "investor" in name:
+        return "presentation"
+    if re.search(r"transcript|con-?call|earnings.?call", name):
+        return "transcript"
+    return "annual_report"
+
+def copy_and_hash(source, target_path):
+    """Copy a binary file object to disk in blocks; returns its sha256"""
+    digest = hashlib.sha256()
+    with open(target_path, "wb") as target:
+        while True:
+            block = source.read(COPY_BLOCK_BYTES)
+            if not block:
+                break
+            digest.update(block)
+            target.write(block)
+    return digest.hexdigest()
+
+def pdf_page_count(path):
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+def extract_pdf_pages(path, start, stop):
+    """Text of PDF pages [start, stop) as (page number, text); runs in a worker process"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [(number + 1, reader.pages[number].extract_text() or "") for number in range(start, stop)]
+
+def iter_pdf_pages(path, workers=DEFAULT_EXTRACT_WORKERS):
+    """Yield (page number, text) for a PDF in page order.
+
+    Batches of pages are extracted by a pool of processes, with only a
+    couple of batches per worker outstanding, so memory stays flat however
+    long the document is.
+    """
+    pages = pdf_page_count(path)
+    batches = [(start, min(start + PAGE_BATCH, pages)) for start in range(0, pages, PAGE_BATCH)]
+    if workers <= 1 or len(batches) <= 1:
+        for start, stop in batches:
+            yield from extract_pdf_pages(path, start, stop)
+        return
+
+    # Spawned rather than forked: the app process has live threads and sockets
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches)), mp_context=context) as executor:
+        remaining = iter(batches)
+        window = deque()
+        for start, stop in remaining:
+            window.append(executor.submit(extract_pdf_pages, path, start, stop))
+            if len(window) >= workers * 2:
+                break
+        while window:
+            yield from window.popleft().result()
+            batch = next(remaining, None)
+            if batch:
+                window.append(executor.submit(extract_pdf_pages, path, *batch))
+
+def iter_pptx_slides(path):
+    """Yield (slide number, text) for a PowerPoint deck, including tables and notes"""
+    from pptx import Presentation
+
+    for number, slide in enumerate(Presentation(path).slides, start=1):
+        parts = []
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                parts.append(shape.text_frame.text)
+            elif getattr(shape, "has_table", False) and shape.has_table:
+                parts.extend(" | ".join(cell.text for cell in row.cells) for row in shape.table.rows)
+        if slide.has_notes_slide:
+            parts.append(slide.notes_slide.notes_text_frame.text)
+        yield number, "\n".join(part for part in parts if part.strip())
+
+def iter_pages(path, filename, workers=DEFAULT_EXTRACT_WORKERS):
+    """Pages (or slides) of an uploaded PDF or PPTX file"""
+    if filename.lower().endswith(".pptx"):
+        return iter_pptx_slides(path)
+    if filename.lower().endswith(".pdf"):
+        return iter_pdf_pages(path, workers)
+    raise ValueError(f"Unsupported document type: {filename} (upload a PDF or PPTX)")
+
+def chunk_page(text, words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Split one page into overlapping windows of whitespace-normalized words"""
+    tokens = text.split()
+    step = words - overlap
+    return [" ".join(tokens[start:start + words]) for start in range(0, max(len(tokens) - overlap, 1), step)
+            if tokens[start:start + words]]
+
+class DocumentIndex:
+    """Uploaded filings and their BM25 inverted index, stored in SQLite.
+
+    Documents are keyed by the sha256 of their bytes: uploading a file the
+    index already holds (for any ticker) only links it to the ticker, with
+    no extraction. Chunks and postings go to disk page by page as they are
+    extracted, and searches read just the postings of the query terms.
+    """
+
+    def __init__(self, path=DEFAULT_DOCUMENTS_PATH, workers=DEFAULT_EXTRACT_WORKERS):
+        self.path = path
+        self.workers = workers
+        self._lock = threading.Lock()
+        # One upload is indexed at a time, so its rows commit (or roll back) together
+        self._index_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT PRIMARY KEY,
+                pages INTEGER NOT NULL,
+                chunks INTEGER NOT NULL,
+                indexed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ticker_documents (
+                ticker TEXT NOT NULL,
+                doc_hash TEXT NOT NULL,
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                PRIMARY KEY (ticker, doc_hash)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc_hash TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                page INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (doc_hash, chunk_id)
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_hash TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_postings_term ON postings (term, doc_hash);
+        """)
+        self._conn.commit()
+
+    def add(self, ticker, fileobj, filename, kind=None):
+        """Index an uploaded file for `ticker`; returns (doc_hash, reused).
+
+        `fileobj` is any binary file object; it is copied to a temporary
+        file in blocks, which extraction then reads page by page.
+        """
+        kind = kind or guess_kind(filename)
+        staging = f"{self.path}.{threading.get_ident()}.upload"
+        with self._index_lock:
+            try:
+                doc_hash = copy_and_hash(fileobj, staging)
+                reused = self._indexed(doc_hash)
+                if not reused:
+                    self._index_file(doc_hash, staging, filename)
+            finally:
+                if os.path.exists(staging):
+                    os.remove(staging)
+
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ticker_documents VALUES (?, ?, ?, ?, ?)",
+                    (ticker, doc_hash, filename, kind, time.time())
+                )
+                self._conn.commit()
+        return doc_hash, reused
+
+    def _indexed(self, doc_hash):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents WHERE doc_hash = ?", (doc_hash,)).fetchone() is not None
+
+    def _index_file(self, doc_hash, path, filename):
+        pages = chunk_id = 0
+        try:
+            for page, text in iter_pages(path, filename, self.workers):
+                pages += 1
+                rows, postings = [], []
+                for chunk in chunk_page(text):
+                    terms = Counter(tokenize(chunk))
+                    if not terms:
+                        continue
+                    rows.append((doc_hash, chunk_id, page, sum(terms.values()), chunk))
+                    postings.extend((term, doc_hash, chunk_id, tf) for term, tf in terms.items())
+                    chunk_id += 1
+                with self._lock:
+                    self._conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+                    self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)", postings)
+        except BaseException:
+            with self._lock:
+                self._conn.rollback()
+            raise
+
+        with self._lock:
+            self._conn.execute("INSERT INTO documents VALUES (?, ?, ?, ?)", (doc_hash, pages, chunk_id, time.time()))
+            self._conn.commit()
+
+    def remove(self, ticker, doc_hash):
+        """Unlink a document from `ticker`, dropping its index once no ticker uses it"""
+        with self._index_lock, self._lock:
+            self._conn.execute("DELETE FROM ticker_documents WHERE ticker = ? AND doc_hash = ?", (ticker, doc_hash))
+            if not self._conn.execute("SELECT 1 FROM ticker_documents WHERE doc_hash = ?", (doc_hash,)).fetchone():
+                for table in ("documents", "chunks", "postings"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE doc_hash = ?", (doc_hash,))
+            self._conn.commit()
+
+    def documents(self, ticker):
+        """Documents linked to `ticker`, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t.doc_hash, t.name, t.kind, t.added_at, d.pages, d.chunks FROM ticker_documents t "
+                "JOIN documents d USING (doc_hash) WHERE t.ticker = ? ORDER BY t.added_at DESC",
+                (ticker,)
+            ).fetchall()
+        return [dict(zip(["doc_hash", "name", "kind", "added_at", "pages", "chunks"], row)) for row in rows]
+
+    def search(self, ticker, query, kinds=None, limit=EXCERPT_LIMIT):
+        """Top BM25 matches for `query` among the ticker's documents.
+
+        With `kinds`, only documents of those kinds are searched, unless the
+        ticker has none of them. Returns dicts with name, kind, page, text
+        and score, best first.
+        """
+        documents = {doc["doc_hash"]: doc for doc in self.documents(ticker)}
+        if kinds and any(doc["kind"] in kinds for doc in documents.values()):
+            documents = {doc_hash: doc for doc_hash, doc in documents.items() if doc["kind"] in kinds}
+        terms = sorted(set(tokenize(query)))
+        if not documents or not terms:
+            return []
+
+        hashes = list(documents)
+        doc_marks = ", ".join("?" * len(hashes))
+        with self._lock:
+            total, average = self._conn.execute(
+                f"SELECT COUNT(*), AVG(length) FROM chunks WHERE doc_hash IN ({doc_marks})", hashes
+            ).fetchone()
+            postings = self._conn.execute(
+                f"SELECT p.term, p.doc_hash, p.chunk_id, p.tf, c.length FROM postings p "
+                f"JOIN chunks c ON c.doc_hash = p.doc_hash AND c.chunk_id = p.chunk_id "
+                f"WHERE p.term IN ({', '.join('?' * len(terms))}) AND p.doc_hash IN ({doc_marks})",
+                terms + hashes
+            ).fetchall()
+        if not total:
+            return []
+
+        frequency = Counter(term for term, *_ in postings)
+        scores = Counter()
+        for term, doc_hash, chunk_id, tf, length in postings:
+            idf = math.log(1 + (total - frequency[term] + 0.5) / (frequency[term] + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average)
+            scores[(doc_hash, chunk_id)] += idf * tf * (BM25_K1 + 1) / norm
+
+        hits = []
+        for (doc_hash, chunk_id), score in scores.most_common(limit):
+            with self._lock:
+                page, text = self._conn.execute(
+                    "SELECT page, text FROM chunks WHERE doc_hash = ? AND chunk_id = ?", (doc_hash, chunk_id)
+                ).fetchone()
+            document = documents[doc_hash]
+            hits.append({"name": document["name"], "kind": document["kind"], "page": page, "text": text,
+                         "score": round(score, 3)})
+        return hits
+
+    def excerpts(self, ticker, section_key, max_chars=EXCERPT_CHARS):
+        """Top-ranked excerpts for a section's prompt, within a character budget"""
+        if section_key not in SECTION_QUERIES:
+            return []
+        kinds, query = SECTION_QUERIES[section_key]
+        selected, used = [], 0
+        for hit in self.search(ticker, query, kinds):
+            if used + len(hit["text"]) > max_chars:
+                break
+            selected.append(hit)
+            used += len(hit["text"])
+        # Back in document order, so neighbouring passages read naturally
+        return sorted(selected, key=lambda hit: (hit["name"], hit["page"]))
+
+    def stats(self):
+        """Document, chunk and term counts"""
+        with self._lock:
+            documents, chunks = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM documents").fetchone()
+            terms = self._conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        return {"documents": documents, "chunks": chunks, "terms": terms}
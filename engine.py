@@ -0,0 +1,1336 @@
+"""Section analysis engine shared by the Streamlit app and the batch runner"""
+import difflib
+import json
+import os
+import queue
+import re
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cassettes import CASSETTE_MODE, cassette_client
+from metrics import LatencyWindow, metrics
+from rate_limit import RateLimiter, backoff_delay, parse_retry_after
+from response_cache import make_cache_key
+from singleflight import SingleFlight
+from symbols import sector_for
+
+PERPLEXITY_BASE_URL = os.getenv("PPLX_BASE_URL", "https://api.perplexity.ai")
+
+# Connection pool shared by every request in the process
+HTTP_MAX_CONNECTIONS = int(os.getenv("PPLX_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_KEEPALIVE_SECONDS = 120.0
+HTTP_TIMEOUT_SECONDS = 120.0
+HTTP_CONNECT_TIMEOUT_SECONDS = 10.0
+
+def build_http_client():
+    """Build the pooled keep-alive httpx client behind the OpenAI client.
+
+    HTTP/2 is enabled when the optional `h2` package is installed, so
+    concurrent sections multiplex over one TLS connection.
+    """
+    import httpx
+    
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+    )
+
+# Initialize Perplexity client for Render.com
+def init_perplexity_client(base_url=None):
+    """Initialize Perplexity client - Render.com compatible.
+
+    `base_url` (or PPLX_BASE_URL) points the client at another
+    OpenAI-compatible server, such as the local benchmark mock. The client
+    is thread-safe; create it once per process and share it.
+    
+    PPLX_CASSETTE_MODE=record saves every response to cassette files and
+    PPLX_CASSETTE_MODE=replay serves them back with no key or network (see
+    cassettes.py).
+    """
+    if CASSETTE_MODE == "replay":
+        return cassette_client(None)
+    
+    # Get API key from environment variable (Render.com method)
+    api_key = os.getenv("PPLX_API_KEY")
+    
+    if api_key:
+        # Imported here so that importing the engine stays cheap
+        from openai import OpenAI
+        
+        # Retries are handled by query_perplexity so they share the rate limiter
+        return cassette_client(OpenAI(
+            api_key=api_key,
+            base_url=base_url or PERPLEXITY_BASE_URL,
+            max_retries=0,
+            http_client=build_http_client()
+        ))
+    else:
+        return None
+
+# Sections that make up a complete dossier, in display order
+SECTIONS = [
+    ("🌐 Sectoral Trends & Triggers", "sectoral_analysis"),
+    ("📰 News & Competition", "news_competition"),
+    ("💰 Financial Analysis - P&L", "financial_pl"),
+    ("🏦 Financial Analysis - Balance Sheet", "financial_bs"),
+    ("💸 Financial Analysis - Cash Flow", "financial_cf"),
+    ("📊 Ratio Analysis", "ratio_analysis"),
+    ("👥 Management Evaluation", "management_eval"),
+    ("📈 Management Guidance & Delivery", "management_guidance"),
+    ("📋 Investor Presentations Analysis", "investor_presentations"),
+    ("🎙️ Conference Calls Analysis", "conference_calls"),
+    ("💬 Community & Forum Analysis", "community_analysis"),
+    ("📑 Annual Report Forensics", "annual_report"),
+    ("🎯 Management Integrity Matrix", "integrity_matrix"),
+    ("🚀 Growth Triggers", "growth_triggers"),
+    ("💎 Valuation Analysis", "valuation_analysis"),
+    ("🎭 Scenario Analysis", "scenario_analysis"),
+    ("⭐ Final Recommendation", "final_recommendation")
+]
+
+# Sections whose prompts build on the output of earlier sections
+SECTION_DEPENDENCIES = {
+    "integrity_matrix": ["management_eval", "management_guidance", "investor_presentations", "conference_calls", "annual_report"],
+    "scenario_analysis": ["sectoral_analysis", "news_competition", "financial_pl", "financial_bs", "financial_cf",
+                          "ratio_analysis", "growth_triggers", "valuation_analysis"],
+    "final_recommendation": ["news_competition", "ratio_analysis", "integrity_matrix", "growth_triggers",
+                             "valuation_analysis", "scenario_analysis"],
+}
+
+# Character budget for each upstream summary passed into a dependent prompt
+UPSTREAM_SUMMARY_CHARS = 1200
+
+# Upper bound on simultaneous Perplexity requests per analysis
+DEFAULT_MAX_WORKERS = int(os.getenv("PPLX_MAX_WORKERS", "6"))
+
+# Provider quotas enforced client-side (unset means unlimited)
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("PPLX_RPM", "0")) or None
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("PPLX_TPM", "0")) or None
+
+# Retry policy for rate-limited and transient failures
+MAX_RETRIES = int(os.getenv("PPLX_MAX_RETRIES", "4"))
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Deadlines in seconds: one section including retries, and a whole dossier
+# (sections still running then are returned as pending and fill in later)
+SECTION_DEADLINE_SECONDS = float(os.getenv("PPLX_SECTION_DEADLINE", "120"))
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("PPLX_ANALYSIS_DEADLINE", "300")) or None
+
+# Hedged requests: once a call outlives the p95 latency observed for its
+# section and model, race a duplicate and keep whichever answers first
+HEDGE_REQUESTS = os.getenv("PPLX_HEDGE", "0") == "1"
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_SECONDS = 2.0
+
+MAX_TOKENS = 4000
+DEFAULT_MODEL = "sonar-pro"
+DEFAULT_TEMPERATURE = 0.1
+
+# Lighter model used for eligible sections in fast dossier mode
+FAST_MODEL = os.getenv("PPLX_FAST_MODEL", "sonar")
+
+# Per-section model, output budget and temperature; unlisted fields use the defaults.
+# "fast" marks sections that can move to FAST_MODEL in fast dossier mode.
+SECTION_ROUTING = {
+    "sectoral_analysis": {"max_tokens": 3000, "fast": True},
+    "news_competition": {"max_tokens": 2000, "fast": True},
+    "financial_pl": {"max_tokens": 4000},
+    "financial_bs": {"max_tokens": 4000},
+    "financial_cf": {"max_tokens": 3500},
+    "ratio_analysis": {"max_tokens": 4000},
+    "management_eval": {"max_tokens": 3000},
+    "management_guidance": {"max_tokens": 3000, "fast": True},
+    "investor_presentations": {"max_tokens": 3000},
+    "conference_calls": {"max_tokens": 3000},
+    "community_analysis": {"max_tokens": 2000, "fast": True},
+    "annual_report": {"max_tokens": 4000},
+    "integrity_matrix": {"max_tokens": 2500},
+    "growth_triggers": {"max_tokens": 3000, "fast": True},
+    "valuation_analysis": {"max_tokens": 3500},
+    "scenario_analysis": {"max_tokens": 3500, "temperature": 0.2},
+    "final_recommendation": {"max_tokens": 2500},
+}
+
+def route_for(section_key, fast=False):
+    """Return the model, max_tokens, temperature and tier for a section.
+
+    In fast mode, sections marked "fast" in SECTION_ROUTING go to FAST_MODEL.
+    """
+    routing = SECTION_ROUTING.get(section_key, {})
+    use_fast = fast and routing.get("fast", False)
+    return {
+        "model": FAST_MODEL if use_fast else routing.get("model", DEFAULT_MODEL),
+        "max_tokens": routing.get("max_tokens", MAX_TOKENS),
+        "temperature": routing.get("temperature", DEFAULT_TEMPERATURE),
+        "tier": "fast" if use_fast else "standard",
+    }
+
+# Statement sections that can be fetched together in one structured call
+FINANCIAL_SECTIONS = ["financial_pl", "financial_bs", "financial_cf", "ratio_analysis"]
+COMBINED_FINANCIALS_MAX_TOKENS = 8000
+COMBINE_FINANCIALS = os.getenv("PPLX_COMBINE_FINANCIALS", "1") == "1"
+
+# Delta refresh: prior section text is condensed to this many characters of
+# context and the model only reports material changes, in a smaller budget
+DELTA_CONTEXT_CHARS = 3000
+DELTA_MAX_TOKENS = 1200
+NO_MATERIAL_CHANGE = "NO MATERIAL CHANGE"
+DELTA_HEADING = "### 🔄 Changes since"
+DELTA_SEPARATOR = "\n\n<!-- previous analysis -->\n\n"
+
+# Sections about the industry rather than the company; for tickers with a
+# known sector they are generated once per sector per day and shared
+SECTOR_SECTIONS = ["sectoral_analysis"]
+
+SYSTEM_PROMPT = "You are a professional equity research analyst. Provide detailed, fact-based analysis with specific data points, sources, and clear reasoning. Always include current dates and verify information accuracy."
+
+def build_messages(prompt):
+    """Build the chat messages sent for a section prompt"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+class QueryFailure:
+    """Typed result returned in place of section content when a query fails"""
+
+    def __init__(self, message, status_code=None, retryable=False, attempts=1):
+        self.message = message
+        self.status_code = status_code
+        self.retryable = retryable
+        self.attempts = attempts
+
+    def __str__(self):
+        return f"⚠️ Analysis unavailable: {self.message}"
+
+    def __repr__(self):
+        return f"QueryFailure({self.message!r}, status_code={self.status_code!r}, attempts={self.attempts})"
+
+class PendingSection(QueryFailure):
+    """Placeholder for a section still running when the analysis deadline passed"""
+
+    def __init__(self, message="Still generating after the analysis deadline; it will appear when ready"):
+        super().__init__(message, retryable=True)
+
+    def __str__(self):
+        return f"⏳ Pending: {self.message}"
+
+def is_failure(content):
+    """Check whether a query returned a QueryFailure instead of analysis"""
+    return isinstance(content, QueryFailure)
+
+def is_pending(content):
+    """Check whether a section is a placeholder that will be filled in later"""
+    return isinstance(content, PendingSection)
+
+class DeadlineExceeded(Exception):
+    """Raised when a section runs past its deadline"""
+
+class HedgeLost(Exception):
+    """Raised inside a hedged attempt that lost the race, to abandon it.
+
+    `usage` is what the attempt reported, if it got that far; `sent` is
+    False for a duplicate dropped before its request went out.
+    """
+
+    def __init__(self, usage=None, sent=True):
+        super().__init__("hedged attempt lost the race")
+        self.usage = usage
+        self.sent = sent
+
+request_limiter = RateLimiter(DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE)
+
+# Identical concurrent queries from any session share one upstream call
+inflight_queries = SingleFlight()
+
+# Time from a call's start to its first committed output, per hedge key, to find each call's p95
+attempt_latency = LatencyWindow()
+
+def configure_request_limits(max_concurrent=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                             tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+    """Replace the process-wide request limiter"""
+    global request_limiter
+    request_limiter = RateLimiter(requests_per_minute, tokens_per_minute, max_concurrent)
+
+def estimate_tokens(prompt, max_tokens=MAX_TOKENS):
+    """Rough upper bound of the tokens a request will consume"""
+    return (len(SYSTEM_PROMPT) + len(prompt)) // 4 + max_tokens
+
+def classify_error(exc):
+    """Return (status_code, retryable, retry_after) for an exception from the client"""
+    from openai import APIConnectionError, APIStatusError
+    
+    if isinstance(exc, APIStatusError):
+        status_code = exc.status_code
+        return status_code, status_code in RETRYABLE_STATUS_CODES, parse_retry_after(exc.response.headers)
+    if isinstance(exc, APIConnectionError):
+        return None, True, None
+    return None, False, None
+
+def reached_model(exc):
+    """Whether a failed request got as far as the model (a timeout or a cut-off stream), so its prompt counts"""
+    from openai import APITimeoutError
+    
+    return isinstance(exc, (APITimeoutError, DeadlineExceeded))
+
+def run_limited(attempt, claim, estimated_tokens, prompt_tokens):
+    """Run `attempt(claim)` in its own slot of the shared limiter.
+    
+    The slot is held until the attempt ends, even after another attempt
+    has won, and its token reservation is settled with what this attempt
+    used: its reported usage, else its prompt if the request reached the
+    model (see reached_model), else nothing.
+    """
+    limiter = request_limiter
+    limiter.acquire(estimated_tokens)
+    used = 0
+    try:
+        result = attempt(claim)
+        used = getattr(result[1], "total_tokens", None)
+        return result
+    except HedgeLost as e:
+        used = getattr(e.usage, "total_tokens", None) or (prompt_tokens if e.sent else 0)
+        raise
+    except Exception as e:
+        used = prompt_tokens if reached_model(e) else 0
+        raise
+    finally:
+        limiter.release()
+        limiter.settle(estimated_tokens, used)
+
+def call_with_retries(request, can_retry=lambda: True, stats=None, deadline=None):
+    """Run `request()`, retrying transient failures.
+
+    `request` performs one API call under the shared limiter (see
+    run_limited) and returns (content, usage). Rate-limit and 5xx
+    responses are retried with exponential backoff and jitter, honouring
+    Retry-After; a 429 also pauses the shared limiter so other workers
+    back off too. No retry is started that would end past `deadline` (a
+    time.monotonic() value). Returns the content or a QueryFailure. If
+    `stats` is a dict it receives the number of attempts and the reported
+    usage.
+    """
+    attempt = 0
+    stats = {} if stats is None else stats
+    
+    while True:
+        stats["attempts"] = attempt + 1
+        try:
+            content, usage = request()
+        except Exception as e:
+            status_code, retryable, retry_after = classify_error(e)
+            if not retryable or attempt >= MAX_RETRIES or not can_retry():
+                return QueryFailure(str(e), status_code, retryable, attempt + 1)
+            delay = backoff_delay(attempt, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS, retry_after)
+            if deadline and time.monotonic() + delay >= deadline:
+                return QueryFailure(f"{e} (section deadline reached)", status_code, retryable, attempt + 1)
+            if status_code == 429:
+                request_limiter.pause(delay)
+            attempt += 1
+            time.sleep(delay)
+            continue
+        
+        stats["usage"] = usage
+        return content
+
+def time_left(deadline):
+    """Seconds until `deadline`, as a request timeout of at least one second"""
+    return max(1.0, deadline - time.monotonic())
+
+def hedge_delay(hedge_key):
+    """Seconds after which a call under `hedge_key` is hedged, or None.
+
+    Hedging needs HEDGE_REQUESTS and HEDGE_MIN_SAMPLES observed latencies;
+    the delay is their p95, but never below HEDGE_MIN_SECONDS.
+    """
+    if not HEDGE_REQUESTS or hedge_key is None:
+        return None
+    p95 = attempt_latency.percentile(hedge_key, 95, HEDGE_MIN_SAMPLES)
+    return max(p95, HEDGE_MIN_SECONDS) if p95 is not None else None
+
+def hedged_call(attempt, hedge_after, estimated_tokens=0, prompt_tokens=0, hedge_key=None):
+    """Run `attempt(claim)`, racing a duplicate if it has not claimed within `hedge_after` seconds.
+    
+    An attempt calls `claim()` once it has output to commit (its first
+    streamed token, or its whole response) and must call it before
+    returning (content, usage). Only the first caller gets True; the other
+    attempt should close its request and raise HedgeLost. Each attempt
+    runs in its own limiter slot (see run_limited). The time from the
+    first attempt's start to the winning claim is added to `hedge_key`'s
+    latency window whichever attempt wins, so slow calls keep counting
+    towards the p95. Returns (result, hedged).
+    """
+    started = time.monotonic()
+    lock = threading.Lock()
+    winner = []
+    outcomes = queue.Queue()
+    
+    def claim_for(index):
+        def claim():
+            with lock:
+                first = not winner
+                if first:
+                    winner.append(index)
+                won = winner[0] == index
+            if first and hedge_key is not None:
+                attempt_latency.add(hedge_key, time.monotonic() - started)
+            return won
+        return claim
+    
+    if not hedge_after:
+        return run_limited(attempt, claim_for(0), estimated_tokens, prompt_tokens), False
+    
+    def run(index, attempt):
+        try:
+            outcomes.put((index, run_limited(attempt, claim_for(index), estimated_tokens, prompt_tokens), None))
+        except BaseException as e:
+            outcomes.put((index, None, e))
+    
+    def duplicate(claim):
+        with lock:
+            decided = bool(winner)
+        if decided:
+            # The first attempt answered while this one waited for capacity
+            raise HedgeLost(sent=False)
+        return attempt(claim)
+    
+    threading.Thread(target=run, args=(0, attempt), daemon=True).start()
+    running = 1
+    try:
+        outcome = outcomes.get(timeout=hedge_after)
+    except queue.Empty:
+        with lock:
+            claimed = bool(winner)
+        if not claimed:
+            threading.Thread(target=run, args=(1, duplicate), daemon=True).start()
+            running += 1
+        outcome = outcomes.get()
+    hedged = running > 1
+    
+    while True:
+        index, result, error = outcome
+        running -= 1
+        if error is None:
+            return result, hedged
+        # A failure only counts if it came from the winner or nothing else is left
+        if running == 0 or (winner and winner[0] == index):
+            raise error
+        outcome = outcomes.get()
+
+def query_perplexity(client, prompt, model=DEFAULT_MODEL, max_tokens=MAX_TOKENS, temperature=DEFAULT_TEMPERATURE,
+                     response_format=None, stats=None, deadline=None, hedge_key=None):
+    """Query Perplexity API, returning the content or a QueryFailure.
+
+    `deadline` (a time.monotonic() value, default SECTION_DEADLINE_SECONDS
+    from now) bounds the call including retries. `hedge_key` names the
+    latency series used to decide when to hedge (see hedged_call); a losing
+    request still runs to the end, in its own limiter slot, since it has
+    been generated and billed before its response arrives.
+    """
+    if not client:
+        return QueryFailure("API key not configured")
+    
+    extra = {"response_format": response_format} if response_format else {}
+    stats = {} if stats is None else stats
+    deadline = deadline or time.monotonic() + SECTION_DEADLINE_SECONDS
+    
+    def attempt(claim):
+        response = client.chat.completions.create(
+            model=model,
+            messages=build_messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=time_left(deadline),
+            **extra
+        )
+        usage = getattr(response, "usage", None)
+        if not claim():
+            # Already generated and billed; its usage is charged to it
+            raise HedgeLost(usage)
+        return response.choices[0].message.content, usage
+    
+    def request():
+        result, hedged = hedged_call(attempt, hedge_delay(hedge_key), estimate_tokens(prompt, max_tokens),
+                                     estimate_tokens(prompt, 0), hedge_key)
+        stats["hedged"] = stats.get("hedged", False) or hedged
+        return result
+    
+    return call_with_retries(request, stats=stats, deadline=deadline)
+
+def query_perplexity_stream(client, prompt, on_token, model=DEFAULT_MODEL, max_tokens=MAX_TOKENS,
+                            temperature=DEFAULT_TEMPERATURE, stats=None, deadline=None, hedge_key=None):
+    """Stream a Perplexity completion, passing each text delta to on_token.
+
+    Returns the complete text, or a QueryFailure like query_perplexity. A
+    failed stream is only retried if no text has been emitted yet. When
+    hedging, attempts race to their first token and the loser's stream is
+    closed; a stream still running at `deadline` is cut off.
+    """
+    if not client:
+        return QueryFailure("API key not configured")
+    
+    stats = {} if stats is None else stats
+    deadline = deadline or time.monotonic() + SECTION_DEADLINE_SECONDS
+    emitted = []
+    
+    def attempt(claim):
+        chunks = []
+        usage = None
+        stream = client.chat.completions.create(
+            model=model,
+            messages=build_messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            timeout=time_left(deadline)
+        )
+        try:
+            for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise DeadlineExceeded("section deadline reached while streaming")
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not chunks and not claim():
+                        raise HedgeLost()
+                    chunks.append(delta)
+                    emitted.append(len(delta))
+                    on_token(delta)
+        finally:
+            stream.close()
+        if not chunks and not claim():
+            raise HedgeLost()
+        return "".join(chunks), usage
+    
+    def request():
+        result, hedged = hedged_call(attempt, hedge_delay(hedge_key), estimate_tokens(prompt, max_tokens),
+                                     estimate_tokens(prompt, 0), hedge_key)
+        stats["hedged"] = stats.get("hedged", False) or hedged
+        return result
+    
+    return call_with_retries(request, can_retry=lambda: not emitted, stats=stats, deadline=deadline)
+
+def query_section(client, section_key, ticker, date, fast=False, cache=None, use_cache=True, on_token=None, upstream=None,
+                  previous=None, documents=None, calls=None):
+    """Query one analysis section, serving fresh cached responses when available.
+
+    The model, output budget and temperature come from route_for(); `fast`
+    selects the fast dossier tier. `cache` is an optional ResponseCache; with `use_cache=False` it is only
+    written to, not read. When `on_token` is given the completion is streamed
+    and each text delta is passed to it; a cache hit is delivered as a
+    single delta. Concurrent identical queries are coalesced into one
+    upstream call through `inflight_queries`. SECTOR_SECTIONS of tickers
+    with a known sector use a sector-wide prompt, so peers share one call.
+    
+    `previous` is an optional (content, date) pair from an earlier run. The
+    model is then only asked for material changes since that run, and the
+    answer is merged into the earlier text (see merge_delta).
+    
+    `documents` is an optional DocumentIndex; the top-ranked excerpts of
+    filings uploaded for the ticker are added to the prompts of the
+    sections it has queries for. If `calls` is a list, the metrics record
+    of this query is appended to it.
+    """
+    started = time.monotonic()
+    route = route_for(section_key, fast)
+    model = route["model"]
+    sector = sector_for(ticker) if section_key in SECTOR_SECTIONS else None
+    if sector:
+        # Keyed by sector with the date kept in the fingerprint: one study per sector per day
+        subject, cache_date = sector_subject(sector), None
+        prompt = generate_sector_prompt(section_key, sector, date)
+        previous = None
+    elif previous:
+        subject, cache_date = ticker, None
+        prompt = generate_delta_prompt(section_key, ticker, date, previous[0], previous[1], upstream)
+        route = dict(route, max_tokens=min(route["max_tokens"], DELTA_MAX_TOKENS))
+    else:
+        subject, cache_date = ticker, date
+        prompt = generate_section_prompt(section_key, ticker, date, upstream)
+    
+    excerpts = documents.excerpts(ticker, section_key) if documents and not sector else []
+    if excerpts:
+        prompt = f"{prompt}\n\n{format_document_context(ticker, excerpts)}"
+    
+    if cache and use_cache:
+        cached = cache.get(section_key, subject, model, prompt, cache_date)
+        if cached is not None:
+            record = metrics.record_call(section_key, ticker, model, time.monotonic() - started, cache_status="hit",
+                                         tier=route["tier"])
+            if calls is not None:
+                calls.append(record)
+            if on_token:
+                on_token(cached)
+            return merge_delta(previous[0], cached, previous[1], date) if previous else cached
+    
+    stats = {}
+    
+    def fetch(emit):
+        if on_token:
+            content = query_perplexity_stream(client, prompt, emit, model, route["max_tokens"], route["temperature"],
+                                              stats=stats, hedge_key=(section_key, model, "first_token"))
+        else:
+            content = query_perplexity(client, prompt, model, route["max_tokens"], route["temperature"], stats=stats,
+                                       hedge_key=(section_key, model, "response"))
+        if cache and not is_failure(content):
+            cache.set(section_key, subject, model, prompt, content, cache_date)
+        return content
+    
+    flight_key = make_cache_key(section_key, subject, model, prompt, cache_date)
+    content, shared = inflight_queries.do(flight_key, fetch, on_token)
+    
+    status = "coalesced" if shared else cache_status(cache, use_cache)
+    record_query_metrics(section_key, ticker, model, started, content, stats, status,
+                         "delta" if previous else route["tier"], calls)
+    if previous and not is_failure(content):
+        return merge_delta(previous[0], content, previous[1], date)
+    return content
+
+def cache_status(cache, use_cache):
+    """Describe how the cache was consulted for a query that went upstream"""
+    if not cache:
+        return "off"
+    return "miss" if use_cache else "bypass"
+
+def record_query_metrics(section_key, ticker, model, started, content, stats, status, tier="standard", calls=None):
+    """Record metrics for a query that reached the API, also appending the record to `calls` if given"""
+    failed = is_failure(content)
+    record = metrics.record_call(
+        section_key, ticker, model, time.monotonic() - started,
+        usage=stats.get("usage"),
+        retries=max(0, stats.get("attempts", 1) - 1),
+        cache_status=status,
+        error=content.message if failed else None,
+        tier=tier,
+        content=None if failed else content,
+        hedged=stats.get("hedged", False)
+    )
+    if calls is not None:
+        calls.append(record)
+
+def summarize_section(content, max_chars=UPSTREAM_SUMMARY_CHARS):
+    """Condense a section's markdown into its headings and data-bearing lines"""
+    lines = []
+    for line in content.splitlines():
+        line = re.sub(r"\[\d+\]", "", line).strip()
+        if not line or set(line) <= set("|-: "):
+            continue
+        if line.startswith("#") or re.search(r"\d", line):
+            lines.append(re.sub(r"\s+", " ", line))
+    
+    summary = "\n".join(lines)
+    if len(summary) > max_chars:
+        summary = summary[:max_chars].rsplit("\n", 1)[0] + "\n..."
+    return summary
+
+def format_upstream_context(upstream):
+    """Render upstream section summaries as a prompt block"""
+    titles = {key: title for title, key in SECTIONS}
+    parts = [
+        "Findings from earlier sections of this dossier are below. Treat them as your primary evidence, "
+        "keep your conclusions consistent with them, and search the web only to verify or fill gaps."
+    ]
+    for key, summary in upstream.items():
+        parts.append(f"### {titles.get(key, key)}\n{summary}")
+    return "\n\n".join(parts)
+
+def format_document_context(ticker, excerpts):
+    """Render excerpts of uploaded filings as a prompt block"""
+    parts = [
+        f"Excerpts from filings uploaded for {ticker} are below, selected for this analysis. Base your answer on "
+        "them first, cite them as [document, p. N], and search the web only for what they do not cover."
+    ]
+    for excerpt in excerpts:
+        parts.append(f"### {excerpt['name']}, p. {excerpt['page']}\n{excerpt['text']}")
+    return "\n\n".join(parts)
+
+def generate_section_prompt(section_key, ticker, date, upstream=None):
+    """Generate specific prompts for each analysis section.
+
+    `upstream` maps dependency section keys to compact summaries of their
+    output, which are appended so the model can build on them.
+    """
+    prompt = _section_prompt(section_key, ticker, date)
+    if upstream:
+        prompt = f"{prompt}\n\n{format_upstream_context(upstream)}"
+    return prompt
+
+def section_base_context(ticker, date):
+    """Opening instruction shared by every section prompt"""
+    return f"Analyze {ticker} stock as of {date}. Provide current, factual data with sources."
+
+def sector_subject(sector):
+    """Cache and coalescing subject for a sector-wide section"""
+    return f"SECTOR:{sector.upper()}"
+
+def generate_sector_prompt(section_key, sector, date):
+    """Section prompt about the Indian `sector` as a whole instead of one company"""
+    base_context = section_base_context(sector, date)
+    sector_context = f"Analyze the Indian {sector} sector as of {date}. Provide current, factual data with sources."
+    return _section_prompt(section_key, sector, date).replace(base_context, sector_context)
+
+def generate_delta_prompt(section_key, ticker, date, previous, previous_date, upstream=None):
+    """Prompt asking only for material changes to a section since an earlier run"""
+    titles = {key: title for title, key in SECTIONS}
+    prompt = textwrap.dedent(f"""
+        {section_base_context(ticker, date)}
+        
+        Below are the key points of our "{titles.get(section_key, section_key)}" analysis of {ticker} from {previous_date}.
+        Report only material changes since {previous_date}: new results, filings or announcements,
+        revised figures, changed guidance, ratings or targets, and any earlier point that no longer holds.
+        Use a short bullet list with dates and specific numbers, each marked new, updated or no longer valid.
+        Do not repeat unchanged points. If nothing material has changed, reply exactly "{NO_MATERIAL_CHANGE}".
+        
+        ### Previous analysis ({previous_date})
+    """).strip()
+    prompt = f"{prompt}\n{summarize_section(strip_delta(previous), DELTA_CONTEXT_CHARS)}"
+    if upstream:
+        prompt = f"{prompt}\n\n{format_upstream_context(upstream)}"
+    return prompt
+
+def strip_delta(content):
+    """Remove a change block added by merge_delta, leaving the underlying analysis"""
+    if content.startswith(DELTA_HEADING) and DELTA_SEPARATOR in content:
+        return content.split(DELTA_SEPARATOR, 1)[1]
+    return content
+
+def merge_delta(previous, delta, previous_date, date):
+    """Put a delta response on top of the earlier section text it updates"""
+    changes = delta.strip()
+    if NO_MATERIAL_CHANGE in changes.upper()[:len(NO_MATERIAL_CHANGE) + 20]:
+        changes = "No material change."
+    return f"{DELTA_HEADING} {previous_date} (as of {date})\n{changes}{DELTA_SEPARATOR}{strip_delta(previous)}"
+
+def section_diff(previous, current, previous_date="previous", date="current"):
+    """Unified line diff between two versions of a section"""
+    return "\n".join(difflib.unified_diff(
+        str(previous).splitlines(), str(current).splitlines(),
+        fromfile=previous_date, tofile=date, lineterm="", n=1
+    ))
+
+def generate_financials_prompt(ticker, date):
+    """Prompt asking for all FINANCIAL_SECTIONS in one JSON response"""
+    base_context = section_base_context(ticker, date)
+    parts = [
+        base_context,
+        "Collect the last 5 years of income statement, balance sheet and cash flow data once, "
+        "then use it to write all four analyses below.",
+        "Respond with a single JSON object with exactly these keys. Each value must be a detailed "
+        "markdown string (tables allowed) covering the listed points:",
+    ]
+    for key in FINANCIAL_SECTIONS:
+        instructions = textwrap.dedent(_section_prompt(key, ticker, date).replace(base_context, "")).strip()
+        parts.append(f'"{key}":\n{instructions}')
+    return "\n\n".join(parts)
+
+FINANCIALS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "schema": {
+            "type": "object",
+            "properties": {key: {"type": "string"} for key in FINANCIAL_SECTIONS},
+            "required": FINANCIAL_SECTIONS,
+        }
+    },
+}
+
+def parse_financials_response(text):
+    """Split a combined financials response into section texts, or None if malformed"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    
+    if not isinstance(data, dict):
+        return None
+    if not all(isinstance(data.get(key), str) and data[key].strip() for key in FINANCIAL_SECTIONS):
+        return None
+    return {key: data[key].strip() for key in FINANCIAL_SECTIONS}
+
+def query_financial_sections(client, ticker, date, model=DEFAULT_MODEL, cache=None, use_cache=True, calls=None):
+    """Fetch all FINANCIAL_SECTIONS with one structured call.
+
+    Returns a dict of section texts, or None if the request failed or its
+    response could not be parsed, in which case the caller should fall
+    back to the individual section prompts rather than lose all four.
+    """
+    started = time.monotonic()
+    prompt = generate_financials_prompt(ticker, date)
+    
+    if cache and use_cache:
+        cached = {key: cache.get(key, ticker, model, prompt, date) for key in FINANCIAL_SECTIONS}
+        if all(content is not None for content in cached.values()):
+            record = metrics.record_call("financials_combined", ticker, model, time.monotonic() - started,
+                                         cache_status="hit")
+            if calls is not None:
+                calls.append(record)
+            return cached
+    
+    stats = {}
+    
+    def fetch(emit):
+        content = query_perplexity(
+            client, prompt, model,
+            max_tokens=COMBINED_FINANCIALS_MAX_TOKENS,
+            response_format=FINANCIALS_RESPONSE_FORMAT,
+            stats=stats,
+            hedge_key=("financials_combined", model, "response")
+        )
+        sections = None if is_failure(content) else parse_financials_response(content)
+        if sections and cache:
+            for key, text in sections.items():
+                cache.set(key, ticker, model, prompt, text, date)
+        return content
+    
+    flight_key = make_cache_key("financials_combined", ticker, model, prompt, date)
+    content, shared = inflight_queries.do(flight_key, fetch)
+    
+    status = "coalesced" if shared else cache_status(cache, use_cache)
+    record_query_metrics("financials_combined", ticker, model, started, content, stats, status, calls=calls)
+    if is_failure(content):
+        return None
+    return parse_financials_response(content)
+
+def _section_prompt(section_key, ticker, date):
+    """Return the base prompt for a section"""
+    
+    base_context = section_base_context(ticker, date)
+    
+    prompts = {
+        "sectoral_analysis": f"""
+        {base_context}
+        
+        Provide a comprehensive sectoral analysis covering:
+        1. Current sector trends and growth drivers
+        2. Industry structure and competitive dynamics
+        3. Recent regulatory changes and policy impacts
+        4. Technological disruptions affecting the sector
+        5. Upcoming government actions or regulatory changes
+        6. Macroeconomic factors influencing the industry
+        
+        Focus on both positive and negative triggers with specific examples and timeframes.
+        """,
+        
+        "news_competition": f"""
+        {base_context}
+        
+        Analyze recent news and competitive landscape:
+        1. Key news from the past 30 days affecting {ticker}
+        2. Major competitor developments and announcements
+        3. Market share changes and competitive positioning
+        4. Industry-wide developments impacting all players
+        5. Regulatory news affecting the company/sector
+        
+        Categorize news as positive, negative, or neutral with reasoning.
+        """,
+        
+        "financial_pl": f"""
+        {base_context}
+        
+        Conduct deep P&L analysis for the last 5 years:
+        1. Revenue trends, growth rates, and seasonality
+        2. Gross margin evolution and cost structure changes
+        3. Operating leverage and efficiency metrics
+        4. One-time items and extraordinary expenses
+        5. Earnings quality and sustainability assessment
+        6. Forward-looking revenue and margin implications
+        
+        Provide specific numbers, percentages, and year-over-year comparisons.
+        """,
+        
+        "financial_bs": f"""
+        {base_context}
+        
+        Analyze balance sheet strength over 5 years:
+        1. Asset quality and composition changes
+        2. Debt levels, leverage ratios, and debt maturity profile
+        3. Working capital trends and efficiency
+        4. Capital allocation patterns
+        5. Return on assets and equity trends
+        6. Balance sheet risks and strengths vs sector norms
+        
+        Include specific financial ratios and benchmark comparisons.
+        """,
+        
+        "financial_cf": f"""
+        {base_context}
+        
+        Examine cash flow patterns for 5 years:
+        1. Operating cash flow trends and quality
+        2. Free cash flow generation and consistency
+        3. Capital expenditure patterns and efficiency
+        4. Financing activities and dividend policy
+        5. Cash conversion cycle analysis
+        6. Any unusual cash flow patterns or anomalies
+        
+        Focus on cash flow sustainability and capital allocation effectiveness.
+        """,
+        
+        "ratio_analysis": f"""
+        {base_context}
+        
+        Provide comprehensive ratio analysis in tabular format:
+        Create a table with columns: Ratio | Current | 5-Year Trend | Industry Average | Analysis
+        
+        Cover these key ratios:
+        - Profitability ratios (ROE, ROA, ROCE, Gross/Operating/Net margins)
+        - Liquidity ratios (Current, Quick, Cash ratios)
+        - Leverage ratios (Debt-to-equity, Interest coverage, Debt service)
+        - Efficiency ratios (Asset turnover, Inventory turnover, Receivables turnover)
+        - Valuation ratios (P/E, P/B, EV/EBITDA, Price-to-Sales)
+        
+        Explain trends, drivers, and management influence for each.
+        """,
+        
+        "management_eval": f"""
+        {base_context}
+        
+        Evaluate management quality and track record:
+        1. CEO and key executives' background and tenure
+        2. Strategic execution capability and past performance
+        3. Crisis management and adaptability
+        4. Capital allocation decisions and effectiveness
+        5. Board composition and independence
+        6. Management compensation alignment with performance
+        7. Transparency in communications and reporting
+        8. Any governance concerns or red flags
+        
+        Provide specific examples and track record evidence.
+        """,
+        
+        "management_guidance": f"""
+        {base_context}
+        
+        Analyze management guidance history and credibility:
+        1. Historical guidance vs actual performance over past 3 years
+        2. Quality and specificity of current forward guidance
+        3. Management's conservatism vs aggressiveness in projections
+        4. Sector comparison of guidance accuracy
+        5. Recent changes in guidance and explanations provided
+        6. Credibility assessment based on delivery track record
+        
+        Include specific guidance figures and actual outcomes.
+        """,
+        
+        "investor_presentations": f"""
+        {base_context}
+        
+        Review investor presentations from the last 12 quarters:
+        1. Key strategic initiatives and business updates
+        2. Product launches and market expansion plans
+        3. Segmental performance and revenue mix evolution
+        4. EBITDA trends and margin guidance
+        5. Capital expenditure plans and utilization
+        6. Management's strategic pivots and rationale
+        7. Performance against previously stated targets
+        
+        Extract key themes and assess execution against promises.
+        """,
+        
+        "conference_calls": f"""
+        {base_context}
+        
+        Summarize recent conference calls (last 12 quarters):
+        1. Management tone and confidence levels
+        2. Growth outlook and new product pipeline
+        3. Margin trends and cost management initiatives
+        4. Capacity utilization and expansion plans
+        5. M&A commentary and corporate actions
+        6. Competitive positioning and market share discussions
+        7. Guidance changes and reasoning
+        
+        Compare statements with actual delivery and flag inconsistencies.
+        """,
+        
+        "community_analysis": f"""
+        {base_context}
+        
+        Analyze investor community discussions (last 90 days):
+        1. ValuePickr forum discussions and key insights
+        2. Reddit and other investment community sentiment
+        3. Common concerns and bullish/bearish arguments
+        4. Unique insights not found in mainstream analysis
+        5. Consensus opinion and contrarian viewpoints
+        6. Risk factors highlighted by retail investors
+        
+        Summarize key themes and assess credibility of community insights.
+        """,
+        
+        "annual_report": f"""
+        {base_context}
+        
+        Conduct forensic analysis of the latest annual report:
+        1. Accounting policy changes and their impact
+        2. Related party transactions and potential conflicts
+        3. Contingent liabilities and off-balance-sheet items
+        4. Audit qualifications or concerns raised
+        5. Management discussion and forward-looking statements
+        6. Hidden gems or strategic insights in disclosures
+        7. Any red flags or unusual accounting treatments
+        
+        Focus on items that might not be evident in standard financial analysis.
+        """,
+        
+        "integrity_matrix": f"""
+        {base_context}
+        
+        Create Management Integrity Matrix with scores (1-10) and evidence:
+        
+        1. Guidance Accuracy (Score/10): Historical accuracy of forecasts
+        2. Delivery vs Promise (Score/10): Execution of stated plans
+        3. Transparency & Disclosure (Score/10): Quality of communication
+        4. Governance Flags (Score/10): Any red flags or concerns
+        5. Overall Integrity (Score/10): Combined assessment
+        
+        For each KPI, provide:
+        - Specific score out of 10
+        - 2-3 concrete examples as evidence
+        - Reasoning for the score assigned
+        - Recent developments affecting the score
+        """,
+        
+        "growth_triggers": f"""
+        {base_context}
+        
+        Identify key growth catalysts and triggers:
+        1. Operating leverage potential and scalability
+        2. Capacity utilization trends and expansion benefits
+        3. Recent acquisitions and their revenue contribution
+        4. New product launches and market penetration
+        5. Market expansion opportunities (geographic/segment)
+        6. Technology upgrades and digital transformation impact
+        7. Regulatory changes benefiting the company
+        
+        Quantify potential impact and provide realistic timelines.
+        """,
+        
+        "valuation_analysis": f"""
+        {base_context}
+        
+        Comprehensive valuation analysis:
+        1. Current valuation ratios: P/E, P/S, PEG, P/B, EV/EBITDA
+        2. Peer comparison with 3-4 closest competitors
+        3. Historical valuation trends (5-year range)
+        4. Sector average comparisons
+        5. DCF-based intrinsic value estimate
+        6. Sum-of-parts valuation if applicable
+        7. Assessment: Overvalued, fairly valued, or undervalued
+        
+        Provide specific numbers, peer names, and reasoning for valuation conclusion.
+        """,
+        
+        "scenario_analysis": f"""
+        {base_context}
+        
+        Create three detailed scenarios:
+        
+        BULL CASE:
+        - Key catalysts and positive triggers
+        - Revenue/margin upside potential
+        - Target price and timeline
+        - Probability assessment
+        - Investment strategy recommendations
+        
+        BASE CASE:
+        - Realistic growth assumptions
+        - Steady-state margins and returns
+        - Fair value estimate
+        - Most likely outcome
+        - Prudent positioning strategy
+        
+        BEAR CASE:
+        - Key risks and negative catalysts
+        - Downside scenarios and impact
+        - Worst-case target price
+        - Risk mitigation strategies
+        - Exit triggers
+        
+        Include specific price targets and probability weightings.
+        """,
+        
+        "final_recommendation": f"""
+        {base_context}
+        
+        Provide final investment recommendation:
+        1. Overall investment thesis (Buy/Hold/Sell)
+        2. Key supporting arguments (3-4 main points)
+        3. Target price and time horizon
+        4. Risk-reward assessment
+        5. Position sizing recommendations
+        6. Key monitoring triggers and metrics
+        7. Conditions that would change the recommendation
+        
+        Structure as executive summary suitable for investment committee presentation.
+        Ensure recommendation is clearly justified based on all previous analysis.
+        """
+    }
+    
+    return prompts.get(section_key, f"{base_context}\n\nProvide detailed analysis for {section_key}")
+
+def upstream_summaries(results, dependencies):
+    """Summarize the successful upstream results a dependent section builds on"""
+    return {
+        dep: summarize_section(results[dep])
+        for dep in dependencies
+        if dep in results and not is_failure(results[dep])
+    }
+
+def refresh_section(client, section_key, ticker, date, results, fast=False, cache=None, documents=None):
+    """Regenerate one section of an existing dossier, bypassing cached reads.
+
+    Dependency summaries are taken from `results`, so a refreshed
+    final_recommendation still builds on the rest of the dossier.
+    """
+    upstream = upstream_summaries(results, SECTION_DEPENDENCIES.get(section_key, []))
+    return query_section(client, section_key, ticker, date, fast, cache=cache, use_cache=False, upstream=upstream,
+                         documents=documents)
+
+def run_sections_concurrently(client,
+                              ticker,
+                              date,
+                              sections=SECTIONS,
+                              max_workers=DEFAULT_MAX_WORKERS,
+                              on_section_done=None,
+                              cache=None,
+                              use_cache=True,
+                              on_section_token=None,
+                              combine_financials=COMBINE_FINANCIALS,
+                              fast=False,
+                              completed=None,
+                              previous=None,
+                              deadline=None,
+                              documents=None,
+                              on_late_finished=None,
+                              calls=None):
+    """Query sections in parallel on a bounded thread pool, respecting dependencies.
+
+    A section is submitted once every section it depends on (per
+    SECTION_DEPENDENCIES, limited to those being run) has finished, and
+    receives compact summaries of their output in its prompt. Sections that
+    feed others are started first to shorten the critical path. With
+    `combine_financials`, FINANCIAL_SECTIONS share one structured call and
+    fall back to their own prompts if it fails or cannot be parsed. `fast`
+    routes eligible sections to the lighter model (see route_for).
+
+    `completed` holds results from an earlier, interrupted run; those
+    sections are not queried again but still feed their dependents.
+
+    `previous` maps section keys to (content, date) from an earlier run and
+    switches those sections to delta refresh (see query_section); the
+    combined financials call is skipped for them. `documents` is passed on
+    to query_section for excerpts of uploaded filings. If `calls` is a
+    list it receives the metrics record of every query this run makes.
+
+    Workers report back through a queue so that progress and token callbacks
+    run on the calling thread. `on_section_done(key, content, completed,
+    total)` fires as each section finishes. Passing `on_section_token`
+    switches every section to streaming mode. The returned dict follows the
+    order of `sections` regardless of completion order.
+
+    With a `deadline` in seconds, sections not finished by then come back
+    as PendingSection and the rest of the schedule carries on in a
+    background thread, which then makes the callbacks as sections land and
+    calls `on_late_finished()` when it ends, however it ends.
+    """
+    keys = [key for _, key in sections]
+    pending = {key: [dep for dep in SECTION_DEPENDENCIES.get(key, []) if dep in keys] for key in keys}
+    upstream_keys = {dep for deps in pending.values() for dep in deps}
+    results = {key: content for key, content in (completed or {}).items() if key in pending}
+    for key in results:
+        del pending[key]
+    previous = previous or {}
+    events = queue.Queue()
+    
+    def run_section(key, upstream):
+        on_token = None
+        if on_section_token:
+            on_token = lambda text: events.put(("token", key, text))
+        try:
+            content = query_section(client, key, ticker, date, fast, cache=cache, use_cache=use_cache,
+                                    on_token=on_token, upstream=upstream, previous=previous.get(key),
+                                    documents=documents, calls=calls)
+        except Exception as e:
+            content = QueryFailure(str(e))
+        events.put(("done", key, content))
+    
+    def run_financials():
+        try:
+            contents = query_financial_sections(client, ticker, date, cache=cache, use_cache=use_cache, calls=calls)
+        except Exception:
+            contents = None
+        events.put(("financials", None, contents))
+    
+    def record(key, content):
+        results[key] = content
+        if on_section_done:
+            on_section_done(key, content, len(results), len(keys))
+    
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    in_flight = 0
+    financials_group = {}
+    
+    def submit_ready():
+        ready = [key for key, deps in pending.items() if all(dep in results for dep in deps)]
+        for key in sorted(ready, key=lambda k: k not in upstream_keys):
+            upstream = upstream_summaries(results, pending.pop(key))
+            executor.submit(run_section, key, upstream)
+        return len(ready)
+    
+    def drain(expires=None):
+        """Handle worker events until every section is done; False if `expires` passes first"""
+        nonlocal in_flight
+        while len(results) < len(keys):
+            if in_flight == 0:
+                raise ValueError(f"Circular section dependencies: {sorted(pending)}")
+            
+            try:
+                timeout = None if expires is None else max(0, expires - time.monotonic())
+                kind, key, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                return False
+            if kind == "token":
+                on_section_token(key, payload)
+                continue
+            
+            in_flight -= 1
+            if kind == "financials":
+                if payload is None:
+                    # Failed or unparseable combined call: run the individual prompts instead
+                    pending.update(financials_group)
+                else:
+                    for key, content in payload.items():
+                        if on_section_token and not is_failure(content):
+                            on_section_token(key, content)
+                        record(key, content)
+            else:
+                record(key, payload)
+            in_flight += submit_ready()
+        return True
+    
+    try:
+        if combine_financials and all(key in pending and not pending[key] and key not in previous
+                                      for key in FINANCIAL_SECTIONS):
+            financials_group = {key: pending.pop(key) for key in FINANCIAL_SECTIONS}
+            executor.submit(run_financials)
+            in_flight += 1
+        
+        in_flight += submit_ready()
+        finished = drain(time.monotonic() + deadline if deadline else None)
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    
+    if finished:
+        executor.shutdown()
+        return {key: results[key] for key in keys}
+    
+    # Past the deadline: return what is ready and finish the schedule in the background
+    snapshot = {key: results.get(key, PendingSection()) for key in keys}
+    
+    def finish_late():
+        try:
+            drain()
+        except RuntimeError:
+            # The pool takes no new work once the interpreter is exiting; what is left stays pending
+            if threading.main_thread().is_alive():
+                raise
+        finally:
+            executor.shutdown()
+            if on_late_finished:
+                on_late_finished()
+    
+    threading.Thread(target=finish_late, daemon=True, name=f"late-sections-{ticker}").start()
+    return snapshot
+
+# Default sections for peer comparison, and the size of each table cell
+PEER_SECTIONS = ["ratio_analysis", "valuation_analysis", "growth_triggers", "sectoral_analysis"]
+PEER_CELL_CHARS = 400
+
+def run_peer_comparison(client, tickers, date, section_keys=PEER_SECTIONS, ticker_workers=4,
+                        section_workers=DEFAULT_MAX_WORKERS, cache=None, use_cache=True, fast=False):
+    """Run the same sections for several tickers in parallel.
+
+    Returns {ticker: {section_key: content}} in the order of `tickers`.
+    Dependencies outside `section_keys` are skipped, and SECTOR_SECTIONS of
+    peers in one sector are generated once and shared between them.
+    """
+    sections = [(title, key) for title, key in SECTIONS if key in section_keys]
+    
+    def run(ticker):
+        return run_sections_concurrently(
+            client, ticker, date, sections,
+            max_workers=section_workers,
+            cache=cache,
+            use_cache=use_cache,
+            fast=fast
+        )
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(ticker_workers, len(tickers)))) as executor:
+        return dict(zip(tickers, executor.map(run, tickers)))
+
+def peer_cell(content, max_chars=PEER_CELL_CHARS):
+    """Condense one section into a markdown table cell"""
+    if content is None:
+        return "—"
+    if is_failure(content):
+        return "⚠️ unavailable"
+    summary = re.sub(r"^#+\s*(.+)$", r"**\1**", summarize_section(content, max_chars), flags=re.MULTILINE)
+    return summary.replace("|", "\\|").replace("\n", "<br>")
+
+def peer_comparison_table(comparison, section_keys=PEER_SECTIONS, max_chars=PEER_CELL_CHARS):
+    """Merge peer results into one markdown table: a row per section, a column per ticker"""
+    tickers = list(comparison)
+    titles = {key: title for title, key in SECTIONS}
+    lines = [
+        "| Section | " + " | ".join(tickers) + " |",
+        "|---" * (len(tickers) + 1) + "|",
+    ]
+    for key in section_keys:
+        cells = [peer_cell(comparison[ticker].get(key), max_chars) for ticker in tickers]
+        lines.append(f"| **{titles.get(key, key)}** | " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+def generate_full_report(ticker, results, date):
+    """Generate downloadable markdown report"""
+    sections = [
+        ("Executive Summary", results.get('final_recommendation', 'Not available')),
+        ("Sectoral Trends & Triggers", results.get('sectoral_analysis', 'Not available')),
+        ("News & Competition Analysis", results.get('news_competition', 'Not available')),
+        ("P&L Analysis (5-Year)", results.get('financial_pl', 'Not available')),
+        ("Balance Sheet Analysis (5-Year)", results.get('financial_bs', 'Not available')),
+        ("Cash Flow Analysis (5-Year)", results.get('financial_cf', 'Not available')),
+        ("Ratio Analysis", results.get('ratio_analysis', 'Not available')),
+        ("Management Evaluation", results.get('management_eval', 'Not available')),
+        ("Management Guidance & Delivery", results.get('management_guidance', 'Not available')),
+        ("Investor Presentations", results.get('investor_presentations', 'Not available')),
+        ("Conference Calls Analysis", results.get('conference_calls', 'Not available')),
+        ("Community Analysis", results.get('community_analysis', 'Not available')),
+        ("Annual Report Forensics", results.get('annual_report', 'Not available')),
+        ("Management Integrity Matrix", results.get('integrity_matrix', 'Not available')),
+        ("Growth Triggers", results.get('growth_triggers', 'Not available')),
+        ("Valuation Analysis", results.get('valuation_analysis', 'Not available')),
+        ("Scenario Analysis", results.get('scenario_analysis', 'Not available')),
+    ]
+    
+    parts = [f"# Investment Analysis Report: {ticker}\nGenerated on: {date}\n\n"]
+    parts.extend(f"## {title}\n{content}\n\n---\n\n" for title, content in sections)
+    return "".join(parts)
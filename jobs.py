@@ -0,0 +1,313 @@
+"""Background dossier jobs with persistent, resumable state"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import (
+    ANALYSIS_DEADLINE_SECONDS,
+    COMBINE_FINANCIALS,
+    DEFAULT_MAX_WORKERS,
+    SECTIONS,
+    PendingSection,
+    QueryFailure,
+    is_failure,
+    is_pending,
+    run_sections_concurrently,
+)
+
+DEFAULT_JOBS_PATH = os.getenv("PPLX_JOBS_PATH", os.path.join(".cache", "jobs.sqlite3"))
+DEFAULT_MAX_CONCURRENT_JOBS = int(os.getenv("PPLX_MAX_CONCURRENT_JOBS", "2"))
+
+# Job lifecycle: queued -> running -> done | failed
+ACTIVE_STATUSES = ("queued", "running")
+
+class JobManager:
+    """Runs dossier generation on background threads, independent of any UI session.
+
+    Every job and every finished section is written to SQLite as it
+    completes, so the UI can poll progress and render partial results, and
+    jobs interrupted by a restart resume from their last completed section
+    when the manager starts. Partial streamed text is kept in memory only.
+
+    A job is marked done once the analysis deadline passes; sections still
+    generating are stored as pending and overwritten when they land. The
+    job keeps its slot until then, so late sections still count towards
+    `max_concurrent_jobs`.
+    """
+
+    def __init__(self, client, cache=None, path=DEFAULT_JOBS_PATH, max_concurrent_jobs=DEFAULT_MAX_CONCURRENT_JOBS,
+                 resume=True, ratio_store=None, documents=None, result_store=None):
+        self.client = client
+        self.cache = cache
+        self.ratio_store = ratio_store
+        self.documents = documents
+        self.result_store = result_store
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="dossier-job")
+        self._lock = threading.Lock()
+        self._live_text = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                ticker TEXT NOT NULL,
+                date TEXT NOT NULL,
+                status TEXT NOT NULL,
+                options TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_sections (
+                job_id TEXT NOT NULL,
+                section_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                content TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, section_key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+        """)
+        self._conn.commit()
+
+        if resume:
+            self.resume_interrupted()
+
+    def submit(self, ticker, date, options=None):
+        """Queue a dossier for `ticker` and return its job id.
+
+        The last completed run of the ticker is recorded as the job's
+        `base_job_id`, so results can be compared with it; with the `delta`
+        option, sections are refreshed against that run instead of being
+        regenerated.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        options = dict(options or {})
+        previous = self.latest_run(ticker)
+        options["base_job_id"] = previous["job_id"] if previous else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, 'queued', ?, NULL, ?, ?)",
+                (job_id, ticker, date, json.dumps(options), now, now)
+            )
+            self._conn.commit()
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def resume_interrupted(self):
+        """Requeue jobs left queued or running by a previous process, or done with sections still pending.
+
+        Pending sections are finished by a thread of the process that ran
+        the job, so after a restart nothing else would ever fill them in.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id FROM jobs WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))}) "
+                "OR job_id IN (SELECT job_id FROM job_sections WHERE status = 'pending') ORDER BY created_at",
+                ACTIVE_STATUSES
+            ).fetchall()
+        for (job_id,) in rows:
+            self._set_status(job_id, "queued")
+            self._executor.submit(self._run, job_id)
+        return [job_id for (job_id,) in rows]
+
+    def get(self, job_id):
+        """Return a job record with section progress, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, ticker, date, status, options, error, created_at, updated_at FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            done, pending = self._conn.execute(
+                "SELECT COUNT(*), COUNT(CASE WHEN status = 'pending' THEN 1 END) FROM job_sections WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+
+        job = dict(zip(["job_id", "ticker", "date", "status", "options", "error", "created_at", "updated_at"], row))
+        job["options"] = json.loads(job["options"])
+        job["sections_done"] = done - pending
+        job["sections_pending"] = pending
+        job["sections_total"] = len(SECTIONS)
+        return job
+
+    def recent(self, limit=20):
+        """Return the most recently created jobs, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self.get(job_id) for (job_id,) in rows]
+
+    def latest_run(self, ticker):
+        """Return the most recent completed job for `ticker`, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE ticker = ? AND status = 'done' ORDER BY created_at DESC LIMIT 1",
+                (ticker,)
+            ).fetchone()
+        return self.get(row[0]) if row else None
+
+    def results(self, job_id):
+        """Return the finished sections of a job; failures come back as QueryFailure, late ones as PendingSection.
+
+        Settled jobs are served from the result store when there is one, so
+        repeated renders share one compressed copy instead of re-reading
+        SQLite.
+        """
+        with self._lock:
+            job = self._conn.execute("SELECT ticker, status, updated_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if self.result_store and job:
+            held = self.result_store.get(job[0], job_id)
+            if held is not None:
+                return held
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT section_key, status, content FROM job_sections WHERE job_id = ?", (job_id,)
+            ).fetchall()
+
+        failure_types = {"failed": QueryFailure, "pending": PendingSection}
+        stored = {key: failure_types[status](content) if status in failure_types else content
+                  for key, status, content in rows}
+        results = {key: stored[key] for _, key in SECTIONS if key in stored}
+        settled = job and job[1] not in ACTIVE_STATUSES and not any(status == "pending" for _, status, _ in rows)
+        if self.result_store and settled:
+            with self._lock:
+                # Skip if a section was saved meanwhile; the next read stores the new version
+                updated_at = self._conn.execute("SELECT updated_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if updated_at and updated_at[0] == job[2]:
+                    self.result_store.put(job[0], job_id, results)
+        return results
+
+    def live_text(self, job_id):
+        """Return partial streamed text for sections still being generated"""
+        with self._lock:
+            return dict(self._live_text.get(job_id, {}))
+
+    def save_section(self, job_id, section_key, content):
+        """Store one section's result, e.g. after a manual refresh"""
+        failed = is_failure(content)
+        status = "pending" if is_pending(content) else "failed" if failed else "done"
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_sections VALUES (?, ?, ?, ?, ?)",
+                (job_id, section_key, status, content.message if failed else content, now)
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+            self._conn.commit()
+            self._live_text.get(job_id, {}).pop(section_key, None)
+            job = self._conn.execute("SELECT ticker FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if self.result_store and job:
+                self.result_store.discard(job[0], job_id)
+
+    def mark_pending(self, job_id, section_keys):
+        """Store placeholders for sections still generating, unless they have already landed"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO job_sections VALUES (?, ?, 'pending', ?, ?)",
+                [(job_id, key, PendingSection().message, now) for key in section_keys]
+            )
+            self._conn.commit()
+
+    def ingest_ratios(self, job_id):
+        """Extract a finished job's ratios and scores into the ratio store"""
+        job = self.get(job_id)
+        try:
+            return self.ratio_store.ingest(job["ticker"], job["date"], self.results(job_id), job_id,
+                                           run_at=job["created_at"])
+        except Exception as e:
+            # The dossier itself is fine; keep it done but note why screening lacks it
+            self._set_status(job_id, job["status"], f"Ratio extraction failed: {e}")
+            return 0
+
+    def _set_status(self, job_id, status, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return
+
+        options = job["options"]
+        # Failed sections are retried when a job resumes; finished ones are kept
+        completed = {key: content for key, content in self.results(job_id).items() if not is_failure(content)}
+
+        previous = None
+        base = self.get(options["base_job_id"]) if options.get("delta") and options.get("base_job_id") else None
+        if base:
+            previous = {key: (content, base["date"]) for key, content in self.results(base["job_id"]).items()
+                        if not is_failure(content)}
+        self._set_status(job_id, "running")
+
+        on_section_token = None
+        if options.get("stream"):
+            with self._lock:
+                live = self._live_text.setdefault(job_id, {})
+
+            def on_section_token(key, text):
+                with self._lock:
+                    live[key] = live.get(key, "") + text
+
+        late = threading.Event()
+        late_finished = threading.Event()
+
+        def on_section_done(key, content, done, total):
+            self.save_section(job_id, key, content)
+            if not late.is_set():
+                return
+            # A section that missed the deadline: refresh what screening sees
+            if self.ratio_store:
+                self.ingest_ratios(job_id)
+
+        try:
+            results = run_sections_concurrently(
+                self.client, job["ticker"], job["date"], SECTIONS,
+                max_workers=options.get("max_workers", DEFAULT_MAX_WORKERS),
+                on_section_done=on_section_done,
+                cache=self.cache,
+                use_cache=options.get("use_cache", True),
+                on_section_token=on_section_token,
+                combine_financials=options.get("combine_financials", COMBINE_FINANCIALS),
+                fast=options.get("fast", False),
+                completed=completed,
+                previous=previous,
+                deadline=options.get("deadline", ANALYSIS_DEADLINE_SECONDS),
+                documents=self.documents,
+                on_late_finished=late_finished.set
+            )
+        except Exception as e:
+            self._set_status(job_id, "failed", str(e))
+        else:
+            still_pending = [key for key, content in results.items() if is_pending(content)]
+            if still_pending:
+                late.set()
+                self.mark_pending(job_id, still_pending)
+            all_failed = all(is_failure(content) and not is_pending(content) for content in results.values())
+            self._set_status(job_id, "failed" if all_failed else "done",
+                             "Every section failed" if all_failed else None)
+            if self.ratio_store and not all_failed:
+                self.ingest_ratios(job_id)
+            if still_pending:
+                # Hold the job slot until the late sections land
+                late_finished.wait()
+        with self._lock:
+            self._live_text.pop(job_id, None)
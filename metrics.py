@@ -0,0 +1,248 @@
+"""Per-call latency, token and cost metrics for Perplexity requests"""
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_LOG = os.getenv("PPLX_METRICS_LOG", os.path.join(".cache", "perplexity_calls.jsonl"))
+DEFAULT_HISTORY_SIZE = 5000
+# The call log rotates past this size, keeping this many older files (.1 newest)
+DEFAULT_LOG_MAX_MB = float(os.getenv("PPLX_METRICS_LOG_MB", "20"))
+DEFAULT_LOG_BACKUPS = int(os.getenv("PPLX_METRICS_LOG_BACKUPS", "3"))
+
+# USD per million tokens as (input, output); request fees are not included
+MODEL_PRICING = {
+    "sonar": (1.0, 1.0),
+    "sonar-pro": (3.0, 15.0),
+    "sonar-reasoning": (1.0, 5.0),
+    "sonar-reasoning-pro": (2.0, 8.0),
+}
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimate the token cost of a call in USD, or None for unknown models"""
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return None
+    return (prompt_tokens * pricing[0] + completion_tokens * pricing[1]) / 1_000_000
+
+def quality_signals(content):
+    """Cheap proxies for answer quality: length, numeric data points and citations"""
+    return {
+        "response_chars": len(content),
+        "data_points": len(re.findall(r"\d[\d,.]*%?", content)),
+        "citations": len(set(re.findall(r"\[(\d+)\]", content))),
+    }
+
+class MetricsRecorder:
+    """Thread-safe recorder of per-call metrics.
+
+    Keeps the most recent calls in memory for the UI and appends every call
+    as one JSON line to `log_path` (set it to None to disable the log).
+    Once the log reaches `log_max_bytes` it is rotated like a
+    RotatingFileHandler: renamed to `log_path`.1, older files shifted up
+    and the oldest past `log_backups` deleted, bounding disk use to about
+    (log_backups + 1) * log_max_bytes.
+    """
+
+    def __init__(self, log_path=DEFAULT_METRICS_LOG, history_size=DEFAULT_HISTORY_SIZE,
+                 log_max_bytes=int(DEFAULT_LOG_MAX_MB * 1024 * 1024), log_backups=DEFAULT_LOG_BACKUPS):
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        self.calls = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+        if log_path and os.path.dirname(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    def _rotate_locked(self):
+        """Shift log_path -> .1 -> .2 ..., dropping the oldest; with no backups the log is just truncated"""
+        for index in range(self.log_backups - 1, 0, -1):
+            older = f"{self.log_path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.log_path}.{index + 1}")
+        if self.log_backups > 0:
+            os.replace(self.log_path, f"{self.log_path}.1")
+        else:
+            os.remove(self.log_path)
+
+    def record_call(self, section, ticker, model, wall_time, usage=None, retries=0, cache_status="off", error=None,
+                    tier="standard", content=None, hedged=False):
+        """Record one section query; `usage` is the API usage object, if any.
+
+        Passing the returned `content` adds quality_signals() to the record
+        so routing tiers can be compared on output as well as cost.
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        record = {
+            "timestamp": time.time(),
+            "section": section,
+            "ticker": ticker,
+            "model": model,
+            "tier": tier,
+            "wall_time": round(wall_time, 3),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens),
+            "retries": retries,
+            "hedged": hedged,
+            "cache": cache_status,
+            "status": "failed" if error else "ok",
+            "error": error,
+        }
+        if content is not None:
+            record.update(quality_signals(content))
+
+        with self._lock:
+            self.calls.append(record)
+            if self.log_path:
+                line = json.dumps(record) + "\n"
+                if (self.log_max_bytes and os.path.exists(self.log_path)
+                        and os.path.getsize(self.log_path) + len(line) > self.log_max_bytes):
+                    self._rotate_locked()
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        return record
+
+    def snapshot(self):
+        """Return a copy of the recorded calls, oldest first"""
+        with self._lock:
+            return list(self.calls)
+
+    def summary_by_section(self):
+        """Aggregate recorded calls per section for display"""
+        summary = {}
+        for call in self.snapshot():
+            row = summary.setdefault(call["section"], {
+                "section": call["section"], "calls": 0, "cache_hits": 0, "failures": 0, "retries": 0, "hedges": 0,
+                "total_wall_time": 0.0, "max_wall_time": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cost_usd": 0.0,
+            })
+            row["calls"] += 1
+            row["cache_hits"] += call["cache"] == "hit"
+            row["failures"] += call["status"] == "failed"
+            row["retries"] += call["retries"]
+            row["hedges"] += call.get("hedged", False)
+            row["total_wall_time"] += call["wall_time"]
+            row["max_wall_time"] = max(row["max_wall_time"], call["wall_time"])
+            row["prompt_tokens"] += call["prompt_tokens"]
+            row["completion_tokens"] += call["completion_tokens"]
+            row["cost_usd"] += call["cost_usd"] or 0.0
+
+        for row in summary.values():
+            row["avg_wall_time"] = round(row.pop("total_wall_time") / row["calls"], 3)
+            row["cost_usd"] = round(row["cost_usd"], 4)
+        return list(summary.values())
+
+    def summary_by_tier(self):
+        """Compare latency, cost and quality signals per section, tier and model.
+
+        Only calls that reached the API and succeeded are included, since
+        cache hits and coalesced calls say nothing about the model.
+        """
+        groups = {}
+        for call in self.snapshot():
+            if call["cache"] in ("hit", "coalesced") or call["status"] != "ok":
+                continue
+            key = (call["section"], call.get("tier", "standard"), call["model"])
+            groups.setdefault(key, []).append(call)
+
+        rows = []
+        for (section, tier, model), calls in sorted(groups.items()):
+            count = len(calls)
+            rows.append({
+                "section": section,
+                "tier": tier,
+                "model": model,
+                "calls": count,
+                "avg_wall_time": round(sum(c["wall_time"] for c in calls) / count, 3),
+                "avg_completion_tokens": round(sum(c["completion_tokens"] for c in calls) / count),
+                "avg_cost_usd": round(sum(c["cost_usd"] or 0.0 for c in calls) / count, 5),
+                "avg_response_chars": round(sum(c.get("response_chars", 0) for c in calls) / count),
+                "avg_data_points": round(sum(c.get("data_points", 0) for c in calls) / count, 1),
+                "avg_citations": round(sum(c.get("citations", 0) for c in calls) / count, 1),
+            })
+        return rows
+
+    def export_jsonl(self):
+        """Return the in-memory calls as JSON lines"""
+        return "".join(json.dumps(call) + "\n" for call in self.snapshot())
+
+    def prometheus_text(self):
+        """Render cumulative per-section metrics in Prometheus text format"""
+        lines = [
+            "# HELP pplx_calls_total Section queries by cache status and outcome.",
+            "# TYPE pplx_calls_total counter",
+        ]
+        counts = {}
+        for call in self.snapshot():
+            labels = (call["section"], call["model"], call["cache"], call["status"])
+            counts[labels] = counts.get(labels, 0) + 1
+        for (section, model, cache, status), count in sorted(counts.items()):
+            lines.append(f'pplx_calls_total{{section="{section}",model="{model}",cache="{cache}",status="{status}"}} {count}')
+
+        rows = self.summary_by_section()
+        for name, field, help_text in [
+            ("pplx_wall_seconds_avg", "avg_wall_time", "Average wall time per section query."),
+            ("pplx_wall_seconds_max", "max_wall_time", "Slowest section query."),
+            ("pplx_prompt_tokens_total", "prompt_tokens", "Prompt tokens consumed."),
+            ("pplx_completion_tokens_total", "completion_tokens", "Completion tokens generated."),
+            ("pplx_retries_total", "retries", "Retries after rate-limit or transient errors."),
+            ("pplx_hedges_total", "hedges", "Duplicate requests fired because a call passed its p95 latency."),
+            ("pplx_cost_usd_total", "cost_usd", "Estimated token cost in USD."),
+        ]:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {'gauge' if 'seconds' in name else 'counter'}")
+            for row in rows:
+                lines.append(f'{name}{{section="{row["section"]}"}} {row[field]}')
+        return "\n".join(lines) + "\n"
+
+class LatencyWindow:
+    """Rolling latency samples per key, for percentile-based decisions such as hedging"""
+
+    def __init__(self, size=200):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, key, pct, min_samples=1):
+        """Nearest-rank percentile for `key`, or None with fewer than `min_samples` samples"""
+        with self._lock:
+            ordered = sorted(self._samples.get(key, ()))
+        if len(ordered) < max(1, min_samples):
+            return None
+        rank = max(1, -(-len(ordered) * pct // 100))
+        return ordered[int(rank) - 1]
+
+metrics = MetricsRecorder()
+
+def start_metrics_server(port, recorder=None):
+    """Serve `/metrics` in Prometheus text format from a daemon thread"""
+    recorder = recorder or metrics
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = recorder.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,224 @@
+"""Local stand-in for the Perplexity chat completions API, used by benchmark.py.
+
+Serves POST /chat/completions (plain and stream=True) with configurable
+latency, error rate and response size, so the pipeline can be measured
+without network access or API spend.
+"""
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockConfig:
+    """Behaviour of the mock server.
+
+    Latency is log-normal around `latency_median` seconds (`latency_sigma=0`
+    makes it fixed). A fraction `error_rate` of requests fail, split between
+    429s carrying Retry-After and 500s.
+    """
+
+    def __init__(self, latency_median=2.0, latency_sigma=0.5, error_rate=0.0,
+                 response_chars=6000, retry_after=1.0, stream_chunks=40, seed=None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.response_chars = response_chars
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        with self.lock:
+            if self.latency_sigma <= 0:
+                return self.latency_median
+            return self.latency_median * math.exp(self.random.gauss(0, self.latency_sigma))
+
+    def sample_error(self):
+        """Return an HTTP status to fail with, or None"""
+        with self.lock:
+            if self.random.random() >= self.error_rate:
+                return None
+            return 429 if self.random.random() < 0.5 else 500
+
+def fake_markdown(chars):
+    """Markdown filler of roughly `chars` characters with numbers in it"""
+    lines = ["## Summary"]
+    size = len(lines[0])
+    row = 0
+    while size < chars:
+        row += 1
+        line = f"- Metric {row}: value {row * 3.7:.1f}% vs {row * 2.1:.1f}% last year [{row % 9 + 1}]"
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+def fake_content(body, chars):
+    """Build response content matching the request, honouring JSON schema formats"""
+    response_format = body.get("response_format") or {}
+    schema = response_format.get("json_schema", {}).get("schema")
+    if schema:
+        keys = list(schema.get("properties", {}))
+        return json.dumps({key: fake_markdown(chars // max(1, len(keys))) for key in keys})
+    return fake_markdown(chars)
+
+class MockState:
+    """Counters shared by the handler threads"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.lock = threading.Lock()
+
+    def count(self, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += error
+
+    def count_cancelled(self):
+        with self.lock:
+            self.cancelled += 1
+
+def make_handler(config, state):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def handle(self):
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client dropped a kept-alive connection, e.g. after closing a response unread
+                self.close_connection = True
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            latency = config.sample_latency()
+
+            status = config.sample_error()
+            state.count(error=status is not None)
+            if status:
+                time.sleep(min(latency, 0.2))
+                self.send_json(status, {"error": {"message": f"mock {status}", "type": "mock_error"}},
+                               {"Retry-After": str(config.retry_after)} if status == 429 else {})
+                return
+
+            content = fake_content(body, config.response_chars)
+            usage = {
+                "prompt_tokens": sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4,
+                "completion_tokens": len(content) // 4,
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+            if body.get("stream"):
+                self.stream(body, content, usage, latency)
+            else:
+                time.sleep(latency)
+                self.send_json(200, {
+                    "id": f"mock-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+
+        def send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            try:
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                state.count_cancelled()
+                self.close_connection = True
+
+        def stream(self, body, content, usage, latency):
+            """Send content as server-sent events; 30% of latency is time to first token"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            chunk_size = max(1, math.ceil(len(content) / config.stream_chunks))
+            pieces = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+            time.sleep(latency * 0.3)
+            interval = latency * 0.7 / max(1, len(pieces))
+            completion_id = f"mock-{uuid.uuid4().hex[:12]}"
+
+            try:
+                for i, piece in enumerate(pieces):
+                    last = i == len(pieces) - 1
+                    event = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", "mock"),
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": piece},
+                            "finish_reason": "stop" if last else None,
+                        }],
+                    }
+                    if last:
+                        event["usage"] = usage
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(interval)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client closed the stream early, e.g. a hedged request that lost
+                state.count_cancelled()
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockHandler
+
+class MockPerplexityServer:
+    """Run the mock API on localhost in a background thread"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.state = MockState()
+        self.server = ThreadingHTTPServer((host, port), make_handler(self.config, self.state))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
@@ -0,0 +1,340 @@
+"""Off-hours pre-warming of the response cache for the most requested tickers.
+
+Usage:
+    python prewarm.py --budget 120 --dry-run
+
+The app records every ticker and section it is asked for. During the
+off-hours window the scheduler estimates tomorrow's demand from those
+records, works out which sections would miss the cache by then, and runs
+full dossiers for the names with the most demand behind their stale
+sections until the day's API budget is spent. Run without --dry-run (e.g.
+from cron) to warm the cache once, regardless of the window.
+"""
+import argparse
+import logging
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from documents import DocumentIndex
+from engine import (
+    COMBINE_FINANCIALS,
+    DEFAULT_MAX_WORKERS,
+    FINANCIAL_SECTIONS,
+    SECTION_DEPENDENCIES,
+    SECTIONS,
+    SECTOR_SECTIONS,
+    init_perplexity_client,
+    is_failure,
+    route_for,
+    run_sections_concurrently,
+    sector_subject,
+)
+from response_cache import HOUR, ResponseCache
+from symbols import sector_for
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACCESS_PATH = os.getenv("PPLX_ACCESS_PATH", os.path.join(".cache", "access.sqlite3"))
+# API calls the scheduler may spend per day; 0 disables pre-warming
+PREWARM_BUDGET = int(os.getenv("PPLX_PREWARM_BUDGET", "0"))
+# Local hours [start, end) in which the scheduler runs, e.g. "4-7"
+PREWARM_HOURS = os.getenv("PPLX_PREWARM_HOURS", "4-7")
+PREWARM_MAX_TICKERS = int(os.getenv("PPLX_PREWARM_MAX_TICKERS", "25"))
+
+# Requests this old count half as much towards expected demand
+DEMAND_HALF_LIFE_DAYS = 7
+DEMAND_LOOKBACK_DAYS = 30
+# Warmed sections must still be fresh this long after the run, through the morning peak;
+# kept below the shortest section TTL so that no section is always stale
+PREWARM_LEAD_SECONDS = 3 * HOUR
+CHECK_INTERVAL_SECONDS = 10 * 60
+
+def parse_hours(spec):
+    """Parse "start-end" local hours into a (start, end) pair; the window may wrap midnight"""
+    start, end = (int(part) % 24 for part in spec.split("-", 1))
+    return start, end
+
+def in_window(hours, now=None):
+    """Whether the local time `now` falls in an hours window from parse_hours"""
+    start, end = hours
+    hour = datetime.fromtimestamp(now or time.time()).hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+class AccessLog:
+    """Record of which tickers and sections were requested, and when, in SQLite"""
+
+    def __init__(self, path=DEFAULT_ACCESS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS accesses (
+                ticker TEXT NOT NULL,
+                section_key TEXT NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_accesses_time ON accesses (accessed_at);
+            CREATE TABLE IF NOT EXISTS prewarm_runs (
+                day TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                failed INTEGER NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def record(self, ticker, section_keys, at=None):
+        """Note a request for some sections of `ticker`"""
+        at = at or time.time()
+        with self._lock:
+            self._conn.executemany("INSERT INTO accesses VALUES (?, ?, ?)",
+                                   [(ticker, key, at) for key in section_keys])
+            self._conn.commit()
+
+    def section_demand(self, now=None, half_life_days=DEMAND_HALF_LIFE_DAYS, lookback_days=DEMAND_LOOKBACK_DAYS):
+        """Expected demand per (ticker, section): recent requests, exponentially decayed by age"""
+        now = now or time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ticker, section_key, accessed_at FROM accesses WHERE accessed_at >= ?",
+                (now - lookback_days * 24 * HOUR,)
+            ).fetchall()
+
+        demand = {}
+        decay = math.log(2) / (half_life_days * 24 * HOUR)
+        for ticker, key, accessed_at in rows:
+            demand[(ticker, key)] = demand.get((ticker, key), 0.0) + math.exp(-decay * (now - accessed_at))
+        return demand
+
+    def record_run(self, day, ticker, calls, failed, started_at):
+        with self._lock:
+            self._conn.execute("INSERT INTO prewarm_runs VALUES (?, ?, ?, ?, ?, ?)",
+                               (day, ticker, calls, failed, started_at, time.time()))
+            self._conn.commit()
+
+    def warmed(self, day):
+        """Tickers already pre-warmed on `day`"""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT ticker FROM prewarm_runs WHERE day = ?", (day,)).fetchall()
+        return {ticker for (ticker,) in rows}
+
+    def spent(self, day):
+        """API calls already spent pre-warming on `day`"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(calls), 0) FROM prewarm_runs WHERE day = ?",
+                                      (day,)).fetchone()[0]
+
+    def runs(self, limit=20):
+        """Most recent pre-warm runs, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, ticker, calls, failed, started_at, finished_at FROM prewarm_runs "
+                "ORDER BY started_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(["day", "ticker", "calls", "failed", "started_at", "finished_at"], row)) for row in rows]
+
+def local_midnight(now):
+    """Start of the local day containing `now`, as a timestamp"""
+    return datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+def stale_sections(cache, ticker, now=None, lead=PREWARM_LEAD_SECONDS):
+    """Sections of `ticker` that a dossier run `lead` seconds from now would not find fresh in the cache.
+
+    Shared sector studies keep the date in their cache key, so one from an
+    earlier day never matches today's prompt whatever its TTL. A section
+    also counts as stale when one of its dependencies is, since its prompt
+    embeds their output and so will not match the cached one.
+    """
+    now = now or time.time()
+    sector = sector_for(ticker)
+    stale = set()
+    for _, key in SECTIONS:
+        by_sector = sector and key in SECTOR_SECTIONS
+        subject = sector_subject(sector) if by_sector else ticker
+        created = cache.newest(key, subject, route_for(key)["model"])
+        if created is None or now + lead - created > cache.ttl_for(key):
+            stale.add(key)
+        elif by_sector and created < local_midnight(now):
+            stale.add(key)
+
+    changed = True
+    while changed:
+        changed = False
+        for key, deps in SECTION_DEPENDENCIES.items():
+            if key not in stale and stale.intersection(deps):
+                stale.add(key)
+                changed = True
+    return [key for _, key in SECTIONS if key in stale]
+
+def upstream_calls(records):
+    """API requests behind metrics records: every attempt and hedge of calls that missed the cache"""
+    return sum(1 + record["retries"] + record.get("hedged", False) for record in records
+               if record["cache"] in ("miss", "bypass", "off"))
+
+def estimate_calls(stale, combine_financials=COMBINE_FINANCIALS):
+    """API calls needed to refresh `stale` sections; the financials share one call when combined"""
+    financial = [key for key in stale if key in FINANCIAL_SECTIONS]
+    if combine_financials and financial:
+        return len(stale) - len(financial) + 1
+    return len(stale)
+
+class PrewarmScheduler:
+    """Warms the response cache for the most requested tickers within a daily API budget.
+
+    Tickers are ranked by the summed demand of their stale sections, so a
+    popular name whose sections are all still fresh costs nothing and is
+    skipped. Each chosen ticker runs a full standard dossier with cache
+    reads on: fresh sections are served from the cache and only the stale
+    ones reach the API, leaving every section ready for the first visitor.
+    Pass the app's DocumentIndex as `documents` so sections grounded in
+    uploaded filings are warmed with the same prompts visitors send.
+
+    Plans use estimated calls; each run is charged the requests it made
+    itself (retries, hedges and fallbacks included, concurrent visitor
+    traffic not), and a ticker is skipped once what is left of the day's
+    budget no longer covers its estimate.
+    """
+
+    def __init__(self, client, cache, access_log, budget=PREWARM_BUDGET, hours=PREWARM_HOURS,
+                 max_tickers=PREWARM_MAX_TICKERS, max_workers=DEFAULT_MAX_WORKERS, documents=None):
+        self.client = client
+        self.cache = cache
+        self.access_log = access_log
+        self.documents = documents
+        self.budget = budget
+        self.hours = parse_hours(hours)
+        self.max_tickers = max_tickers
+        self.max_workers = max_workers
+        self.last_plan = []
+        self._running = threading.Lock()
+        self._thread = None
+
+    def plan(self, now=None):
+        """Tickers to warm, best first: dicts with ticker, demand, stale sections and estimated calls"""
+        now = now or time.time()
+        day = datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+        remaining = self.budget - self.access_log.spent(day)
+        warmed = self.access_log.warmed(day)
+
+        ticker_demand = {}
+        section_demand = self.access_log.section_demand(now)
+        for (ticker, key), demand in section_demand.items():
+            ticker_demand[ticker] = ticker_demand.get(ticker, 0.0) + demand
+        # Each ticker is warmed at most once a day
+        popular = [ticker for ticker in sorted(ticker_demand, key=ticker_demand.get, reverse=True)[:self.max_tickers]
+                   if ticker not in warmed]
+
+        candidates = []
+        for ticker in popular:
+            stale = stale_sections(self.cache, ticker, now)
+            if not stale:
+                continue
+            # A section nobody asked for still gets a little weight: the dossier is run whole
+            demand = sum(section_demand.get((ticker, key), 0.0) or 0.01 for key in stale)
+            candidates.append({"ticker": ticker, "demand": round(demand, 3), "stale": stale,
+                               "calls": estimate_calls(stale)})
+
+        chosen = []
+        for candidate in sorted(candidates, key=lambda c: c["demand"], reverse=True):
+            if candidate["calls"] <= remaining:
+                chosen.append(candidate)
+                remaining -= candidate["calls"]
+        self.last_plan = chosen
+        return chosen
+
+    def run_once(self, now=None):
+        """Plan and warm the cache now; returns the plan entries that were run"""
+        if not self.client or self.budget <= 0 or not self._running.acquire(blocking=False):
+            return []
+        try:
+            warmed = []
+            for entry in self.plan(now):
+                started = time.time()
+                day = datetime.fromtimestamp(started).strftime("%Y-%m-%d")
+                if self.budget - self.access_log.spent(day) < entry["calls"]:
+                    continue
+                # The same date string the app uses, so warmed prompts match live ones
+                date = datetime.fromtimestamp(started).strftime("%B %d, %Y")
+                records = []
+                results = run_sections_concurrently(
+                    self.client, entry["ticker"], date, SECTIONS,
+                    max_workers=self.max_workers,
+                    cache=self.cache,
+                    use_cache=True,
+                    documents=self.documents,
+                    calls=records
+                )
+                failed = sum(is_failure(content) for content in results.values())
+                calls = upstream_calls(records)
+                self.access_log.record_run(day, entry["ticker"], calls, failed, started)
+                warmed.append(dict(entry, calls=calls))
+            return warmed
+        finally:
+            self._running.release()
+
+    def start(self, interval=CHECK_INTERVAL_SECONDS):
+        """Check every `interval` seconds on a daemon thread, warming while inside the off-hours window"""
+        if self._thread is not None or self.budget <= 0:
+            return self
+
+        def loop():
+            while True:
+                if in_window(self.hours):
+                    try:
+                        self.run_once()
+                    except Exception:
+                        logger.exception("Pre-warm run failed")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="prewarm-scheduler")
+        self._thread.start()
+        return self
+
+    def stats(self):
+        """Budget, today's spend and the most recent plan"""
+        day = datetime.now().strftime("%Y-%m-%d")
+        return {
+            "budget": self.budget,
+            "spent_today": self.access_log.spent(day),
+            "window": "%02d:00-%02d:00" % self.hours,
+            "active": self._thread is not None,
+            "last_plan": list(self.last_plan),
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm the response cache for the most requested tickers.")
+    parser.add_argument("--budget", type=int, default=PREWARM_BUDGET or 100, help="API calls to spend today")
+    parser.add_argument("--max-tickers", type=int, default=PREWARM_MAX_TICKERS, help="most requested tickers considered")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="parallel sections per dossier")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan without calling the API")
+    args = parser.parse_args(argv)
+
+    client = init_perplexity_client()
+    if not client and not args.dry_run:
+        parser.error("PPLX_API_KEY is not set")
+
+    cache = ResponseCache()
+    scheduler = PrewarmScheduler(client, cache, AccessLog(), budget=args.budget,
+                                 max_tickers=args.max_tickers, max_workers=args.workers, documents=DocumentIndex())
+    plan = scheduler.plan() if args.dry_run else scheduler.run_once()
+    for entry in plan:
+        print(f"{entry['ticker']}: demand {entry['demand']}, {entry['calls']} calls, stale {', '.join(entry['stale'])}")
+    print(f"{'Planned' if args.dry_run else 'Warmed'} {len(plan)} tickers, "
+          f"{sum(entry['calls'] for entry in plan)} calls")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
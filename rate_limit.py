@@ -0,0 +1,116 @@
+"""Client-side rate limiting and retry backoff for Perplexity requests"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """Block until `amount` tokens are available, then take them"""
+        # Requests larger than the bucket would never fit; let them drain it instead
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill_locked()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount):
+        """Credit (positive) or debit (negative) tokens after the real cost is known"""
+        with self._lock:
+            self._refill_locked()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+class RateLimiter:
+    """Shared limiter for requests/min, tokens/min and in-flight requests.
+
+    Token usage is reserved up front from an estimate and reconciled with
+    `settle()` once the provider reports actual usage. `pause()` holds back
+    every caller, e.g. after a 429 with Retry-After.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrent=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens=0):
+        """Wait for capacity for one request of roughly `estimated_tokens`"""
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+
+        if self._slots:
+            self._slots.acquire()
+        if self.requests:
+            self.requests.acquire()
+        if self.tokens and estimated_tokens:
+            self.tokens.acquire(estimated_tokens)
+
+    def release(self):
+        """Free the in-flight slot taken by acquire()"""
+        if self._slots:
+            self._slots.release()
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Reconcile the token bucket with the usage a response reported"""
+        if self.tokens and actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def pause(self, seconds):
+        """Stop handing out capacity for `seconds` from now"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+def parse_retry_after(headers):
+    """Return the server-requested delay in seconds from response headers, if any"""
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, base=1.0, cap=60.0, retry_after=None):
+    """Exponential backoff with full jitter, never shorter than Retry-After"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, base))
+    return delay
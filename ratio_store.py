@@ -0,0 +1,279 @@
+"""Typed ratio and score records extracted from dossiers, stored as Parquet"""
+import os
+import re
+import threading
+import time
+
+from engine import DELTA_HEADING, DELTA_SEPARATOR, is_failure
+
+DEFAULT_STORE_PATH = os.getenv("PPLX_RATIO_STORE_PATH", os.path.join(".cache", "ratios"))
+
+# Sections whose numbers are extracted into the store
+PARSED_SECTIONS = ["ratio_analysis", "valuation_analysis", "integrity_matrix"]
+
+COLUMNS = ["ticker", "run_id", "run_date", "run_at", "section", "entity", "metric", "field", "value", "unit"]
+
+# Canonical metric names and the labels that refer to them
+METRIC_PATTERNS = [
+    ("ROCE", r"\broce\b|return on capital employed"),
+    ("ROE", r"\broe\b|return on (?:shareholders'? )?equity"),
+    ("ROA", r"\broa\b|return on (?:total )?assets"),
+    ("Gross Margin", r"gross (?:profit )?margin"),
+    ("EBITDA Margin", r"ebitda margin"),
+    ("Operating Margin", r"operating (?:profit )?margin|\bebit margin"),
+    ("Net Margin", r"net (?:profit )?margin|\bpat margin"),
+    ("Current Ratio", r"current ratio"),
+    ("Quick Ratio", r"quick ratio|acid[- ]test"),
+    ("Cash Ratio", r"cash ratio"),
+    ("Debt/Equity", r"debt[- ]?(?:to[- ]?|/)\s*equity|\bd/e\b"),
+    ("Interest Coverage", r"interest coverage"),
+    ("Debt Service Coverage", r"debt service"),
+    ("Asset Turnover", r"asset turnover"),
+    ("Inventory Turnover", r"inventory turnover"),
+    ("Receivables Turnover", r"receivables? turnover|debtors? turnover"),
+    ("EV/EBITDA", r"ev\s*/\s*ebitda"),
+    ("PEG", r"\bpeg\b"),
+    ("P/E", r"\bp\s*/\s*e\b|price[- ]to[- ]earnings"),
+    ("P/B", r"\bp\s*/\s*b\b|price[- ]to[- ]book"),
+    ("P/S", r"\bp\s*/\s*s\b|price[- ]to[- ]sales"),
+    ("Dividend Yield", r"dividend yield"),
+]
+
+# Integrity matrix KPIs, scored out of 10
+INTEGRITY_KPIS = [
+    ("Guidance Accuracy", r"guidance accuracy"),
+    ("Delivery vs Promise", r"delivery vs\.? promise"),
+    ("Transparency & Disclosure", r"transparency"),
+    ("Governance Flags", r"governance flags?"),
+    ("Overall Integrity", r"overall integrity"),
+]
+
+# Table columns that describe rather than measure, so are not parsed
+SKIPPED_COLUMNS = re.compile(r"trend|analysis|comment|remark|driver|source|note", re.IGNORECASE)
+ENTITY_COLUMNS = re.compile(r"^(company|peer|name|ticker|competitor)s?$", re.IGNORECASE)
+
+NUMBER = re.compile(r"^\**\s*(?:rs\.?|inr|₹|\$)?\s*(-?\d[\d,]*(?:\.\d+)?)\s*(%|x|×|times)?", re.IGNORECASE)
+# "7/10", or "Score: 7" / "(Score/10): 7", whichever comes first
+SCORE = re.compile(r"(\d+(?:\.\d+)?)\s*/\s*10\b|score(?:\s*/\s*10)?\W{0,5}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+INLINE_RATIO = re.compile(r"^[\s>*\-\d.]*\**([A-Za-z][A-Za-z/&()' -]{1,40}?)\**\s*[:=–-]\s*(.+)$")
+
+def canonical_metric(label):
+    """Map a ratio label to its canonical name, or None if it is not a known ratio"""
+    text = label.lower()
+    for name, pattern in METRIC_PATTERNS:
+        if re.search(pattern, text):
+            return name
+    return None
+
+def parse_number(cell):
+    """Parse a cell that starts with a number into (value, unit), or None"""
+    match = NUMBER.match(cell.strip())
+    if not match:
+        return None
+    unit = (match.group(2) or "").lower()
+    return float(match.group(1).replace(",", "")), {"×": "x", "times": "x"}.get(unit, unit)
+
+def clean_label(text):
+    return re.sub(r"\s+", " ", re.sub(r"[*_`]|\[\d+\]", "", text)).strip()
+
+def parse_markdown_tables(content):
+    """Return every markdown table in `content` as (headers, rows of cells)"""
+    tables, block = [], []
+    for line in content.splitlines() + [""]:
+        if line.strip().startswith("|"):
+            block.append(line.strip().strip("|"))
+            continue
+        if len(block) >= 3 and set(block[1]) <= set("-:| "):
+            headers = [clean_label(cell) for cell in block[0].split("|")]
+            rows = [[clean_label(cell) for cell in row.split("|")] for row in block[2:]]
+            tables.append((headers, rows))
+        block = []
+    return tables
+
+def field_name(header):
+    """Column header as a short snake_case field name, e.g. 'Industry Average' -> industry_average"""
+    return re.sub(r"[^a-z0-9]+", "_", header.lower()).strip("_") or "value"
+
+def extract_table_records(content, ticker):
+    """Records from ratio tables; peer tables (a Company column) keep each row's entity"""
+    records = []
+    for headers, rows in parse_markdown_tables(content):
+        peer_table = bool(headers) and ENTITY_COLUMNS.match(headers[0])
+        for row in rows:
+            if not row or not row[0]:
+                continue
+            for header, cell in zip(headers[1:], row[1:]):
+                if SKIPPED_COLUMNS.search(header):
+                    continue
+                number = parse_number(cell)
+                if number is None:
+                    continue
+                if peer_table:
+                    entity, metric, field = row[0], canonical_metric(header) or header, "current"
+                else:
+                    entity, metric, field = ticker, canonical_metric(row[0]) or row[0], field_name(header)
+                records.append({"entity": entity, "metric": metric, "field": field,
+                                "value": number[0], "unit": number[1]})
+    return records
+
+def extract_inline_ratios(content, ticker):
+    """Records from 'P/E: 28.5x' style lines, for known ratios only"""
+    records = []
+    for line in content.splitlines():
+        if line.strip().startswith("|"):
+            continue
+        match = INLINE_RATIO.match(line)
+        if not match:
+            continue
+        metric = canonical_metric(match.group(1))
+        number = parse_number(match.group(2))
+        if metric and number:
+            records.append({"entity": ticker, "metric": metric, "field": "current",
+                            "value": number[0], "unit": number[1]})
+    return records
+
+def extract_integrity_scores(content, ticker):
+    """Records for the integrity KPIs: the first score out of 10 after each KPI name"""
+    records = []
+    for name, pattern in INTEGRITY_KPIS:
+        match = re.search(pattern, content, re.IGNORECASE)
+        if not match:
+            continue
+        score = SCORE.search(content[match.end():match.end() + 200])
+        value = score and float(score.group(1) or score.group(2))
+        if value is not None and value <= 10:
+            records.append({"entity": ticker, "metric": name, "field": "score", "value": value, "unit": "/10"})
+    return records
+
+def extract_records(ticker, results):
+    """Typed records from the parsed sections of one dossier.
+
+    Delta-merged sections only contribute their change block, since the
+    text underneath was extracted with the earlier run.
+    """
+    records = []
+    for section_key in PARSED_SECTIONS:
+        content = results.get(section_key)
+        if content is None or is_failure(content):
+            continue
+        if content.startswith(DELTA_HEADING):
+            content = content.split(DELTA_SEPARATOR, 1)[0]
+
+        if section_key == "integrity_matrix":
+            found = extract_integrity_scores(content, ticker)
+        else:
+            found = extract_table_records(content, ticker)
+            seen = {(r["entity"], r["metric"], r["field"]) for r in found}
+            found += [r for r in extract_inline_ratios(content, ticker)
+                      if (r["entity"], r["metric"], r["field"]) not in seen]
+        for record in found:
+            record["section"] = section_key
+        records.extend(found)
+    return records
+
+class RatioStore:
+    """Append-only Parquet store of extracted records with an in-memory query cache.
+
+    Each run is written to its own file, so ingesting never rewrites old
+    data and re-ingesting a run replaces just that file. Queries read the
+    whole directory once and reuse the frame until the directory changes.
+    Needs pandas and pyarrow.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._frame = None
+        self._signature = None
+        os.makedirs(path, exist_ok=True)
+
+    def ingest(self, ticker, date, results, run_id, run_at=None):
+        """Extract and store the records of one run; returns the number of records"""
+        import pandas as pd
+
+        records = extract_records(ticker, results)
+        if not records:
+            return 0
+        for record in records:
+            record.update(ticker=ticker, run_id=run_id, run_date=date, run_at=run_at or time.time())
+
+        frame = pd.DataFrame(records, columns=COLUMNS)
+        safe_ticker = re.sub(r"[^A-Za-z0-9_-]", "_", ticker)
+        with self._lock:
+            frame.to_parquet(os.path.join(self.path, f"{safe_ticker}-{run_id}.parquet"), index=False)
+            self._frame = None
+        return len(records)
+
+    def _files(self):
+        return sorted(name for name in os.listdir(self.path) if name.endswith(".parquet"))
+
+    def frame(self):
+        """All stored records as a DataFrame"""
+        import pandas as pd
+
+        with self._lock:
+            files = self._files()
+            signature = [(name, os.path.getmtime(os.path.join(self.path, name))) for name in files]
+            if self._frame is None or signature != self._signature:
+                parts = [pd.read_parquet(os.path.join(self.path, name)) for name in files]
+                self._frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+                self._signature = signature
+            return self._frame
+
+    def query(self, metric=None, tickers=None, section=None, field=None, since=None, own_only=True, latest=False):
+        """Filter stored records.
+
+        `own_only` drops peer rows reported inside another ticker's dossier,
+        and `latest` keeps only the newest run per ticker, metric and field.
+        """
+        frame = self.frame()
+        mask = frame["value"].notna()
+        if metric:
+            mask &= frame["metric"] == metric
+        if tickers:
+            mask &= frame["ticker"].isin(tickers)
+        if section:
+            mask &= frame["section"] == section
+        if field:
+            mask &= frame["field"] == field
+        if since:
+            mask &= frame["run_at"] >= since
+        if own_only:
+            mask &= frame["entity"] == frame["ticker"]
+
+        result = frame[mask]
+        if latest:
+            result = result.sort_values("run_at").drop_duplicates(["ticker", "metric", "field"], keep="last")
+        return result.sort_values(["ticker", "run_at"]).reset_index(drop=True)
+
+    def screen(self, metric, op, threshold, field="current"):
+        """Latest value per ticker for `metric` where `value <op> threshold`, e.g. ROCE > 20"""
+        latest = self.query(metric=metric, field=field, latest=True)
+        ops = {
+            ">": latest["value"] > threshold,
+            ">=": latest["value"] >= threshold,
+            "<": latest["value"] < threshold,
+            "<=": latest["value"] <= threshold,
+            "=": latest["value"] == threshold,
+        }
+        return latest[ops[op]].sort_values("value", ascending=op.startswith("<")).reset_index(drop=True)
+
+    def history(self, metric, tickers=None, field="current"):
+        """Values over time as a table: one row per run date, one column per ticker"""
+        import pandas as pd
+
+        records = self.query(metric=metric, tickers=tickers, field=field)
+        history = records.pivot_table(index="run_at", columns="ticker", values="value", aggfunc="last")
+        history.index = pd.to_datetime(history.index, unit="s")
+        return history
+
+    def metrics(self):
+        """Metric and field combinations present in the store, most common first"""
+        frame = self.query()
+        return frame.groupby(["metric", "field"]).size().sort_values(ascending=False)
+
+    def stats(self):
+        """File, record and ticker counts"""
+        frame = self.frame()
+        return {"files": len(self._files()), "records": len(frame), "tickers": frame["ticker"].nunique()}
@@ -0,0 +1,182 @@
+"""Persistent SQLite cache for Perplexity section responses"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+DEFAULT_CACHE_PATH = os.getenv("PPLX_CACHE_PATH", os.path.join(".cache", "perplexity_responses.sqlite3"))
+DEFAULT_CACHE_MAX_MB = float(os.getenv("PPLX_CACHE_MAX_MB", "256"))
+DEFAULT_TTL = DAY
+
+# Freshness window per section: news moves in hours, filings in weeks
+SECTION_TTLS = {
+    "news_competition": 6 * HOUR,
+    "community_analysis": 12 * HOUR,
+    "sectoral_analysis": DAY,
+    "valuation_analysis": DAY,
+    "scenario_analysis": DAY,
+    "final_recommendation": DAY,
+    "ratio_analysis": 2 * DAY,
+    "growth_triggers": 3 * DAY,
+    "management_guidance": 7 * DAY,
+    "investor_presentations": 7 * DAY,
+    "conference_calls": 7 * DAY,
+    "integrity_matrix": 7 * DAY,
+    "financial_pl": 14 * DAY,
+    "financial_bs": 14 * DAY,
+    "financial_cf": 14 * DAY,
+    "management_eval": 14 * DAY,
+    "annual_report": 30 * DAY,
+}
+
+def normalize_ticker(ticker):
+    """Normalize a ticker for use in cache keys"""
+    return ticker.strip().upper()
+
+def prompt_fingerprint(prompt, date=None):
+    """Hash a prompt, ignoring the analysis date so entries survive across days"""
+    if date:
+        prompt = prompt.replace(date, "")
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def make_cache_key(section_key, ticker, model, prompt, date=None):
+    """Build the cache key for a section query"""
+    return "|".join([section_key, normalize_ticker(ticker), model, prompt_fingerprint(prompt, date)])
+
+class ResponseCache:
+    """TTL-aware response cache stored in SQLite with size-bounded LRU eviction.
+
+    Entries expire according to SECTION_TTLS. When the stored content exceeds
+    `max_bytes`, the least recently read entries are evicted first. Safe to
+    share between the worker threads of a single process.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=int(DEFAULT_CACHE_MAX_MB * 1024 * 1024), ttls=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(SECTION_TTLS if ttls is None else ttls)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                section_key TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses (last_accessed)")
+        self._conn.commit()
+
+    def ttl_for(self, section_key):
+        """Return the freshness window in seconds for a section"""
+        return self.ttls.get(section_key, DEFAULT_TTL)
+
+    def get(self, section_key, ticker, model, prompt, date=None):
+        """Return cached content for a query, or None if missing or stale"""
+        cache_key = make_cache_key(section_key, ticker, model, prompt, date)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            content, created_at = row
+            if now - created_at > self.ttl_for(section_key):
+                self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_accessed = ? WHERE cache_key = ?", (now, cache_key))
+            self._conn.commit()
+            self.hits += 1
+            return content
+
+    def newest(self, section_key, ticker, model=None):
+        """Creation time of the newest entry for a section and ticker (any prompt), or None"""
+        query = "SELECT MAX(created_at) FROM responses WHERE section_key = ? AND ticker = ?"
+        params = [section_key, normalize_ticker(ticker)]
+        if model:
+            query += " AND model = ?"
+            params.append(model)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def set(self, section_key, ticker, model, prompt, content, date=None):
+        """Store content for a query and evict old entries if over budget"""
+        cache_key = make_cache_key(section_key, ticker, model, prompt, date)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, section_key, normalize_ticker(ticker), model, content,
+                 len(content.encode("utf-8")), now, now)
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for cache_key, size in self._conn.execute("SELECT cache_key, size FROM responses ORDER BY last_accessed ASC"):
+            if total <= self.max_bytes:
+                break
+            victims.append((cache_key,))
+            total -= size
+
+        self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters and current cache size"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
@@ -0,0 +1,175 @@
+"""Process-wide, memory-bounded store of compressed dossier results"""
+import os
+import pickle
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+DEFAULT_RESULT_STORE_MB = float(os.getenv("PPLX_RESULT_STORE_MB", "64"))
+DEFAULT_SPILL_PATH = os.getenv("PPLX_RESULT_SPILL_PATH", os.path.join(".cache", "results"))
+DEFAULT_SPILL_MB = float(os.getenv("PPLX_RESULT_SPILL_MB", "256"))
+COMPRESSION_LEVEL = 6
+
+class ResultStore:
+    """Holds each (ticker, run) result set once, zlib-compressed, under a global byte cap.
+
+    Sessions keep the (ticker, run_id) reference and call get() when they
+    render, so any number of analysts viewing a run share one compressed
+    copy. When the compressed total exceeds `max_bytes`, the least recently
+    used runs are written to `spill_path` and dropped from memory; get()
+    reads them back and promotes them again. Spilled runs are capped at
+    `max_spill_bytes`, oldest deleted first; they only mean something to
+    the process that wrote them, so the directory is emptied on open. Safe
+    to share between threads.
+    """
+
+    def __init__(self, max_bytes=int(DEFAULT_RESULT_STORE_MB * 1024 * 1024), spill_path=DEFAULT_SPILL_PATH,
+                 max_spill_bytes=int(DEFAULT_SPILL_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self.max_spill_bytes = max_spill_bytes
+        self.hits = 0
+        self.misses = 0
+        self.disk_reads = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.spill_evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._raw_bytes = 0
+        self._spilled = OrderedDict()
+        self._spilled_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(spill_path, exist_ok=True)
+        for name in os.listdir(spill_path):
+            if name.endswith((".bin", ".tmp")):
+                os.remove(os.path.join(spill_path, name))
+
+    def _spill_file(self, ticker, run_id):
+        return os.path.join(self.spill_path, re.sub(r"[^A-Za-z0-9_-]", "_", f"{ticker}-{run_id}") + ".bin")
+
+    def put(self, ticker, run_id, results):
+        """Compress and hold a run's results, replacing any earlier copy; returns its reference"""
+        raw = pickle.dumps(dict(results), protocol=pickle.HIGHEST_PROTOCOL)
+        self._remove_spill((ticker, run_id))
+        self._insert((ticker, run_id), zlib.compress(raw, COMPRESSION_LEVEL), len(raw))
+        return ticker, run_id
+
+    def _insert(self, key, blob, raw_size):
+        with self._lock:
+            if key in self._entries:
+                old_blob, old_raw = self._entries.pop(key)
+                self._bytes -= len(old_blob)
+                self._raw_bytes -= old_raw
+            self._entries[key] = (blob, raw_size)
+            self._bytes += len(blob)
+            self._raw_bytes += raw_size
+
+            # Always keep the newest entry in memory, even if it alone exceeds the cap
+            evicted = []
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, (old_blob, old_raw) = self._entries.popitem(last=False)
+                self._bytes -= len(old_blob)
+                self._raw_bytes -= old_raw
+                self.evictions += 1
+                self.evicted_bytes += len(old_blob)
+                evicted.append((old_key, old_blob, old_raw))
+
+        for old_key, old_blob, old_raw in evicted:
+            self._write_spill(old_key, old_raw.to_bytes(8, "big") + old_blob)
+
+    def _write_spill(self, key, data):
+        """Write a spill file atomically, then delete the oldest ones past max_spill_bytes"""
+        path = self._spill_file(*key)
+        partial = f"{path}.{threading.get_ident()}.tmp"
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, path)
+
+        with self._lock:
+            self._spilled_bytes -= self._spilled.pop(key, 0)
+            self._spilled[key] = len(data)
+            self._spilled_bytes += len(data)
+            dropped = []
+            while self._spilled_bytes > self.max_spill_bytes and self._spilled:
+                old_key, size = self._spilled.popitem(last=False)
+                self._spilled_bytes -= size
+                self.spill_evictions += 1
+                dropped.append(old_key)
+        for old_key in dropped:
+            self._unlink(self._spill_file(*old_key))
+
+    def _remove_spill(self, key):
+        with self._lock:
+            self._spilled_bytes -= self._spilled.pop(key, 0)
+        self._unlink(self._spill_file(*key))
+
+    def _unlink(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, ticker, run_id):
+        """Decompressed results of a run, or None if the store does not hold it (any more)"""
+        key = (ticker, run_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            return pickle.loads(zlib.decompress(entry[0]))
+
+        results = None
+        try:
+            with open(self._spill_file(ticker, run_id), "rb") as f:
+                data = f.read()
+            entry = (data[8:], int.from_bytes(data[:8], "big"))
+            results = pickle.loads(zlib.decompress(entry[0]))
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # Unreadable spill: drop it, the caller rebuilds the results from their source
+            self._remove_spill(key)
+        if results is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_reads += 1
+        # Back in memory as the newest entry, which _insert never evicts straight away
+        self._remove_spill(key)
+        self._insert(key, *entry)
+        return results
+
+    def discard(self, ticker, run_id):
+        """Forget a run, in memory and on disk, e.g. after one of its sections changed"""
+        with self._lock:
+            entry = self._entries.pop((ticker, run_id), None)
+            if entry is not None:
+                self._bytes -= len(entry[0])
+                self._raw_bytes -= entry[1]
+        self._remove_spill((ticker, run_id))
+
+    def stats(self):
+        """Memory and disk held, compression saved, plus eviction and lookup counts"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "raw_bytes": self._raw_bytes,
+                "max_bytes": self.max_bytes,
+                "compression_ratio": self._raw_bytes / self._bytes if self._bytes else 0.0,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "spilled_entries": len(self._spilled),
+                "spilled_bytes": self._spilled_bytes,
+                "max_spill_bytes": self.max_spill_bytes,
+                "spill_evictions": self.spill_evictions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_reads": self.disk_reads,
+            }
@@ -0,0 +1,87 @@
+"""Process-wide coalescing of identical in-flight requests"""
+import threading
+
+class _Flight:
+    """One in-flight call and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.chunks = []
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def emit(self, text):
+        """Forward a streamed chunk to every listener, remembering it for late joiners"""
+        with self.lock:
+            self.chunks.append(text)
+            for listener in self.listeners:
+                listener(text)
+
+    def subscribe(self, on_token):
+        """Replay chunks emitted so far and receive the rest as they arrive"""
+        with self.lock:
+            for text in self.chunks:
+                on_token(text)
+            self.listeners.append(on_token)
+
+class SingleFlight:
+    """Share one upstream call between concurrent callers with the same key.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for and receive the same result. The
+    function is passed an `emit` callback so streamed chunks reach every
+    caller's `on_token`, including callers that join mid-stream.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, on_token=None):
+        """Run `fn(emit)` once per concurrent `key`; returns (result, shared)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return self._wait(flight, on_token), True
+
+        if on_token:
+            flight.subscribe(on_token)
+        try:
+            flight.result = fn(flight.emit)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def _wait(self, flight, on_token):
+        if on_token:
+            flight.subscribe(on_token)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+
+        # The leader did not stream, so deliver the whole result at once
+        if on_token and not flight.chunks and isinstance(flight.result, str):
+            on_token(flight.result)
+        return flight.result
+
+    def stats(self):
+        """Return leader/coalesced counts and calls currently in flight"""
+        with self._lock:
+            in_flight = len(self._flights)
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": in_flight}
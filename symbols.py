@@ -0,0 +1,204 @@
+"""Local NSE/BSE symbol master with prefix and fuzzy lookup"""
+import csv
+import difflib
+import os
+import re
+from bisect import bisect_left
+from functools import lru_cache
+
+DEFAULT_SYMBOLS_PATH = os.getenv(
+    "PPLX_SYMBOLS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "symbols.csv")
+)
+
+# Name similarity needed to auto-resolve a fuzzy match, and to merely suggest one
+FUZZY_RESOLVE_RATIO = 0.85
+FUZZY_SUGGEST_RATIO = 0.5
+FUZZY_CANDIDATES = 25
+# Words a name prefix needs before it auto-resolves; one word ("BANK", "SUN") is only suggested
+PREFIX_RESOLVE_WORDS = 2
+
+EXCHANGE_PREFIX = re.compile(r"^(NSE|BSE)\s*:\s*")
+EXCHANGE_SUFFIX = re.compile(r"\.(NS|BO|NSE|BSE)$")
+NAME_SUFFIXES = {"LTD", "LIMITED"}
+
+def normalize_query(text):
+    """Upper-case a query and strip exchange prefixes/suffixes like NSE: or .NS"""
+    text = EXCHANGE_PREFIX.sub("", text.strip().upper())
+    return EXCHANGE_SUFFIX.sub("", text)
+
+def normalize_name(text):
+    """Reduce a company name to comparable words: no punctuation or Ltd/Limited"""
+    words = re.sub(r"[^A-Z0-9 ]", " ", text.upper().replace("&", " AND ")).split()
+    return " ".join(word for word in words if word not in NAME_SUFFIXES)
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class Symbol:
+    """One listed company: canonical symbol, display name, exchange and sector"""
+
+    def __init__(self, symbol, name, exchange, aliases=(), sector=None):
+        self.symbol = symbol
+        self.name = name
+        self.exchange = exchange
+        self.aliases = tuple(aliases)
+        self.sector = sector
+
+    def __repr__(self):
+        return f"Symbol({self.symbol!r}, {self.name!r}, {self.exchange!r})"
+
+class SymbolMaster:
+    """In-memory index over the symbol master for autocomplete and resolution.
+
+    Symbols, names and aliases are held in sorted key lists so prefix
+    lookups are a bisect, and a trigram index narrows fuzzy matching to a
+    handful of candidates; both stay well under a millisecond for the full
+    NSE list.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self._by_symbol = {}
+        self._by_name = {}
+        self._trigrams = {}
+
+        for entry in self.symbols:
+            self._by_symbol.setdefault(entry.symbol, entry)
+            for key in {normalize_name(entry.name), *(normalize_name(alias) for alias in entry.aliases)}:
+                if not key:
+                    continue
+                self._by_name.setdefault(key, entry)
+                for gram in trigrams(key):
+                    self._trigrams.setdefault(gram, set()).add(key)
+
+        self._symbol_keys = sorted(self._by_symbol)
+        self._name_keys = sorted(self._by_name)
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_SYMBOLS_PATH):
+        """Load a symbol master CSV.
+
+        Accepts this repo's symbols.csv (symbol,name,exchange,sector,aliases)
+        as well as NSE's EQUITY_L.csv download (SYMBOL,NAME OF COMPANY,...),
+        which has no sectors.
+        """
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = [{key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+                    for row in csv.DictReader(f)]
+
+        symbols = []
+        for row in rows:
+            symbol = row.get("symbol", "").upper()
+            if not symbol:
+                continue
+            symbols.append(Symbol(
+                symbol,
+                row.get("name") or row.get("name of company") or symbol,
+                row.get("exchange") or "NSE",
+                [alias for alias in row.get("aliases", "").split("|") if alias],
+                row.get("sector") or None
+            ))
+        return cls(symbols)
+
+    def lookup(self, symbol):
+        """Return the Symbol for an exact canonical symbol, or None"""
+        return self._by_symbol.get(normalize_query(symbol))
+
+    def peers(self, symbol):
+        """Other symbols in the same sector as `symbol`"""
+        entry = self.lookup(symbol)
+        if entry is None or not entry.sector:
+            return []
+        return [other for other in self.symbols if other.sector == entry.sector and other is not entry]
+
+    def _prefixed(self, keys, prefix):
+        start = bisect_left(keys, prefix)
+        for key in keys[start:]:
+            if not key.startswith(prefix):
+                break
+            yield key
+
+    def _fuzzy(self, name):
+        """Name keys ranked by similarity to `name`, as (ratio, key)"""
+        counts = {}
+        for gram in trigrams(name):
+            for key in self._trigrams.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[:FUZZY_CANDIDATES]
+        scored = [(difflib.SequenceMatcher(None, name, key).ratio(), key) for key in candidates]
+        return sorted(scored, reverse=True)
+
+    def suggest(self, query, limit=8):
+        """Autocomplete: exact, then prefix, then fuzzy matches for a query"""
+        symbol = normalize_query(query)
+        name = normalize_name(symbol)
+        if not symbol:
+            return []
+
+        matches = []
+        def add(entry):
+            if entry not in matches:
+                matches.append(entry)
+
+        if symbol in self._by_symbol:
+            add(self._by_symbol[symbol])
+        if name in self._by_name:
+            add(self._by_name[name])
+        for key in self._prefixed(self._symbol_keys, symbol):
+            add(self._by_symbol[key])
+        if name:
+            for key in self._prefixed(self._name_keys, name):
+                add(self._by_name[key])
+            for ratio, key in self._fuzzy(name):
+                if ratio >= FUZZY_SUGGEST_RATIO:
+                    add(self._by_name[key])
+        return matches[:limit]
+
+    def resolve(self, query):
+        """Return the Symbol a query unambiguously names, or None.
+
+        Exact symbols, names and aliases win; otherwise whole leading words
+        of only one company's name (at least PREFIX_RESOLVE_WORDS of them,
+        e.g. "Tata Consultancy"), or a close enough fuzzy match on the name.
+        Shorter prefixes such as "V" or "SUN" are left to suggest().
+        """
+        symbol = normalize_query(query)
+        name = normalize_name(symbol)
+        if symbol in self._by_symbol:
+            return self._by_symbol[symbol]
+        if not name:
+            return None
+        if name in self._by_name:
+            return self._by_name[name]
+
+        if len(name.split()) >= PREFIX_RESOLVE_WORDS:
+            prefixed = {self._by_name[key] for key in self._prefixed(self._name_keys, name + " ")}
+            if len(prefixed) == 1:
+                return prefixed.pop()
+
+        ranked = self._fuzzy(name)
+        if ranked and ranked[0][0] >= FUZZY_RESOLVE_RATIO:
+            return self._by_name[ranked[0][1]]
+        return None
+
+@lru_cache(maxsize=None)
+def load_symbol_master(path=DEFAULT_SYMBOLS_PATH):
+    """Load and index the symbol master once per process; empty if the file is missing"""
+    if not os.path.exists(path):
+        return SymbolMaster([])
+    return SymbolMaster.from_csv(path)
+
+def resolve_ticker(query, master=None):
+    """Canonical symbol for user input, falling back to the normalized input.
+
+    Unknown tickers (e.g. international ones) pass through upper-cased, so
+    "TCS", "tcs.ns" and "Tata Consultancy" all share one cache key.
+    """
+    match = (master or load_symbol_master()).resolve(query)
+    return match.symbol if match else normalize_query(query)
+
+def sector_for(ticker, master=None):
+    """Sector of a known symbol, or None for unknown tickers"""
+    entry = (master or load_symbol_master()).lookup(ticker)
+    return entry.sector if entry else None
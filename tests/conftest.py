@@ -0,0 +1,56 @@
+"""Shared fixtures: a local mock Perplexity server and a client pointed at it"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+from metrics import metrics  # noqa: E402
+from mock_perplexity import MockConfig, MockPerplexityServer  # noqa: E402
+from rate_limit import RateLimiter  # noqa: E402
+
+DATE = "October 17, 2026"
+
+class RecordingLimiter(RateLimiter):
+    """RateLimiter that counts reservations, so tests can check every one is settled and released"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.acquired = 0
+        self.released = 0
+        self.settled = 0
+
+    def acquire(self, estimated_tokens=0):
+        super().acquire(estimated_tokens)
+        self.acquired += 1
+
+    def release(self):
+        self.released += 1
+        super().release()
+
+    def settle(self, estimated_tokens, actual_tokens):
+        self.settled += 1
+        super().settle(estimated_tokens, actual_tokens)
+
+@pytest.fixture
+def mock_config():
+    return MockConfig(latency_median=0.2, latency_sigma=0, response_chars=2000)
+
+@pytest.fixture
+def server(mock_config):
+    with MockPerplexityServer(mock_config) as server:
+        yield server
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = RecordingLimiter(tokens_per_minute=1_000_000, max_concurrent=8)
+    monkeypatch.setattr(engine, "request_limiter", limiter)
+    return limiter
+
+@pytest.fixture
+def client(server, limiter, monkeypatch):
+    monkeypatch.setenv("PPLX_API_KEY", "mock")
+    monkeypatch.setattr(metrics, "log_path", None)
+    return engine.init_perplexity_client(base_url=server.base_url)
@@ -0,0 +1,59 @@
+"""Recording calls against the mock server and replaying them on a later date"""
+import pytest
+
+from cassettes import CassetteClient, CassetteMiss, request_key
+from conftest import DATE
+from engine import is_failure, query_section
+
+LATER = "November 3, 2026"
+
+def test_request_key_ignores_dates_and_stream_flag():
+    messages = [{"role": "user", "content": f"Analyze TCS as of {DATE}"}]
+    later = [{"role": "user", "content": f"Analyze TCS as of {LATER}"}]
+
+    assert request_key("sonar", messages) == request_key("sonar", later, stream=True, timeout=30)
+    assert request_key("sonar", messages) != request_key("sonar-pro", messages)
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_recorded_dossier_section_replays_on_another_day(client, server, tmp_path, stream):
+    directory = str(tmp_path / "cassettes")
+    recorder = CassetteClient(client, "record", directory)
+    streamed = []
+    on_token = streamed.append if stream else None
+
+    recorded = query_section(recorder, "news_competition", "TCS", DATE, on_token=on_token)
+    assert not is_failure(recorded)
+    assert recorder.stats()["recorded"] == 1
+    requests = server.state.requests
+
+    player = CassetteClient(None, "replay", directory)
+    replayed_tokens = []
+    replayed = query_section(player, "news_competition", "TCS", LATER,
+                             on_token=replayed_tokens.append if stream else None)
+
+    assert replayed == recorded
+    assert server.state.requests == requests
+    assert player.stats() == {"mode": "replay", "recorded": 0, "replayed": 1, "missed": 0, "cassettes": 1}
+    if stream:
+        assert "".join(replayed_tokens) == "".join(streamed) == recorded
+
+def test_non_streamed_recording_replays_as_a_stream(client, tmp_path):
+    directory = str(tmp_path / "cassettes")
+    recorded = query_section(CassetteClient(client, "record", directory), "news_competition", "INFY", DATE)
+
+    tokens = []
+    replayed = query_section(CassetteClient(None, "replay", directory), "news_competition", "INFY", LATER,
+                             on_token=tokens.append)
+    assert replayed == recorded
+    assert len(tokens) > 1
+
+def test_unrecorded_request_is_a_miss(tmp_path):
+    player = CassetteClient(None, "replay", str(tmp_path / "cassettes"))
+
+    with pytest.raises(CassetteMiss):
+        player.chat.completions.create(model="sonar", messages=[{"role": "user", "content": "new"}])
+    assert player.stats()["missed"] == 1
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        CassetteClient(None, "rewind", str(tmp_path))
@@ -0,0 +1,66 @@
+"""Delta refresh: change blocks merged on top of the previous run's sections"""
+import engine
+from conftest import DATE
+from engine import (
+    DELTA_HEADING,
+    DELTA_MAX_TOKENS,
+    DELTA_SEPARATOR,
+    merge_delta,
+    query_section,
+    run_sections_concurrently,
+    strip_delta,
+)
+
+PREVIOUS_DATE = "October 10, 2026"
+PREVIOUS = "## Ratios\nROCE: 42%\nP/E: 28x"
+
+def test_merge_puts_the_changes_above_the_previous_text():
+    merged = merge_delta(PREVIOUS, "- updated: P/E now 30x", PREVIOUS_DATE, DATE)
+
+    heading, rest = merged.split("\n", 1)
+    assert heading == f"{DELTA_HEADING} {PREVIOUS_DATE} (as of {DATE})"
+    assert rest == f"- updated: P/E now 30x{DELTA_SEPARATOR}{PREVIOUS}"
+    assert strip_delta(merged) == PREVIOUS
+
+def test_no_material_change_reply_is_normalized():
+    merged = merge_delta(PREVIOUS, "  no material change.\n", PREVIOUS_DATE, DATE)
+    assert merged.split("\n")[1] == "No material change."
+
+def test_repeated_deltas_do_not_nest():
+    once = merge_delta(PREVIOUS, "- first change", PREVIOUS_DATE, "October 14, 2026")
+    twice = merge_delta(once, "- second change", "October 14, 2026", DATE)
+
+    assert twice.count(DELTA_HEADING) == 1
+    assert "first change" not in twice
+    assert strip_delta(twice) == PREVIOUS
+
+def test_strip_delta_leaves_plain_sections_alone():
+    assert strip_delta(PREVIOUS) == PREVIOUS
+
+def test_delta_query_merges_into_the_previous_text(client, server, monkeypatch):
+    sent = []
+    original = engine.query_perplexity
+
+    def spy(client, prompt, model, max_tokens, *args, **kwargs):
+        sent.append((prompt, max_tokens))
+        return original(client, prompt, model, max_tokens, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "query_perplexity", spy)
+    content = query_section(client, "ratio_analysis", "TCS", DATE, previous=(PREVIOUS, PREVIOUS_DATE))
+
+    assert content.startswith(f"{DELTA_HEADING} {PREVIOUS_DATE} (as of {DATE})")
+    assert content.endswith(DELTA_SEPARATOR + PREVIOUS)
+    assert server.state.requests == 1
+    [(prompt, max_tokens)] = sent
+    assert max_tokens <= DELTA_MAX_TOKENS
+    assert f"Report only material changes since {PREVIOUS_DATE}" in prompt
+    assert "P/E: 28x" in prompt
+
+def test_run_refreshes_only_the_sections_with_a_previous_version(client, server):
+    sections = [("Ratio Analysis", "ratio_analysis"), ("News & Competition", "news_competition")]
+    results = run_sections_concurrently(client, "TCS", DATE, sections, combine_financials=False,
+                                        previous={"ratio_analysis": (PREVIOUS, PREVIOUS_DATE)})
+
+    assert results["ratio_analysis"].startswith(DELTA_HEADING)
+    assert strip_delta(results["ratio_analysis"]) == PREVIOUS
+    assert not results["news_competition"].startswith(DELTA_HEADING)
@@ -0,0 +1,77 @@
+"""BM25 search and per-section excerpts over uploaded filings"""
+import io
+
+import pytest
+
+from documents import DocumentIndex, chunk_page, guess_kind, tokenize
+
+pptx = pytest.importorskip("pptx")
+
+def deck(*slides):
+    """A PPTX file object with one text box per slide"""
+    presentation = pptx.Presentation()
+    for text in slides:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        slide.shapes.add_textbox(0, 0, 100, 100).text_frame.text = text
+    buffer = io.BytesIO()
+    presentation.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+GUIDANCE = "Management raised revenue guidance and expects EBITDA margin expansion next year as capacity utilization improves"
+POLICY = "The auditor noted an accounting policy change and contingent liabilities from related party transactions"
+FILLER = "The company thanks its employees customers and shareholders for their continued support"
+
+@pytest.fixture
+def index(tmp_path):
+    return DocumentIndex(str(tmp_path / "documents.sqlite3"), workers=1)
+
+def test_search_ranks_the_matching_page_first(index):
+    index.add("TCS", deck(FILLER, GUIDANCE, POLICY), "q2-call.pptx", kind="transcript")
+
+    hits = index.search("TCS", "guidance margin expansion")
+    assert hits[0]["page"] == 2
+    assert hits[0]["name"] == "q2-call.pptx"
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+    assert index.search("TCS", "the and of") == []
+    assert index.search("INFY", "guidance") == []
+
+def test_excerpts_prefer_the_section_document_kinds(index):
+    index.add("TCS", deck(GUIDANCE), "call.pptx", kind="transcript")
+    index.add("TCS", deck(POLICY, GUIDANCE + " annual report copy"), "annual.pptx", kind="annual_report")
+
+    calls = index.excerpts("TCS", "conference_calls")
+    assert calls and {hit["kind"] for hit in calls} == {"transcript"}
+
+    report = index.excerpts("TCS", "annual_report")
+    assert {hit["kind"] for hit in report} == {"annual_report"}
+    assert report[0]["page"] == 1
+
+    assert index.excerpts("TCS", "news_competition") == []
+
+def test_excerpts_fall_back_to_any_kind_and_respect_the_budget(index):
+    index.add("TCS", deck(GUIDANCE, GUIDANCE + " again"), "deck.pptx", kind="presentation")
+
+    assert index.excerpts("TCS", "conference_calls")
+    assert len(index.excerpts("TCS", "conference_calls", max_chars=len(GUIDANCE) + 10)) == 1
+    assert index.excerpts("TCS", "conference_calls", max_chars=10) == []
+
+def test_identical_upload_is_reused_and_removed_with_its_last_ticker(index):
+    first, reused = index.add("TCS", deck(GUIDANCE), "call.pptx")
+    second, reused_again = index.add("INFY", deck(GUIDANCE), "copy.pptx")
+
+    assert first == second and not reused and reused_again
+    assert index.stats()["documents"] == 1
+    index.remove("TCS", first)
+    assert index.search("INFY", "guidance")
+    index.remove("INFY", first)
+    assert index.stats() == {"documents": 0, "chunks": 0, "terms": 0}
+
+def test_helpers():
+    assert tokenize("The EBITDA margin of 21.5% and M&A") == ["ebitda", "margin", "21.5", "m&a"]
+    assert guess_kind("Q2 Earnings Call.pdf") == "transcript"
+    assert guess_kind("results.pptx") == "presentation"
+    assert guess_kind("AR2026.pdf") == "annual_report"
+    chunks = chunk_page(" ".join(str(n) for n in range(300)), words=100, overlap=20)
+    assert [chunk.split()[0] for chunk in chunks] == ["0", "80", "160", "240"]
+    assert chunks[-1].split()[-1] == "299"
@@ -0,0 +1,118 @@
+"""Hedged requests, the analysis deadline and the dependency scheduler"""
+import threading
+import time
+
+import pytest
+
+import engine
+import mock_perplexity
+from conftest import DATE
+from engine import (
+    FINANCIAL_SECTIONS,
+    SECTION_DEPENDENCIES,
+    SECTIONS,
+    QueryFailure,
+    is_failure,
+    is_pending,
+    query_perplexity,
+    query_perplexity_stream,
+    run_sections_concurrently,
+)
+
+@pytest.fixture
+def hedging(monkeypatch, mock_config):
+    """Hedge after 0.2 s; the first request takes 1.5 s and the duplicate 0.05 s"""
+    monkeypatch.setattr(engine, "HEDGE_REQUESTS", True)
+    monkeypatch.setattr(engine, "HEDGE_MIN_SECONDS", 0.2)
+    latencies = iter([1.5, 0.05])
+    mock_config.sample_latency = lambda: next(latencies)
+
+    def hedge_key(name):
+        key = ("test", name, time.monotonic())
+        for _ in range(engine.HEDGE_MIN_SAMPLES):
+            engine.attempt_latency.add(key, 0.01)
+        return key
+
+    return hedge_key
+
+def test_hedged_call_returns_the_winner_and_charges_the_loser(client, server, limiter, hedging):
+    stats = {}
+    key = hedging("response")
+    started = time.monotonic()
+
+    content = query_perplexity(client, "Summarise TCS", stats=stats, hedge_key=key)
+
+    assert time.monotonic() - started < 1.0
+    assert stats["hedged"] and content.startswith("## Summary")
+    # The slow first request keeps its limiter slot until it really ends
+    assert limiter.acquired == 2 and limiter.released == 1
+    time.sleep(1.6)
+    assert server.state.requests == 2
+    assert limiter.released == limiter.settled == limiter.acquired
+    # Latency is timed from the first attempt's start, not the duplicate's
+    assert engine.attempt_latency.percentile(key, 100) >= 0.2
+
+def test_hedged_stream_closes_the_losing_stream(client, server, limiter, hedging):
+    stats = {}
+    tokens = []
+
+    content = query_perplexity_stream(client, "Summarise TCS", tokens.append, stats=stats,
+                                      hedge_key=hedging("first_token"))
+
+    assert stats["hedged"] and content == "".join(tokens)
+    time.sleep(1.6)
+    assert server.state.requests == 2
+    assert server.state.cancelled == 1
+    assert limiter.released == limiter.acquired
+    assert limiter.settled == limiter.acquired
+
+def test_sections_past_the_deadline_come_back_pending_then_land(client, mock_config):
+    mock_config.latency_median = 0.3
+    landed = {}
+    finished = threading.Event()
+
+    def on_section_done(key, content, done, total):
+        landed[key] = content
+
+    results = run_sections_concurrently(client, "TCS", DATE, on_section_done=on_section_done, deadline=0.5,
+                                        on_late_finished=finished.set)
+
+    pending = [key for key, content in results.items() if is_pending(content)]
+    assert pending and len(pending) < len(SECTIONS)
+    assert finished.wait(30)
+    assert set(landed) == {key for _, key in SECTIONS}
+    assert not any(is_failure(landed[key]) for key in pending)
+
+def test_unparseable_combined_financials_fall_back_to_section_prompts(client, server, monkeypatch):
+    def fake_content(body, chars):
+        # Plain markdown even when a JSON schema was asked for
+        return mock_perplexity.fake_markdown(chars)
+
+    monkeypatch.setattr(mock_perplexity, "fake_content", fake_content)
+    order = []
+
+    results = run_sections_concurrently(client, "TCS", DATE, combine_financials=True,
+                                        on_section_done=lambda key, *_: order.append(key))
+
+    assert not any(is_failure(content) for content in results.values())
+    assert all(results[key].startswith("## Summary") for key in FINANCIAL_SECTIONS)
+    # One combined call, then every section on its own prompt
+    assert server.state.requests == len(SECTIONS) + 1
+    for key, deps in SECTION_DEPENDENCIES.items():
+        assert all(order.index(dep) < order.index(key) for dep in deps)
+
+def test_failed_combined_financials_fall_back_to_section_prompts(client, server, monkeypatch):
+    query_perplexity = engine.query_perplexity
+
+    def fail_combined(client, prompt, *args, response_format=None, **kwargs):
+        if response_format:
+            return QueryFailure("mock 500", status_code=500)
+        return query_perplexity(client, prompt, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "query_perplexity", fail_combined)
+
+    results = run_sections_concurrently(client, "TCS", DATE, combine_financials=True)
+
+    assert not any(is_failure(content) for content in results.values())
+    # The combined call never reached the server; every section ran on its own prompt
+    assert server.state.requests == len(SECTIONS)
@@ -0,0 +1,72 @@
+"""Which sections a pre-warm run would refresh, and what it costs"""
+from datetime import datetime
+
+import pytest
+
+import response_cache
+from engine import FINANCIAL_SECTIONS, SECTIONS, route_for, sector_subject
+from prewarm import estimate_calls, local_midnight, stale_sections, upstream_calls
+from response_cache import HOUR, ResponseCache
+from symbols import sector_for
+
+ALL = [key for _, key in SECTIONS]
+# 5am local time, inside the default pre-warm window
+NOW = datetime(2026, 10, 17, 5, 0).timestamp()
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache.sqlite3"))
+
+def warm(cache, monkeypatch, ticker, at, keys=ALL):
+    """Cache every section in `keys` as created at `at`"""
+    monkeypatch.setattr(response_cache.time, "time", lambda: at)
+    sector = sector_for(ticker)
+    for key in keys:
+        subject = sector_subject(sector) if sector and key == "sectoral_analysis" else ticker
+        cache.set(key, subject, route_for(key)["model"], f"prompt for {key}", "cached")
+
+def test_everything_is_stale_in_an_empty_cache(cache):
+    assert stale_sections(cache, "TCS", now=NOW) == ALL
+
+def test_fresh_cache_needs_nothing(cache, monkeypatch):
+    warm(cache, monkeypatch, "TCS", NOW - HOUR)
+    assert stale_sections(cache, "TCS", now=NOW, lead=0) == []
+
+def test_lead_time_expires_short_lived_sections_and_their_dependents(cache, monkeypatch):
+    warm(cache, monkeypatch, "TCS", NOW - 4 * HOUR)
+
+    # News (6h TTL) is fresh now but not three hours from now
+    assert stale_sections(cache, "TCS", now=NOW, lead=0) == []
+    assert stale_sections(cache, "TCS", now=NOW, lead=3 * HOUR) == [
+        "news_competition", "scenario_analysis", "final_recommendation"
+    ]
+
+def test_sector_study_from_yesterday_is_stale(cache, monkeypatch):
+    assert sector_for("TCS"), "TCS needs a sector in symbols.csv"
+    warm(cache, monkeypatch, "TCS", local_midnight(NOW) - HOUR)
+
+    stale = stale_sections(cache, "TCS", now=NOW, lead=0)
+    assert "sectoral_analysis" in stale
+    assert {"scenario_analysis", "final_recommendation"} <= set(stale)
+    assert "financial_pl" not in stale
+
+def test_sector_study_is_shared_by_peers(cache, monkeypatch):
+    assert sector_for("INFY") == sector_for("TCS")
+    warm(cache, monkeypatch, "TCS", NOW - HOUR)
+
+    assert stale_sections(cache, "INFY", now=NOW, lead=0) == [key for key in ALL if key != "sectoral_analysis"]
+
+def test_estimate_calls_combines_financials():
+    stale = ["news_competition"] + FINANCIAL_SECTIONS
+    assert estimate_calls(stale, combine_financials=True) == 2
+    assert estimate_calls(stale, combine_financials=False) == 1 + len(FINANCIAL_SECTIONS)
+    assert estimate_calls([], combine_financials=True) == 0
+
+def test_upstream_calls_count_attempts_of_cache_misses():
+    records = [
+        {"cache": "miss", "retries": 2, "hedged": True},
+        {"cache": "off", "retries": 0},
+        {"cache": "hit", "retries": 0},
+        {"cache": "coalesced", "retries": 0},
+    ]
+    assert upstream_calls(records) == 5
@@ -0,0 +1,35 @@
+"""Retry-After parsing and backoff delays"""
+import time
+from email.utils import formatdate
+
+import pytest
+
+from rate_limit import backoff_delay, parse_retry_after
+
+def test_retry_after_ms_takes_precedence():
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+
+def test_retry_after_in_seconds():
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({"retry-after": "-2"}) == 0.0
+
+def test_retry_after_as_http_date():
+    delay = parse_retry_after({"retry-after": formatdate(time.time() + 30, usegmt=True)})
+    assert 28 <= delay <= 30
+
+def test_missing_or_malformed_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    # A malformed millisecond header falls back to retry-after
+    assert parse_retry_after({"retry-after-ms": "soon", "retry-after": "2"}) == 2.0
+
+@pytest.mark.parametrize("attempt", range(8))
+def test_backoff_is_jittered_within_the_capped_exponential(attempt):
+    for _ in range(50):
+        assert 0 <= backoff_delay(attempt, base=1.0, cap=10.0) <= min(10.0, 2 ** attempt)
+
+def test_backoff_never_undercuts_retry_after():
+    for _ in range(50):
+        delay = backoff_delay(0, base=0.5, retry_after=4.0)
+        assert 4.0 <= delay <= 4.5
@@ -0,0 +1,89 @@
+"""Extraction of typed ratio and score records from dossier sections"""
+from engine import QueryFailure, merge_delta
+from ratio_store import canonical_metric, extract_records, parse_number
+
+RATIOS = """## Ratio Analysis
+
+| Ratio | FY2026 | Industry Average | Trend |
+|---|---|---|---|
+| **ROCE** | 42.1% | 28% | Improving |
+| Debt-to-Equity | 0.05x | 0.4 | Stable |
+| Current Ratio [3] | 2.6 | n/a | - |
+
+Key takeaways:
+- Interest Coverage: 85 times
+- Revenue growth: 9% (not a ratio, ignored)
+- ROCE: 41%
+"""
+
+VALUATION = """| Company | P/E | EV/EBITDA | Comment |
+|---|---|---|---|
+| TCS | 28.5x | 19.2 | Premium |
+| INFY | 24.0x | 16.1 | Discount |
+"""
+
+INTEGRITY = """| KPI | Score/10 |
+|---|---|
+| Guidance Accuracy | 8/10 |
+| Delivery vs Promise | 7 / 10 |
+| Transparency & Disclosure | 9/10 |
+
+**Overall Integrity Score: 8.5**
+"""
+
+def by_key(records):
+    return {(r["section"], r["entity"], r["metric"], r["field"]): (r["value"], r["unit"]) for r in records}
+
+def test_ratio_tables_and_inline_ratios():
+    records = by_key(extract_records("TCS", {"ratio_analysis": RATIOS}))
+
+    assert records[("ratio_analysis", "TCS", "ROCE", "fy2026")] == (42.1, "%")
+    assert records[("ratio_analysis", "TCS", "ROCE", "industry_average")] == (28.0, "%")
+    assert records[("ratio_analysis", "TCS", "Debt/Equity", "fy2026")] == (0.05, "x")
+    assert records[("ratio_analysis", "TCS", "Current Ratio", "fy2026")] == (2.6, "")
+    assert records[("ratio_analysis", "TCS", "Interest Coverage", "current")] == (85.0, "x")
+    # Descriptive columns, non-numeric cells and unknown inline labels are skipped
+    assert not any(field == "trend" for _, _, _, field in records)
+    assert ("ratio_analysis", "TCS", "Current Ratio", "industry_average") not in records
+    assert not any("growth" in metric.lower() for _, _, metric, _ in records)
+    # Inline values are stored as "current", next to the table columns
+    assert records[("ratio_analysis", "TCS", "ROCE", "current")] == (41.0, "%")
+    assert len(records) == 7
+
+def test_peer_tables_keep_each_row_entity():
+    records = by_key(extract_records("TCS", {"valuation_analysis": VALUATION}))
+
+    assert records == {
+        ("valuation_analysis", "TCS", "P/E", "current"): (28.5, "x"),
+        ("valuation_analysis", "TCS", "EV/EBITDA", "current"): (19.2, ""),
+        ("valuation_analysis", "INFY", "P/E", "current"): (24.0, "x"),
+        ("valuation_analysis", "INFY", "EV/EBITDA", "current"): (16.1, ""),
+    }
+
+def test_integrity_scores_out_of_ten():
+    records = by_key(extract_records("TCS", {"integrity_matrix": INTEGRITY}))
+
+    assert records == {
+        ("integrity_matrix", "TCS", "Guidance Accuracy", "score"): (8.0, "/10"),
+        ("integrity_matrix", "TCS", "Delivery vs Promise", "score"): (7.0, "/10"),
+        ("integrity_matrix", "TCS", "Transparency & Disclosure", "score"): (9.0, "/10"),
+        ("integrity_matrix", "TCS", "Overall Integrity", "score"): (8.5, "/10"),
+    }
+
+def test_failures_and_other_sections_are_ignored():
+    results = {"ratio_analysis": QueryFailure("timeout"), "news_competition": RATIOS}
+    assert extract_records("TCS", results) == []
+
+def test_delta_sections_contribute_only_their_changes():
+    merged = merge_delta(RATIOS, "- P/E: 30x (updated)", "October 10, 2026", "October 17, 2026")
+    records = extract_records("TCS", {"ratio_analysis": merged})
+
+    assert [(r["metric"], r["value"]) for r in records] == [("P/E", 30.0)]
+
+def test_helpers():
+    assert canonical_metric("Return on Capital Employed (ROCE)") == "ROCE"
+    assert canonical_metric("Price-to-Book") == "P/B"
+    assert canonical_metric("Revenue") is None
+    assert parse_number("₹1,234.5 (FY26)") == (1234.5, "")
+    assert parse_number("12 times") == (12.0, "x")
+    assert parse_number("n/a") is None
@@ -0,0 +1,63 @@
+"""TTL expiry and LRU eviction of the SQLite response cache"""
+import pytest
+
+import response_cache
+from response_cache import ResponseCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+def test_entry_expires_after_its_section_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttls={"news_competition": 60})
+    cache.set("news_competition", "tcs", "sonar", "prompt", "fresh news")
+
+    clock.now += 59
+    assert cache.get("news_competition", "TCS", "sonar", "prompt") == "fresh news"
+
+    clock.now += 2
+    assert cache.get("news_competition", "TCS", "sonar", "prompt") is None
+    assert cache.stats()["expired"] == 1
+    assert cache.stats()["entries"] == 0
+
+def test_sections_without_a_ttl_use_the_default(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttls={})
+    cache.set("annual_report", "TCS", "sonar", "prompt", "report")
+
+    clock.now += response_cache.DEFAULT_TTL - 1
+    assert cache.get("annual_report", "TCS", "sonar", "prompt") == "report"
+    clock.now += 2
+    assert cache.get("annual_report", "TCS", "sonar", "prompt") is None
+
+def test_analysis_date_is_ignored_in_the_key(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("ratio_analysis", "TCS", "sonar", "Ratios as of May 1", "ratios", date="May 1")
+
+    assert cache.get("ratio_analysis", "TCS", "sonar", "Ratios as of May 2", date="May 2") == "ratios"
+
+def test_least_recently_read_entry_is_evicted_first(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=250)
+    for name in ("a", "b"):
+        cache.set("ratio_analysis", name, "sonar", "prompt", "x" * 100)
+        clock.now += 1
+
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("ratio_analysis", "a", "sonar", "prompt") is not None
+    clock.now += 1
+    cache.set("ratio_analysis", "c", "sonar", "prompt", "x" * 100)
+
+    assert cache.get("ratio_analysis", "b", "sonar", "prompt") is None
+    assert cache.get("ratio_analysis", "a", "sonar", "prompt") is not None
+    assert cache.get("ratio_analysis", "c", "sonar", "prompt") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 200
@@ -0,0 +1,110 @@
+"""Memory cap, disk spill and spill cap of the shared result store"""
+import os
+import random
+
+import pytest
+
+from result_store import ResultStore
+
+def results(seed, size=20_000):
+    """A section of random text, so every run compresses to about the same size"""
+    rng = random.Random(seed)
+    return {"news_competition": "".join(rng.choice("abcdefghij0123456789") for _ in range(size))}
+
+def stored_size(spill_path):
+    """Compressed bytes of one results() entry"""
+    store = ResultStore(max_bytes=1_000_000, spill_path=spill_path)
+    store.put("SIZE", 0, results(0))
+    return store.stats()["bytes"]
+
+def spill_files(store):
+    return sorted(name for name in os.listdir(store.spill_path) if not name.startswith("."))
+
+@pytest.fixture
+def spill_path(tmp_path):
+    return str(tmp_path / "results")
+
+@pytest.fixture
+def one_run(spill_path):
+    """A memory cap that fits one results() entry but not two"""
+    return int(stored_size(spill_path) * 1.5)
+
+def test_round_trip_in_memory(spill_path):
+    store = ResultStore(max_bytes=1_000_000, spill_path=spill_path)
+    ref = store.put("TCS", 1, results(1))
+
+    assert ref == ("TCS", 1)
+    assert store.get(*ref) == results(1)
+    assert store.get("TCS", 2) is None
+    stats = store.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["compression_ratio"] > 1
+
+def test_least_recently_used_run_spills_and_comes_back(spill_path, one_run):
+    store = ResultStore(max_bytes=one_run, spill_path=spill_path)
+    store.put("TCS", 1, results(1))
+    store.put("INFY", 1, results(2))
+
+    assert store.stats()["evictions"] == 1
+    assert spill_files(store) == ["TCS-1.bin"]
+
+    # Read back from disk, promoted to memory, and INFY spills in turn
+    assert store.get("TCS", 1) == results(1)
+    stats = store.stats()
+    assert stats["disk_reads"] == 1
+    assert spill_files(store) == ["INFY-1.bin"]
+    assert store.get("INFY", 1) == results(2)
+
+def test_newest_entry_stays_in_memory_even_over_the_cap(spill_path):
+    store = ResultStore(max_bytes=100, spill_path=spill_path)
+    store.put("TCS", 1, results(1))
+
+    assert store.stats()["entries"] == 1
+    assert spill_files(store) == []
+
+def test_spill_directory_is_capped_oldest_first(spill_path, one_run):
+    store = ResultStore(max_bytes=one_run, spill_path=spill_path, max_spill_bytes=int(one_run * 1.7))
+    for run_id in range(4):
+        store.put("TCS", run_id, results(run_id))
+
+    # Runs 0-2 were spilled; only the two newest fit under the disk cap
+    assert spill_files(store) == ["TCS-1.bin", "TCS-2.bin"]
+    stats = store.stats()
+    assert stats["spill_evictions"] == 1
+    assert stats["spilled_bytes"] <= store.max_spill_bytes
+    assert store.get("TCS", 0) is None
+    assert store.get("TCS", 1) == results(1)
+
+def test_unreadable_spill_is_a_miss(spill_path, one_run):
+    store = ResultStore(max_bytes=one_run, spill_path=spill_path)
+    store.put("TCS", 1, results(1))
+    store.put("INFY", 1, results(2))
+    with open(os.path.join(spill_path, "TCS-1.bin"), "wb") as f:
+        f.write(b"truncated")
+
+    assert store.get("TCS", 1) is None
+    assert spill_files(store) == []
+    assert store.stats()["spilled_entries"] == 0
+
+def test_discard_and_put_replace_spilled_copies(spill_path, one_run):
+    store = ResultStore(max_bytes=one_run, spill_path=spill_path)
+    store.put("TCS", 1, results(1))
+    store.put("INFY", 1, results(2))
+    store.put("TCS", 1, results(3))
+
+    assert store.get("TCS", 1) == results(3)
+    store.discard("TCS", 1)
+    store.discard("INFY", 1)
+    assert store.get("TCS", 1) is None and store.get("INFY", 1) is None
+    assert spill_files(store) == []
+
+def test_orphaned_spill_files_are_removed_on_open(spill_path, one_run):
+    store = ResultStore(max_bytes=one_run, spill_path=spill_path)
+    store.put("TCS", 1, results(1))
+    store.put("INFY", 1, results(2))
+    with open(os.path.join(spill_path, "TCS-2.bin.123.tmp"), "wb") as f:
+        f.write(b"partial")
+
+    reopened = ResultStore(max_bytes=one_run, spill_path=spill_path)
+    assert spill_files(reopened) == []
+    assert reopened.get("TCS", 1) is None
@@ -0,0 +1,47 @@
+"""Coalescing of identical in-flight section queries"""
+import threading
+import time
+
+from conftest import DATE
+from engine import inflight_queries, query_section
+
+def run_in_threads(count, target):
+    results = [None] * count
+
+    def run(index):
+        results[index] = target()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_identical_queries_share_one_upstream_call(client, server):
+    before = inflight_queries.stats()["coalesced"]
+
+    results = run_in_threads(6, lambda: query_section(client, "news_competition", "TCS", DATE))
+
+    assert server.state.requests == 1
+    assert len(set(results)) == 1 and results[0].startswith("## Summary")
+    assert inflight_queries.stats()["coalesced"] - before == 5
+
+def test_caller_joining_mid_stream_receives_the_whole_text(client, server, mock_config):
+    mock_config.latency_median = 0.6
+    streamed = {"leader": [], "joiner": []}
+    results = {}
+
+    def call(name):
+        results[name] = query_section(client, "news_competition", "INFY", DATE, on_token=streamed[name].append)
+
+    leader = threading.Thread(target=call, args=("leader",))
+    leader.start()
+    # Well into the stream: the first token arrives after 30% of the latency
+    time.sleep(0.4)
+    call("joiner")
+    leader.join()
+
+    assert server.state.requests == 1
+    assert results["joiner"] == results["leader"]
+    assert "".join(streamed["joiner"]) == "".join(streamed["leader"]) == results["leader"]
@@ -0,0 +1,54 @@
+"""Ticker resolution and autocomplete against the symbol master"""
+import pytest
+
+from symbols import Symbol, SymbolMaster, resolve_ticker
+
+@pytest.fixture
+def master():
+    return SymbolMaster([
+        Symbol("TCS", "Tata Consultancy Services Ltd", "NSE", sector="IT Services"),
+        Symbol("TATAMOTORS", "Tata Motors Ltd", "NSE", sector="Automobiles"),
+        Symbol("INFY", "Infosys Ltd", "NSE", sector="IT Services"),
+        Symbol("SBIN", "State Bank of India", "NSE", ["SBI"], sector="Banks"),
+        Symbol("HDFCBANK", "HDFC Bank Ltd", "NSE", sector="Banks"),
+        Symbol("SUNPHARMA", "Sun Pharmaceutical Industries Ltd", "NSE", ["Sun Pharma"], sector="Pharmaceuticals"),
+        Symbol("SUNTV", "Sun TV Network Ltd", "NSE", sector="Media"),
+        Symbol("M&M", "Mahindra & Mahindra Ltd", "NSE", sector="Automobiles"),
+    ])
+
+@pytest.mark.parametrize("query, symbol", [
+    ("TCS", "TCS"),
+    ("tcs.ns", "TCS"),
+    ("NSE: infy", "INFY"),
+    ("SBI", "SBIN"),
+    ("State Bank of India Limited", "SBIN"),
+    ("Mahindra and Mahindra", "M&M"),
+    ("Tata Consultancy", "TCS"),
+    ("Sun Pharma", "SUNPHARMA"),
+    ("Infosis", "INFY"),
+])
+def test_resolve_finds_the_named_company(master, query, symbol):
+    assert master.resolve(query).symbol == symbol
+
+@pytest.mark.parametrize("query", ["V", "AX", "BANK", "SUN", "Tata", "", "   "])
+def test_short_or_ambiguous_queries_do_not_resolve(master, query):
+    assert master.resolve(query) is None
+
+def test_unknown_tickers_pass_through_normalized(master):
+    assert resolve_ticker("v", master) == "V"
+    assert resolve_ticker("aapl.ns", master) == "AAPL"
+    assert resolve_ticker("Tata Consultancy", master) == "TCS"
+
+def test_suggest_lists_exact_then_prefix_matches(master):
+    assert [entry.symbol for entry in master.suggest("SUN")][:2] == ["SUNPHARMA", "SUNTV"]
+    assert master.suggest("TCS")[0].symbol == "TCS"
+    assert {entry.symbol for entry in master.suggest("Tata")} >= {"TCS", "TATAMOTORS"}
+    assert master.suggest("") == []
+
+def test_suggest_includes_fuzzy_matches_and_respects_limit(master):
+    assert "INFY" in [entry.symbol for entry in master.suggest("Infosis")]
+    assert len(master.suggest("a", limit=2)) <= 2
+
+def test_peers_share_a_sector(master):
+    assert [entry.symbol for entry in master.peers("SBIN")] == ["HDFCBANK"]
+    assert master.peers("UNKNOWN") == []